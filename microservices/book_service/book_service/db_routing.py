@@ -0,0 +1,162 @@
+"""Read replica routing
+
+``ReplicaRouter`` sends reads to the database chosen for the current request
+and everything else to ``default`` (the primary). Views opt in with
+``ReplicaReadsMixin``: its ``replica_actions`` run with one replica picked by
+the configured strategy, so all reads of a request see the same replica.
+
+Read-your-writes: a successful write answers with a cookie that keeps the
+client on the primary for ``PIN_SECONDS`` (longer than the expected
+replication lag), and a client can always ask for the primary with the
+``X-Read-Consistency: primary`` header.
+"""
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_REPLICA_CONFIG = {
+    'ALIASES': [],              # database aliases of the read replicas
+    'STRATEGY': 'round_robin',  # 'round_robin', 'least_loaded' or a dotted class path
+    'PIN_SECONDS': 5,           # seconds a client reads from the primary after a write
+}
+
+PIN_COOKIE = 'book_primary_until'
+CONSISTENCY_HEADER = 'X-Read-Consistency'
+PRIMARY = 'default'
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+
+def get_replica_config():
+    config = dict(DEFAULT_REPLICA_CONFIG)
+    config.update(getattr(settings, 'READ_REPLICAS', {}))
+    return config
+
+
+class RoundRobin:
+    """Replicas in turn"""
+
+    def __init__(self, aliases):
+        self.aliases = list(aliases)
+        self._counter = itertools.count()
+
+    def acquire(self):
+        return self.aliases[next(self._counter) % len(self.aliases)]
+
+    def release(self, alias):
+        pass
+
+
+class LeastLoaded:
+    """Replica serving the fewest requests of this process right now"""
+
+    def __init__(self, aliases):
+        self.active = {alias: 0 for alias in aliases}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            alias = min(self.active, key=self.active.get)
+            self.active[alias] += 1
+        return alias
+
+    def release(self, alias):
+        with self._lock:
+            self.active[alias] -= 1
+
+
+STRATEGIES = {
+    'round_robin': RoundRobin,
+    'least_loaded': LeastLoaded,
+}
+
+_strategy = None
+_strategy_lock = threading.Lock()
+
+
+def get_strategy():
+    """Process-wide replica strategy, or None when no replicas are configured"""
+    global _strategy
+    if _strategy is None:
+        config = get_replica_config()
+        if not config['ALIASES']:
+            return None
+        with _strategy_lock:
+            if _strategy is None:
+                name = config['STRATEGY']
+                strategy_class = STRATEGIES[name] if name in STRATEGIES else import_string(name)
+                _strategy = strategy_class(config['ALIASES'])
+    return _strategy
+
+
+@contextmanager
+def replica_reads():
+    """Route the reads of the enclosed block to one replica; yields its alias (None if none)"""
+    strategy = get_strategy()
+    if strategy is None:
+        yield None
+        return
+    alias = strategy.acquire()
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+        strategy.release(alias)
+
+
+def wants_primary(request):
+    """Whether the client must read its own writes"""
+    if request.headers.get(CONSISTENCY_HEADER, '').lower() == 'primary':
+        return True
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_to_primary(response):
+    """Keep the client on the primary until replicas have caught up with its write"""
+    seconds = get_replica_config()['PIN_SECONDS']
+    response.set_cookie(PIN_COOKIE, f'{time.time() + seconds:.3f}', max_age=seconds, httponly=True, samesite='Lax')
+    return response
+
+
+class ReplicaRouter:
+    """Reads go to the request's replica when one was chosen, the rest to the primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in get_replica_config()['ALIASES']
+
+
+class ReplicaReadsMixin:
+    """ViewSet mixin: ``replica_actions`` read from a replica, successful writes pin the client to the primary"""
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if action in self.replica_actions and not wants_primary(request):
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and get_strategy():
+            pin_to_primary(response)
+        return response
@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared modules (metrics, tracing, wire format, db_pool) live in microservices/service_common
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -42,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'service_common.tracing.TracingMiddleware',
+    'service_common.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +94,65 @@ DATABASES = {
     }
 }
 
+# Local SQLite database instead of MySQL (used by loadtest.py), e.g.
+# SERVICE_SQLITE_PATH=/tmp/book_service.sqlite3 python manage.py runserver
+if os.environ.get('SERVICE_SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['SERVICE_SQLITE_PATH'],
+            'OPTIONS': {
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file, not the default in-memory database: tests with several
+            # threads would otherwise fail with "database table is locked"
+            'TEST': {
+                'NAME': f"{os.environ['SERVICE_SQLITE_PATH']}.test",
+            },
+        }
+    }
+
+# Persistent connections: keep a worker's connection for DB_CONN_MAX_AGE
+# seconds and check it still works before reusing it in the next request.
+# DB_POOL=1 switches to a bounded per-process pool instead
+# (service_common/db_pool), which also reuses connections across the
+# threads of the development server; its stats are served at /metrics.
+DATABASE_POOL = {
+    'ENABLED': os.environ.get('DB_POOL') == '1',
+    'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),  # per process and alias
+    'TIMEOUT': 5,         # seconds to wait for a free connection
+    'MAX_LIFETIME': 300,  # seconds before a connection is replaced
+}
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True
+    if DATABASE_POOL['ENABLED']:
+        database['ENGINE'] = database['ENGINE'].replace('django.db.backends.', 'service_common.db_pool.')
+        database['CONN_MAX_AGE'] = 0  # connections go back to the pool after every request
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
+# Local read replica: a second SQLite file refreshed from the primary by
+# `manage.py simulate_replication --delay 2`, e.g.
+# SERVICE_SQLITE_REPLICA_PATH=/tmp/book_service_replica.sqlite3
+# No persistent connections: they would keep reading the replaced file.
+if os.environ.get('SERVICE_SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['SERVICE_SQLITE_REPLICA_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Read replicas: add MySQL replica aliases to DATABASES (with
+# 'TEST': {'MIRROR': 'default'}) and list them in READ_REPLICAS['ALIASES'].
+# Read-only BookViewSet actions use them; writes stay on 'default'.
+DATABASE_ROUTERS = ['book_service.db_routing.ReplicaRouter']
+READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STRATEGY': os.environ.get('READ_REPLICA_STRATEGY', 'round_robin'),  # or 'least_loaded'
+    'PIN_SECONDS': 5,  # read-your-writes window after a write; keep above the replication lag
+}
+
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -96,8 +164,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'service_common.wire.ContentNegotiation',
 }
 
+# MessagePack for internal calls (clients listing application/msgpack first in
+# Accept) when the optional msgpack package is installed; JSON stays the default
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('service_common.wire.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('service_common.wire.MessagePackParser')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,3 +214,41 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Book API configuration
+BOOK_BATCH_MAX_IDS = 200
+BOOK_CHANGE_FEED_MAX_LIMIT = 1000
+BOOK_CHANGE_FEED_SETTLE_SECONDS = 1  # changes younger than this are not served yet
+BOOK_CHANGE_RETENTION_DAYS = 7  # `manage.py prune_book_changes` keeps every change younger than this
+BOOK_CATALOG_MAX_PAGE_SIZE = 1000
+BOOK_EXPORT_CHUNK_SIZE = 1000  # rows per query/streamed chunk of the NDJSON export
+BOOK_SEARCH_MAX_PAGE_SIZE = 100
+BOOK_SEARCH_MAX_RESULTS = 1000  # deepest result reachable by paging
+BOOK_SEARCH_MAX_CANDIDATES = 10000  # SQLite: matches ranked per query (first by id)
+
+# Stock reservations (POST /books/<id>/reserve/, or /books/reserve/ for several
+# books at once); expired ones are released by
+# `manage.py release_expired_reservations`
+BOOK_RESERVATION_DEFAULT_TTL = 900  # seconds
+BOOK_RESERVATION_MAX_TTL = 3600
+BOOK_RESERVE_MAX_ITEMS = 100  # books per bulk reservation
+
+# Bulk stock adjustments (POST /books/stock/)
+BOOK_STOCK_ADJUST_MAX = 10000       # adjustments per request
+BOOK_STOCK_ADJUST_CHUNK_SIZE = 500  # adjustments per transaction and UPDATE
+
+# Request tracing (spans at /api/v1/traces/; set FILE to also append them as JSONL)
+SERVICE_NAME = 'book'
+TRACING = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 5000,
+    'FILE': os.environ.get('TRACE_FILE'),
+}
+
+# Prometheus-style metrics at /metrics (set METRICS_DIR when running several
+# worker processes so the scrape merges all of them)
+METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_DIR'),
+    'FLUSH_INTERVAL': 5,
+}
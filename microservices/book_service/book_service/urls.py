@@ -16,8 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from service_common.tracing import traces_view
+from service_common.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/v1/traces/', traces_view, name='traces'),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('books.urls')),
 ]
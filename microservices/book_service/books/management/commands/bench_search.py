@@ -0,0 +1,118 @@
+"""Benchmark book search latency at growing catalog sizes
+
+Fills the books table with synthetic books up to each size (inserted with
+raw SQL: no outbox entries, so run it against a scratch database) and times
+the first result page of several query shapes, with the full-text index and
+with the unindexed ``icontains`` scan for comparison.
+
+Usage:
+    SERVICE_SQLITE_PATH=/tmp/bench_search.sqlite3 python manage.py migrate
+    SERVICE_SQLITE_PATH=/tmp/bench_search.sqlite3 python manage.py bench_search --sizes 10000,100000,1000000
+"""
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from books.models import Book
+from books.search import _search_scan, search_book_ids
+
+
+PAGE = 21  # one result page plus the has_more probe
+INSERT_BATCH = 10000
+
+
+def make_vocabulary(rng, size):
+    """Pronounceable pseudo-words; low indexes are drawn far more often (Zipf-like)"""
+    consonants, vowels = 'bcdfghjklmnprstvwz', 'aeiou'
+    words = set()
+    while len(words) < size:
+        length = rng.randint(2, 4)
+        words.add(''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(length)))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+def zipf_word(rng, words):
+    return words[min(int(rng.paretovariate(1.1)) - 1, len(words) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Time full-text book search against an icontains scan at several catalog sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated catalog sizes')
+        parser.add_argument('--repeat', type=int, default=50, help='Indexed queries per query shape')
+        parser.add_argument('--scan-repeat', type=int, default=5, help='Scan queries per query shape (0 skips the scan)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated books')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        if Book.objects.exists():
+            raise CommandError('The books table is not empty; run against a scratch database')
+
+        rng = random.Random(options['seed'])
+        self.words = make_vocabulary(rng, 20000)
+        self.surnames = make_vocabulary(random.Random(options['seed'] + 1), 3000)
+        self.stdout.write(f'Database: {connection.vendor}; median / p95 ms for the first {PAGE - 1} results')
+        self.stdout.write(
+            f'{"books":>9}  {"query":<14}{"index p50":>10}{"index p95":>10}{"scan p50":>10}{"results":>9}'
+        )
+        try:
+            count = 0
+            for size in sizes:
+                started = time.perf_counter()
+                self.insert_books(rng, count, size)
+                count = size
+                self.stderr.write(f'Inserted up to {size} books in {time.perf_counter() - started:.1f}s')
+                for name, make_query in self.query_shapes():
+                    self.report(size, name, make_query, rng, options)
+        finally:
+            if not options['keep']:
+                Book.objects.all()._raw_delete(Book.objects.db)
+
+    def insert_books(self, rng, start, end):
+        updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        sql = 'INSERT INTO books (title, author, price, stock, version, updated_at) VALUES (%s, %s, %s, %s, %s, %s)'
+        for batch_start in range(start, end, INSERT_BATCH):
+            rows = []
+            for _ in range(batch_start, min(batch_start + INSERT_BATCH, end)):
+                title = ' '.join(zipf_word(rng, self.words) for _ in range(rng.randint(2, 6))).capitalize()
+                author = f'{rng.choice(self.surnames).capitalize()} {zipf_word(rng, self.surnames).capitalize()}'
+                rows.append((title, author, f'{rng.randint(300, 6000) / 100:.2f}', rng.randint(0, 50), 1, updated_at))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+    def query_shapes(self):
+        words = self.words
+        return [
+            ('common word', lambda rng: [words[rng.randint(0, 9)]]),
+            ('prefix', lambda rng: [words[rng.randint(0, 200)][:3]]),
+            ('two words', lambda rng: [zipf_word(rng, words), zipf_word(rng, words)]),
+            ('rare word', lambda rng: [words[rng.randint(len(words) // 2, len(words) - 1)]]),
+            ('author', lambda rng: [rng.choice(self.surnames)]),
+        ]
+
+    def report(self, size, name, make_query, rng, options):
+        queries = [make_query(rng) for _ in range(options['repeat'])]
+        indexed, matches = self.time_queries(search_book_ids, queries)
+        scan = self.time_queries(_search_scan, queries[:options['scan_repeat']])[0] if options['scan_repeat'] else []
+        p95 = statistics.quantiles(indexed, n=20)[-1] if len(indexed) > 1 else indexed[0]
+        scan_p50 = f'{statistics.median(scan):>10.2f}' if scan else f'{"-":>10}'
+        self.stdout.write(
+            f'{size:>9}  {name:<14}{statistics.median(indexed):>10.2f}{p95:>10.2f}{scan_p50}'
+            f'{statistics.mean(matches):>9.1f}'
+        )
+
+    def time_queries(self, search, queries):
+        samples, matches = [], []
+        for terms in queries:
+            start = time.perf_counter()
+            ids = search(terms, 0, PAGE)
+            samples.append((time.perf_counter() - start) * 1000)
+            matches.append(len(ids))
+        return samples, matches
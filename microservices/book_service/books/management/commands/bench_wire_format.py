@@ -0,0 +1,81 @@
+"""Benchmark JSON vs MessagePack for book-service responses
+
+Builds single-book, batch and catalog-page payloads with ``BookSerializer``
+(unsaved books, no database needed) and compares, per format, the encoded
+size and the CPU time to render (server) and parse (client) them.
+
+Usage: python manage.py bench_wire_format --batch 50 --catalog 500 --repeat 200
+"""
+import json
+import statistics
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from service_common.wire import MessagePackRenderer, msgpack
+from books.models import Book
+from books.serializers import BookSerializer
+
+
+def sample_books(count):
+    return [
+        Book(
+            id=book_id,
+            title=f'Book title number {book_id}',
+            author=f'Author {book_id % 97}',
+            price=Decimal('12.50') + book_id % 40,
+            stock=book_id % 30,
+        )
+        for book_id in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON and MessagePack payload size and encode/decode CPU time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=50, help='Books in the batch response')
+        parser.add_argument('--catalog', type=int, default=500, help='Books in the catalog page')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed runs per measurement')
+
+    def handle(self, *args, **options):
+        if msgpack is None:
+            raise CommandError('msgpack is not installed (pip install msgpack)')
+        books = sample_books(max(options['batch'], options['catalog']))
+        payloads = [
+            ('single', {'success': True, 'data': BookSerializer(books[0]).data}),
+            ('batch', {
+                'success': True,
+                'data': BookSerializer(books[:options['batch']], many=True).data,
+                'missing': [],
+            }),
+            ('catalog', {
+                'success': True,
+                'data': BookSerializer(books[:options['catalog']], many=True).data,
+                'next_cursor': 'WzUwMF0',
+                'has_more': True,
+            }),
+        ]
+        formats = [
+            ('json', JSONRenderer(), lambda body: json.loads(body)),
+            ('msgpack', MessagePackRenderer(), lambda body: msgpack.unpackb(body, raw=False)),
+        ]
+
+        self.stdout.write(f'{options["repeat"]} runs each (median microseconds)')
+        self.stdout.write(f'{"payload":<10}{"format":<10}{"bytes":>10}{"render":>12}{"parse":>12}')
+        for name, payload in payloads:
+            for format_name, renderer, parse in formats:
+                body = renderer.render(payload)
+                render_us = self.time(lambda: renderer.render(payload), options['repeat'])
+                parse_us = self.time(lambda: parse(body), options['repeat'])
+                self.stdout.write(
+                    f'{name:<10}{format_name:<10}{len(body):>10}{render_us:>12.1f}{parse_us:>12.1f}'
+                )
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1e6)
+        return statistics.median(samples)
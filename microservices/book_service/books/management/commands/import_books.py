@@ -0,0 +1,217 @@
+"""Import books from a CSV or NDJSON publisher feed
+
+Rows are streamed from a file (optionally gzipped) or stdin, validated and
+upserted by ISBN ``--batch-size`` rows at a time: each batch is one
+transaction with one ``bulk_create(update_conflicts=True)`` and the outbox
+entries of the books it created or changed. Rows equal to the stored book
+are skipped, so importing the same feed again writes nothing.
+
+Columns (CSV header) or keys (NDJSON): isbn, title, author, price and the
+optional stock; other columns are ignored. Invalid rows are reported on
+stderr and skipped.
+
+With ``--checkpoint FILE`` the number of input rows already committed is
+saved after every batch, and a later run with the same checkpoint resumes
+after them. The file is removed once the import completes.
+
+Usage:
+    python manage.py import_books feed.csv
+    python manage.py import_books feed.ndjson.gz --checkpoint /tmp/feed.checkpoint
+    zcat feed.csv.gz | python manage.py import_books - --format csv
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from books.models import Book, BookChange
+from books.serializers import BookImportSerializer
+
+
+UPDATE_FIELDS = ['title', 'author', 'price', 'stock', 'version', 'updated_at']
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    raise CommandError('Cannot tell the format from the file name; pass --format csv or --format ndjson')
+
+
+def open_source(path):
+    """Text stream of the feed; ``-`` is stdin"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        if row.get('stock') in ('', None):
+            row.pop('stock', None)
+        yield row
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {'_error': 'Not a JSON object'}
+
+
+class Checkpoint:
+    """Number of input rows of ``source`` already imported, kept in a file"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['source'] != self.source:
+            raise CommandError(f'Checkpoint {self.path} belongs to {state["source"]}, not {self.source}')
+        return state['rows']
+
+    def save(self, rows):
+        if self.path:
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'source': self.source, 'rows': rows}, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Command(BaseCommand):
+    help = 'Upsert books by ISBN from a CSV or NDJSON feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Feed file (.csv, .ndjson, .jsonl, optionally .gz) or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Feed format (default: from the file name)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--checkpoint', help='File recording progress, to resume an interrupted import')
+        parser.add_argument('--max-errors', type=int, default=1000, help='Abort after this many invalid rows')
+        parser.add_argument('--progress', type=float, default=5.0, help='Seconds between progress reports')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if source == '-' and not options['format']:
+            raise CommandError('Pass --format when reading stdin')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        reader = read_csv if (options['format'] or detect_format(source)) == 'csv' else read_ndjson
+        checkpoint = Checkpoint(options['checkpoint'], os.path.abspath(source) if source != '-' else '-')
+        skip = checkpoint.load()
+        if skip:
+            self.stderr.write(f'Resuming after row {skip}')
+
+        self.counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'invalid': 0}
+        self.max_errors = options['max_errors']
+        self.validator = BookImportSerializer()
+        started = last_report = time.monotonic()
+        rows_read = 0
+        batch = {}  # isbn -> validated row; a later row for the same ISBN wins
+        try:
+            stream = open_source(source)
+        except OSError as e:
+            raise CommandError(f'Cannot read {source}: {e}')
+        with stream:
+            for row in reader(stream):
+                rows_read += 1
+                if rows_read <= skip:
+                    continue
+                data = self.validate(rows_read, row)
+                if data is not None:
+                    batch[data['isbn']] = data
+                if rows_read % options['batch_size'] == 0:
+                    self.upsert(batch)
+                    batch = {}
+                    checkpoint.save(rows_read)
+                    if time.monotonic() - last_report >= options['progress']:
+                        last_report = time.monotonic()
+                        self.stderr.write(self.summary(rows_read - skip, last_report - started))
+            self.upsert(batch)
+        checkpoint.remove()
+        self.stdout.write(self.summary(rows_read - skip, time.monotonic() - started))
+
+    def validate(self, number, row):
+        """Validated row, or None after reporting why it is invalid"""
+        if '_error' in row:
+            detail = row['_error']
+        else:
+            try:
+                return self.validator.run_validation(row)
+            except ValidationError as e:
+                detail = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in e.detail.items())
+        self.counts['invalid'] += 1
+        self.stderr.write(f'Row {number}: {detail}')
+        if self.counts['invalid'] > self.max_errors:
+            raise CommandError(f'More than {self.max_errors} invalid rows; stopped at row {number}')
+        return None
+
+    def upsert(self, rows):
+        """Create or update one batch of books and record their changes"""
+        if not rows:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {
+                book.isbn: book
+                for book in Book.objects.select_for_update().filter(isbn__in=list(rows))
+            }
+            created, updated = [], []
+            for isbn, data in rows.items():
+                current = existing.get(isbn)
+                if current is None:
+                    created.append(Book(version=1, updated_at=now, **{'stock': 0, **data}))
+                    continue
+                data.setdefault('stock', current.stock)
+                if all(getattr(current, field) == value for field, value in data.items()):
+                    self.counts['unchanged'] += 1
+                    continue
+                updated.append(Book(version=current.version + 1, updated_at=now, **data))
+            if not created and not updated:
+                return
+
+            Book.objects.bulk_create(
+                created + updated,
+                update_conflicts=True,
+                # MySQL has no conflict target: ON DUPLICATE KEY covers the isbn index
+                unique_fields=['isbn'] if connection.features.supports_update_conflicts_with_target else None,
+                update_fields=UPDATE_FIELDS,
+            )
+            for book in updated:
+                book.pk = existing[book.isbn].pk
+            missing = [book for book in created if book.pk is None]
+            if missing:
+                # Backends that cannot return ids from a bulk insert (MySQL)
+                ids = dict(Book.objects.filter(isbn__in=[book.isbn for book in missing]).values_list('isbn', 'id'))
+                for book in missing:
+                    book.pk = ids[book.isbn]
+            BookChange.record_many(created, BookChange.CREATE)
+            BookChange.record_many(updated, BookChange.UPDATE)
+        self.counts['created'] += len(created)
+        self.counts['updated'] += len(updated)
+
+    def summary(self, rows, seconds):
+        counts = ', '.join(f'{count} {name}' for name, count in self.counts.items())
+        return f'{rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):.0f} rows/s): {counts}'
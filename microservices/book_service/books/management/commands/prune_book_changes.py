@@ -0,0 +1,41 @@
+"""Delete superseded entries of the BookChange outbox
+
+Usage:
+    python manage.py prune_book_changes                # prune once
+    python manage.py prune_book_changes --follow       # keep pruning
+    python manage.py prune_book_changes --days 1       # shorter retention
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from books.models import BookChange
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed entries older than the retention period that a later change supersedes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=float, default=getattr(settings, 'BOOK_CHANGE_RETENTION_DAYS', 7),
+            help='Keep every change younger than this'
+        )
+        parser.add_argument('--follow', action='store_true', help='Keep pruning')
+        parser.add_argument('--interval', type=float, default=3600.0, help='Seconds between runs')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Changes deleted per query')
+
+    def handle(self, *args, **options):
+        while True:
+            older_than = timezone.now() - timedelta(days=options['days'])
+            deleted = 0
+            while True:
+                count = BookChange.prune(older_than, batch_size=options['batch_size'])
+                deleted += count
+                if count < options['batch_size']:
+                    break
+            if deleted or not options['follow']:
+                self.stdout.write(f'Deleted {deleted} superseded book changes')
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+"""Release stock held by expired reservations
+
+Usage:
+    python manage.py release_expired_reservations            # sweep once
+    python manage.py release_expired_reservations --follow   # keep sweeping
+"""
+import time
+from django.core.management.base import BaseCommand
+from books.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired reservations to their books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true', help='Keep sweeping')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds between sweeps')
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations released per query')
+
+    def handle(self, *args, **options):
+        while True:
+            released = 0
+            while True:
+                count = StockReservation.release_expired(batch_size=options['batch_size'])
+                released += count
+                if count < options['batch_size']:
+                    break
+            if released or not options['follow']:
+                self.stdout.write(f'Released {released} expired reservations')
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,70 @@
+"""Simulate asynchronous replication between two SQLite files
+
+Every ``--interval`` seconds the primary (``default``) is snapshotted with
+SQLite's online backup API; each snapshot replaces the replica file once it
+is ``--delay`` seconds old, so replica reads lag the primary by about
+``--delay`` seconds, like a real asynchronous replica.
+
+Usage:
+    export SERVICE_SQLITE_PATH=/tmp/book_service.sqlite3
+    export SERVICE_SQLITE_REPLICA_PATH=/tmp/book_service_replica.sqlite3
+    python manage.py simulate_replication --delay 2
+"""
+import os
+import sqlite3
+import time
+from collections import deque
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to a replica file with a delay'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', default='replica', help='Database alias of the replica')
+        parser.add_argument('--delay', type=float, default=2.0, help='Replication lag in seconds')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between snapshots')
+        parser.add_argument('--once', action='store_true', help='Copy once without delay and exit')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES.get(options['replica'])
+        if replica is None:
+            raise CommandError(f'No database alias "{options["replica"]}" (set SERVICE_SQLITE_REPLICA_PATH)')
+        if 'sqlite3' not in primary['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('Both databases must be SQLite')
+        source, target = str(primary['NAME']), str(replica['NAME'])
+
+        if options['once']:
+            os.replace(self.snapshot(source, f'{target}.snapshot'), target)
+            self.stdout.write(f'Copied {source} to {target}')
+            return
+
+        self.stdout.write(f'Replicating {source} -> {target} with {options["delay"]:g}s lag')
+        pending = deque()  # (taken_at, path)
+        sequence = 0
+        while True:
+            now = time.monotonic()
+            sequence += 1
+            pending.append((now, self.snapshot(source, f'{target}.snapshot-{sequence % 1000}')))
+            latest = None
+            while pending and now - pending[0][0] >= options['delay']:
+                if latest is not None:
+                    os.remove(latest)
+                latest = pending.popleft()[1]
+            if latest is not None:
+                # Open connections keep reading the old file; new ones see the snapshot
+                os.replace(latest, target)
+            time.sleep(options['interval'])
+
+    def snapshot(self, source, path):
+        """Consistent copy of ``source`` at ``path``"""
+        src = sqlite3.connect(source, timeout=30)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        return path
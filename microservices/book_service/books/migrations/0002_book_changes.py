@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def seed_book_changes(apps, schema_editor):
+    """Record existing books as 'create' changes so consumers can bootstrap from the feed"""
+    Book = apps.get_model('books', 'Book')
+    BookChange = apps.get_model('books', 'BookChange')
+    # Streamed and written in fixed batches so a large catalog is never held in memory
+    changes = []
+    for book in Book.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        changes.append(BookChange(
+            book_id=book.pk,
+            operation='create',
+            data={
+                'id': book.pk,
+                'title': book.title,
+                'author': book.author,
+                'price': str(book.price),
+                'stock': book.stock,
+            },
+        ))
+        if len(changes) == BATCH_SIZE:
+            BookChange.objects.bulk_create(changes)
+            changes = []
+    if changes:
+        BookChange.objects.bulk_create(changes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.BigIntegerField(db_index=True)),
+                ('operation', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'book_changes',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='book',
+            options={},
+        ),
+        migrations.RunPython(seed_book_changes, migrations.RunPython.noop),
+    ]
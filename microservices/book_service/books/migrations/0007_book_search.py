@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+# FTS5 index over books(title, author) for SQLite; the triggers keep it in
+# sync with every write to the books table. Note that SQLite migrations that
+# rebuild the books table drop these triggers, so they must re-run this SQL.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE books_fts USING fts5("
+    "title, author, content='books', content_rowid='id', prefix='2 3 4')",
+    "CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    "CREATE TRIGGER books_fts_update AFTER UPDATE OF title, author ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    "INSERT INTO books_fts(books_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS books_fts_insert',
+    'DROP TRIGGER IF EXISTS books_fts_delete',
+    'DROP TRIGGER IF EXISTS books_fts_update',
+    'DROP TABLE IF EXISTS books_fts',
+]
+
+MYSQL_CREATE = ['CREATE FULLTEXT INDEX books_title_author_ft ON books (title, author)']
+MYSQL_DROP = ['DROP INDEX books_title_author_ft ON books']
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'mysql': MYSQL_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'mysql': MYSQL_DROP}),
+        ),
+    ]
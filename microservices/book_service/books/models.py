@@ -1,5 +1,10 @@
 """Book model for book-service microservice"""
-from django.db import models
+import uuid
+from collections import Counter
+from datetime import timedelta
+from django.db import DatabaseError, connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -9,10 +14,19 @@ class Book(models.Model):
     author = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
+    isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)  # publisher feed key
+    version = models.PositiveIntegerField(default=1)  # bumped on every update, used for ETags
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
     class Meta:
         db_table = 'books'
+        indexes = [
+            # Keyset pagination of the catalog by each sort key
+            models.Index(fields=['title', 'id'], name='books_title_id_idx'),
+            models.Index(fields=['author', 'id'], name='books_author_id_idx'),
+            models.Index(fields=['price', 'id'], name='books_price_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} by {self.author}"
@@ -20,3 +34,339 @@ class Book(models.Model):
     def is_available(self):
         """Check if book is in stock"""
         return self.stock > 0
+    
+    class VersionConflict(Exception):
+        """The row was changed by someone else since this instance was loaded"""
+    
+    def save(self, *args, **kwargs):
+        """Save and record the change in the outbox in the same transaction
+        
+        Updates are conditional on the version this instance was loaded
+        with, so a concurrent write (reservations, bulk stock adjustments,
+        another PUT) is never overwritten with stale values: the UPDATE
+        matches no row and VersionConflict is raised instead.
+        """
+        with transaction.atomic():
+            if self._state.adding or self.pk is None:
+                super().save(*args, **kwargs)
+                BookChange.record(self, BookChange.CREATE)
+                return
+            update_fields = kwargs.get('update_fields')
+            values = {
+                field.attname: getattr(self, field.attname)
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('version', 'updated_at')
+                and (update_fields is None or field.name in update_fields)
+            }
+            now = timezone.now()
+            updated = Book.objects.filter(pk=self.pk, version=self.version).update(
+                version=F('version') + 1, updated_at=now, **values
+            )
+            if not updated:
+                raise Book.VersionConflict(f'Book {self.pk} is no longer at version {self.version}')
+            self.version += 1
+            self.updated_at = now
+            BookChange.record(self, BookChange.UPDATE)
+    
+    def delete(self, *args, **kwargs):
+        """Delete and record the change in the outbox in the same transaction"""
+        with transaction.atomic():
+            book_id = self.pk
+            result = super().delete(*args, **kwargs)
+            BookChange.objects.create(book_id=book_id, operation=BookChange.DELETE)
+        return result
+    
+    @classmethod
+    def adjust_stock(cls, adjustments, chunk_size=500):
+        """Apply stock adjustments with optimistic concurrency
+        
+        ``adjustments`` are dicts with ``id``, ``expected_version`` and either
+        ``delta`` or ``stock`` (absolute). Each chunk is one transaction: the
+        rows are locked and checked, then every matching row is changed by a
+        single ``UPDATE ... SET stock = CASE id ...`` and the outbox gets one
+        entry per changed book. Returns one result per adjustment, in order:
+        ``{'id', 'status', 'version', 'stock'}`` where status is ``updated``,
+        ``conflict`` (version differs), ``insufficient_stock`` (the delta
+        would make stock negative) or ``not_found``; ``version`` and
+        ``stock`` are the values now stored.
+        """
+        results = []
+        for start in range(0, len(adjustments), chunk_size):
+            results.extend(cls._adjust_stock_chunk(adjustments[start:start + chunk_size]))
+        return results
+    
+    @classmethod
+    def _adjust_stock_chunk(cls, adjustments):
+        with transaction.atomic():
+            books = cls.objects.select_for_update().in_bulk([adjustment['id'] for adjustment in adjustments])
+            results, changed = [], []
+            for adjustment in adjustments:
+                book = books.get(adjustment['id'])
+                if book is None:
+                    results.append({'id': adjustment['id'], 'status': 'not_found', 'version': None, 'stock': None})
+                    continue
+                stock = adjustment['stock'] if 'stock' in adjustment else book.stock + adjustment['delta']
+                if book.version != adjustment['expected_version']:
+                    outcome = 'conflict'
+                elif stock < 0:
+                    outcome = 'insufficient_stock'
+                else:
+                    outcome = 'updated'
+                    book.stock = stock
+                    book.version += 1
+                    changed.append(book)
+                results.append({'id': book.pk, 'status': outcome, 'version': book.version, 'stock': book.stock})
+            if changed:
+                cls._update_stock(changed)
+                BookChange.record_many(changed, BookChange.UPDATE)
+        return results
+    
+    @classmethod
+    def _update_stock(cls, books):
+        """Write the new stock and version of locked books with one UPDATE
+        
+        Raw SQL: building one ``When()`` per row through the ORM costs far
+        more than running the statement.
+        """
+        cases = ' '.join(['WHEN %s THEN %s'] * len(books))
+        placeholders = ', '.join(['%s'] * len(books))
+        sql = (
+            f'UPDATE {connection.ops.quote_name(cls._meta.db_table)} '
+            f'SET stock = CASE id {cases} END, version = version + 1, updated_at = %s '
+            f'WHERE id IN ({placeholders}) AND version = CASE id {cases} END'
+        )
+        params = [value for book in books for value in (book.pk, book.stock)]
+        params.append(connection.ops.adapt_datetimefield_value(timezone.now()))
+        params.extend(book.pk for book in books)
+        # The version guard repeats the check of the locked rows, so it always matches
+        params.extend(value for book in books for value in (book.pk, book.version - 1))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.rowcount != len(books):
+                raise DatabaseError('Books changed while their stock was being adjusted')
+    
+    @property
+    def etag(self):
+        """Strong ETag for this row version"""
+        return f'"book-{self.pk}-v{self.version}"'
+    
+    def to_change_data(self):
+        """Book fields as stored in the outbox"""
+        return {
+            'id': self.pk,
+            'title': self.title,
+            'author': self.author,
+            'price': str(self.price),
+            'stock': self.stock,
+        }
+
+
+class BookChange(models.Model):
+    """Transactional outbox of Book inserts, updates and deletes
+    
+    The auto-increment id is the change feed cursor. Writes that bypass
+    Book.save()/delete() (queryset.update, bulk_create) must call record()
+    or record_many() themselves.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+    
+    book_id = models.BigIntegerField(db_index=True)
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    data = models.JSONField(null=True, blank=True)  # None for deletes
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'book_changes'
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.operation} book {self.book_id} (#{self.id})"
+    
+    @classmethod
+    def record(cls, book, operation=UPDATE):
+        """Record a change for one saved book"""
+        return cls.objects.create(book_id=book.pk, operation=operation, data=book.to_change_data())
+    
+    @classmethod
+    def record_many(cls, books, operation=UPDATE):
+        """Record changes for several saved books with one INSERT"""
+        return cls.objects.bulk_create([
+            cls(book_id=book.pk, operation=operation, data=book.to_change_data())
+            for book in books
+        ])
+    
+    @classmethod
+    def prune(cls, older_than, batch_size=1000):
+        """Delete up to ``batch_size`` superseded changes created before ``older_than``
+        
+        A change is superseded when a later change of the same book exists,
+        or when it is a delete. The latest change of every book is kept, so
+        a consumer starting from cursor 0 still receives the whole catalog.
+        Returns how many changes were deleted.
+        """
+        newer = cls.objects.filter(book_id=OuterRef('book_id'), pk__gt=OuterRef('pk'))
+        superseded = cls.objects.filter(created_at__lt=older_than).filter(
+            Q(operation=cls.DELETE) | Exists(newer)
+        ).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        ids = list(superseded)
+        if not ids:
+            return 0
+        return cls.objects.filter(pk__in=ids).delete()[0]
+
+
+class StockReservation(models.Model):
+    """Stock held for a cart for a limited time
+    
+    Reserving decrements ``Book.stock`` with one conditional UPDATE, so
+    concurrent reservations can never oversell and no row lock outlives
+    the reserving request. Releasing (explicitly or by the expiry sweeper)
+    puts the stock back exactly once.
+    """
+    ACTIVE = 'active'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'stock_reservations'
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservations_expiry_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Reservation {self.id}: book {self.book_id} x {self.quantity} ({self.status})"
+    
+    @classmethod
+    def reserve(cls, book_id, quantity, ttl):
+        """Reserve ``quantity`` units of a book for ``ttl`` seconds
+        
+        Returns the reservation, or None if there is not enough stock.
+        Raises Book.DoesNotExist for unknown books.
+        """
+        with transaction.atomic():
+            updated = Book.objects.filter(pk=book_id, stock__gte=quantity).update(
+                stock=F('stock') - quantity,
+                version=F('version') + 1,
+                updated_at=timezone.now()
+            )
+            if not updated:
+                Book.objects.only('id').get(pk=book_id)
+                return None
+            book = Book.objects.get(pk=book_id)
+            BookChange.record(book, BookChange.UPDATE)
+            return cls.objects.create(
+                book=book,
+                quantity=quantity,
+                expires_at=timezone.now() + timedelta(seconds=ttl)
+            )
+    
+    @classmethod
+    def reserve_many(cls, items, ttl):
+        """Reserve several books for ``ttl`` seconds, all or nothing
+        
+        ``items`` maps book id to quantity. Every book gets the same
+        conditional UPDATE as ``reserve``, all in one transaction. Returns
+        ``(reservations, failures)``: the reservations in ``items`` order, or
+        no reservations and one ``{'book_id', 'status', 'available'}`` entry
+        per book that is unknown (``not_found``) or short
+        (``insufficient_stock``), with nothing reserved.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            failures = []
+            # Fixed UPDATE order so concurrent batches lock rows in the same order
+            for book_id, quantity in sorted(items.items()):
+                updated = Book.objects.filter(pk=book_id, stock__gte=quantity).update(
+                    stock=F('stock') - quantity,
+                    version=F('version') + 1,
+                    updated_at=now
+                )
+                if not updated:
+                    available = Book.objects.filter(pk=book_id).values_list('stock', flat=True).first()
+                    failures.append({
+                        'book_id': book_id,
+                        'status': 'not_found' if available is None else 'insufficient_stock',
+                        'available': available
+                    })
+            if failures:
+                transaction.set_rollback(True)
+                return [], failures
+            books = Book.objects.in_bulk(list(items))
+            BookChange.record_many(books.values(), BookChange.UPDATE)
+            reservations = cls.objects.bulk_create([
+                cls(book=books[book_id], quantity=quantity, expires_at=now + timedelta(seconds=ttl))
+                for book_id, quantity in items.items()
+            ])
+        return reservations, []
+    
+    def release(self, status=RELEASED):
+        """Give the reserved stock back; False if it was already released or expired"""
+        with transaction.atomic():
+            updated = StockReservation.objects.filter(pk=self.pk, status=self.ACTIVE).update(status=status)
+            if not updated:
+                return False
+            Book.objects.filter(pk=self.book_id).update(
+                stock=F('stock') + self.quantity,
+                version=F('version') + 1,
+                updated_at=timezone.now()
+            )
+            book = Book.objects.filter(pk=self.book_id).first()
+            if book is not None:
+                BookChange.record(book, BookChange.UPDATE)
+        self.status = status
+        return True
+    
+    @classmethod
+    def release_expired(cls, batch_size=500):
+        """Release up to ``batch_size`` expired reservations; returns how many were released"""
+        expired = cls.objects.filter(
+            status=cls.ACTIVE, expires_at__lte=timezone.now()
+        ).order_by('expires_at').values_list('pk', flat=True)[:batch_size]
+        return cls.release_many(list(expired), cls.EXPIRED)
+    
+    @classmethod
+    def release_many(cls, reservation_ids, status=RELEASED):
+        """Give the stock of several reservations back in one transaction
+        
+        Reservations that are unknown or no longer active are skipped;
+        returns how many were released.
+        """
+        with transaction.atomic():
+            active = list(
+                cls.objects.select_for_update()
+                .filter(pk__in=reservation_ids, status=cls.ACTIVE)
+                .values_list('pk', 'book_id', 'quantity')
+            )
+            if not active:
+                return 0
+            cls.objects.filter(pk__in=[pk for pk, _, _ in active]).update(status=status)
+            returned = Counter()
+            for _, book_id, quantity in active:
+                returned[book_id] += quantity
+            now = timezone.now()
+            for book_id, quantity in sorted(returned.items()):
+                Book.objects.filter(pk=book_id).update(
+                    stock=F('stock') + quantity,
+                    version=F('version') + 1,
+                    updated_at=now
+                )
+            BookChange.record_many(Book.objects.filter(pk__in=list(returned)), BookChange.UPDATE)
+        return len(active)
@@ -0,0 +1,87 @@
+"""Full-text search over book titles and authors
+
+The index lives in the database (see migration 0007_book_search):
+
+- MySQL: a ``FULLTEXT`` index on (title, author), queried in boolean mode
+- SQLite: an FTS5 table ``books_fts`` with ``books`` as its content table,
+  kept in sync by triggers, so writes that bypass ``Book.save()`` (bulk
+  inserts, queryset updates) are indexed too
+
+Every query term must match a word; the last term also matches as a
+prefix, for search-as-you-type (``harry pot`` finds "Harry Potter").
+Results are ranked by relevance (BM25 with title matches weighted above
+author matches on SQLite, the FULLTEXT score on MySQL), then by id. Other
+databases fall back to an unindexed ``icontains`` scan ordered by id.
+
+Scoring every match makes very common terms slow on large catalogs, so on
+SQLite only the first ``BOOK_SEARCH_MAX_CANDIDATES`` matches (by id) are
+ranked; queries matching fewer books are ranked exactly.
+"""
+import re
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from .models import Book
+
+
+MAX_TERMS = 8
+
+# BM25 weights of the books_fts columns (title, author)
+TITLE_WEIGHT = 2.0
+AUTHOR_WEIGHT = 1.0
+
+_term = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Lower-cased words of a query, at most MAX_TERMS; ValueError when there are none"""
+    terms = list(dict.fromkeys(_term.findall(query.lower())))[:MAX_TERMS]
+    if not terms:
+        raise ValueError('Query parameter "q" must contain at least one word')
+    return terms
+
+
+def search_book_ids(terms, offset, limit):
+    """Ids of books matching every term, best match first"""
+    vendor = connections[router.db_for_read(Book)].vendor
+    if vendor == 'sqlite':
+        return _search_fts5(terms, offset, limit)
+    if vendor == 'mysql':
+        return _search_fulltext(terms, offset, limit)
+    return _search_scan(terms, offset, limit)
+
+
+def _search_fts5(terms, offset, limit):
+    match = ' '.join(f'"{term}"' for term in terms) + '*'
+    candidates = getattr(settings, 'BOOK_SEARCH_MAX_CANDIDATES', 10000)
+    with connections[router.db_for_read(Book)].cursor() as cursor:
+        cursor.execute(
+            'SELECT id FROM ('
+            ' SELECT rowid AS id, bm25(books_fts, %s, %s) AS score'
+            ' FROM books_fts WHERE books_fts MATCH %s LIMIT %s'
+            ') ORDER BY score, id LIMIT %s OFFSET %s',
+            [TITLE_WEIGHT, AUTHOR_WEIGHT, match, candidates, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fulltext(terms, offset, limit):
+    against = ' '.join(f'+{term}' for term in terms) + '*'
+    score = RawSQL('MATCH (title, author) AGAINST (%s IN BOOLEAN MODE)', [against])
+    books = (
+        Book.objects
+        .annotate(score=score)
+        .filter(score__gt=0)
+        .order_by('-score', 'id')
+        .values_list('id', flat=True)
+    )
+    return list(books[offset:offset + limit])
+
+
+def _search_scan(terms, offset, limit):
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(author__icontains=term)
+    books = Book.objects.filter(condition).order_by('id').values_list('id', flat=True)
+    return list(books[offset:offset + limit])
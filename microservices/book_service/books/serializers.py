@@ -1,13 +1,139 @@
 """Serializers for Book API"""
+import re
+from django.conf import settings
 from rest_framework import serializers
-from .models import Book
+from rest_framework.validators import UniqueValidator
+from .models import Book, BookChange, StockReservation
+
+
+class ISBNField(serializers.CharField):
+    """ISBN-10 or ISBN-13, stored without hyphens or spaces"""
+    default_error_messages = {
+        'invalid': 'Enter a valid ISBN-10 or ISBN-13.',
+    }
+    pattern = re.compile(r'\d{9}[\dX]|\d{13}')
+    
+    def to_internal_value(self, data):
+        isbn = re.sub(r'[\s-]', '', super().to_internal_value(data)).upper()
+        if not self.pattern.fullmatch(isbn):
+            self.fail('invalid')
+        return isbn
 
 
 class BookSerializer(serializers.ModelSerializer):
-    """Serializer for Book model"""
+    """Serializer for Book model
+    
+    Accepts an optional ``fields`` argument to limit the output to a subset
+    of fields (``id`` is always included).
+    """
     is_available = serializers.BooleanField(read_only=True)
+    isbn = ISBNField(
+        required=False, allow_null=True,
+        validators=[UniqueValidator(queryset=Book.objects.all())]
+    )
     
     class Meta:
         model = Book
-        fields = ['id', 'title', 'author', 'price', 'stock', 'is_available']
-        read_only_fields = ['id']
+        fields = ['id', 'isbn', 'title', 'author', 'price', 'stock', 'version', 'is_available']
+        read_only_fields = ['id', 'version']
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            allowed = set(fields) | {'id'}
+            for field_name in set(self.fields) - allowed:
+                self.fields.pop(field_name)
+
+
+class BookImportSerializer(serializers.Serializer):
+    """One row of a publisher feed (``manage.py import_books``)
+    
+    ``stock`` is optional: books already in the catalog keep theirs.
+    """
+    isbn = ISBNField()
+    title = serializers.CharField(max_length=200)
+    author = serializers.CharField(max_length=100)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(min_value=0, required=False)
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    """One stock change: a ``delta`` or an absolute ``stock``, if the book is still at ``expected_version``"""
+    id = serializers.IntegerField(min_value=1)
+    expected_version = serializers.IntegerField(min_value=1)
+    delta = serializers.IntegerField(required=False)
+    stock = serializers.IntegerField(required=False, min_value=0)
+    
+    def validate(self, attrs):
+        if ('delta' in attrs) == ('stock' in attrs):
+            raise serializers.ValidationError('Give exactly one of "delta" or "stock".')
+        return attrs
+
+
+class BulkStockAdjustmentSerializer(serializers.Serializer):
+    """Serializer for bulk stock adjustments ({"adjustments": [...]})"""
+    adjustments = StockAdjustmentSerializer(many=True, allow_empty=False)
+    
+    def validate_adjustments(self, value):
+        max_adjustments = getattr(settings, 'BOOK_STOCK_ADJUST_MAX', 10000)
+        if len(value) > max_adjustments:
+            raise serializers.ValidationError(f'At most {max_adjustments} adjustments per request.')
+        ids = [adjustment['id'] for adjustment in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Each book may appear only once.')
+        return value
+
+
+class BookChangeSerializer(serializers.ModelSerializer):
+    """Serializer for change feed entries"""
+    
+    class Meta:
+        model = BookChange
+        fields = ['id', 'book_id', 'operation', 'data', 'created_at']
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    """Serializer for stock reservations"""
+    
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'book_id', 'quantity', 'status', 'expires_at', 'created_at']
+
+
+class ReserveStockSerializer(serializers.Serializer):
+    """Serializer for reserving stock"""
+    quantity = serializers.IntegerField(default=1, min_value=1)
+    ttl = serializers.IntegerField(required=False, min_value=1)
+    
+    def validate_ttl(self, value):
+        max_ttl = getattr(settings, 'BOOK_RESERVATION_MAX_TTL', 3600)
+        if value > max_ttl:
+            raise serializers.ValidationError(f'Maximum TTL is {max_ttl} seconds.')
+        return value
+
+
+class ReserveItemSerializer(serializers.Serializer):
+    """One book of a bulk reservation"""
+    book_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(default=1, min_value=1)
+
+
+class BulkReserveStockSerializer(ReserveStockSerializer):
+    """Serializer for reserving several books at once ({"items": [...], "ttl": 900})"""
+    quantity = None
+    items = ReserveItemSerializer(many=True, allow_empty=False)
+    
+    def validate_items(self, value):
+        max_items = getattr(settings, 'BOOK_RESERVE_MAX_ITEMS', 100)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f'At most {max_items} books per request.')
+        book_ids = [item['book_id'] for item in value]
+        if len(set(book_ids)) != len(book_ids):
+            raise serializers.ValidationError('Each book may appear only once.')
+        return value
+
+
+class ReleaseReservationsSerializer(serializers.Serializer):
+    """Serializer for releasing several reservations ({"ids": [...]})"""
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=1000)
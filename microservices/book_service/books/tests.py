@@ -1,3 +1,341 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from service_common.db_pool import ConnectionPool, PoolTimeout
+from book_service.db_routing import PIN_COOKIE, LeastLoaded, RoundRobin, pin_to_primary, wants_primary
+from .models import Book, BookChange, StockReservation
+from .views import BookViewSet
 
-# Create your tests here.
+
+class StockReservationTests(TestCase):
+    """Reserve / release / expire behaviour"""
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Hot book', author='A', price='10.00', stock=5)
+        self.client = APIClient()
+
+    def test_reserve_decrements_stock_and_records_change(self):
+        changes = BookChange.objects.count()
+        response = self.client.post(f'/api/v1/books/{self.book.pk}/reserve/', {'quantity': 3, 'ttl': 60}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['book']['stock'], 2)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 2)
+        self.assertEqual(BookChange.objects.count(), changes + 1)
+
+    def test_reserve_more_than_stock_is_rejected(self):
+        response = self.client.post(f'/api/v1/books/{self.book.pk}/reserve/', {'quantity': 6}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 5)
+
+    def test_reserve_unknown_book(self):
+        response = self.client.post('/api/v1/books/999999/reserve/', {'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_release_returns_stock_once(self):
+        reservation = StockReservation.reserve(self.book.pk, 2, 60)
+        url = f'/api/v1/books/reservations/{reservation.pk}/release/'
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 5)
+
+    def test_release_expired(self):
+        kept = StockReservation.reserve(self.book.pk, 1, 60)
+        expired = StockReservation.reserve(self.book.pk, 2, 60)
+        StockReservation.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(StockReservation.release_expired(), 1)
+        self.assertEqual(StockReservation.release_expired(), 0)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 4)
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, StockReservation.ACTIVE)
+
+    def test_bulk_reserve_and_release(self):
+        other = Book.objects.create(title='Other', author='B', price='5.00', stock=3)
+        response = self.client.post('/api/v1/books/reserve/', {
+            'items': [{'book_id': self.book.pk, 'quantity': 2}, {'book_id': other.pk, 'quantity': 3}],
+            'ttl': 60
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['book']['stock'] for item in response.data['data']], [3, 0])
+
+        ids = [item['id'] for item in response.data['data']]
+        response = self.client.post('/api/v1/books/reservations/release/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['released'], 2)
+        response = self.client.post('/api/v1/books/reservations/release/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['released'], 0)
+        self.assertEqual(sorted(Book.objects.values_list('stock', flat=True)), [3, 5])
+
+    def test_bulk_reserve_is_all_or_nothing(self):
+        response = self.client.post('/api/v1/books/reserve/', {
+            'items': [
+                {'book_id': self.book.pk, 'quantity': 2},
+                {'book_id': self.book.pk + 1000, 'quantity': 1},
+                {'book_id': self.book.pk + 2000, 'quantity': 1}
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([error['status'] for error in response.data['errors']], ['not_found', 'not_found'])
+
+        response = self.client.post('/api/v1/books/reserve/', {
+            'items': [{'book_id': self.book.pk, 'quantity': 6}]
+        }, format='json')
+        self.assertEqual(response.data['errors'], [
+            {'book_id': self.book.pk, 'status': 'insufficient_stock', 'available': 5}
+        ])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class BookSearchTests(TestCase):
+    """Full-text search over title and author"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.potter = Book.objects.create(title='Harry Potter and the Goblet', author='J. Rowling', price='10.00')
+        self.about = Book.objects.create(title='A book about wizards', author='Harry Potter', price='10.00')
+        Book.objects.create(title='Dune', author='Frank Herbert', price='10.00')
+
+    def search(self, **params):
+        return self.client.get('/api/v1/books/search/', params)
+
+    def test_last_term_is_prefix_and_titles_rank_first(self):
+        self.assertEqual(self.search(q='harr potter').data['data'], [])
+        response = self.search(q='harry pot')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['id'] for book in response.data['data']], [self.potter.pk, self.about.pk])
+
+    def test_index_follows_writes(self):
+        self.potter.title = 'Goblet of Fire'
+        self.potter.save()
+        Book.objects.filter(pk=self.about.pk).update(title='Wizards and dunes')
+        self.assertEqual([book['id'] for book in self.search(q='harry').data['data']], [self.about.pk])
+        self.assertEqual(len(self.search(q='dune').data['data']), 2)
+        self.potter.delete()
+        self.assertEqual(self.search(q='goblet').data['data'], [])
+
+    def test_pagination_and_validation(self):
+        first = self.search(q='harry', page_size=1)
+        second = self.search(q='harry', page_size=1, page=2)
+        self.assertTrue(first.data['has_more'])
+        self.assertFalse(second.data['has_more'])
+        self.assertNotEqual(first.data['data'], second.data['data'])
+        self.assertEqual(self.search(q='  ').status_code, 400)
+        self.assertEqual(self.search(q='harry', page=0).status_code, 400)
+
+
+class BulkStockAdjustmentTests(TestCase):
+    """POST /books/stock/"""
+
+    def test_applies_matching_versions_and_reports_conflicts(self):
+        first = Book.objects.create(title='First', author='A', price='5.00', stock=10)
+        second = Book.objects.create(title='Second', author='B', price='5.00', stock=1)
+        response = APIClient().post('/api/v1/books/stock/', {'adjustments': [
+            {'id': first.pk, 'expected_version': 1, 'delta': -3},
+            {'id': second.pk, 'expected_version': 2, 'stock': 50},
+            {'id': second.pk + 1, 'expected_version': 1, 'stock': 5},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['status'] for row in response.data['data']], ['updated', 'conflict', 'not_found'])
+        self.assertEqual(
+            [response.data[key] for key in ('updated', 'conflicts', 'insufficient_stock', 'not_found')],
+            [1, 1, 0, 1]
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.stock, first.version), (7, 2))
+        self.assertEqual((second.stock, second.version), (1, 1))
+        self.assertEqual(BookChange.objects.filter(book_id=first.pk, operation=BookChange.UPDATE).count(), 1)
+
+        response = APIClient().post('/api/v1/books/stock/', {'adjustments': [
+            {'id': first.pk, 'expected_version': 2, 'delta': -8},
+        ]}, format='json')
+        self.assertEqual(response.data['data'][0]['status'], 'insufficient_stock')
+        self.assertEqual((response.data['conflicts'], response.data['insufficient_stock']), (0, 1))
+
+
+class BookVersionTests(TestCase):
+    """Updates never overwrite a concurrent write"""
+
+    def test_put_racing_a_stock_adjustment_is_rejected(self):
+        book = Book.objects.create(title='Racy', author='A', price='5.00', stock=10)
+        perform_update = BookViewSet.perform_update
+
+        def adjust_then_update(view, serializer):
+            # The PUT has read version 1; a warehouse sync lands before it writes
+            Book.adjust_stock([{'id': book.pk, 'expected_version': 1, 'delta': -4}])
+            perform_update(view, serializer)
+
+        payload = {'title': 'Racy', 'author': 'A', 'price': '6.00', 'stock': 10}
+        with mock.patch.object(BookViewSet, 'perform_update', adjust_then_update):
+            response = APIClient().put(f'/api/v1/books/{book.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 2)
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.version, str(book.price)), (6, 2, '5.00'))
+
+        response = APIClient().patch(f'/api/v1/books/{book.pk}/', {'price': '6.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.version, str(book.price)), (6, 3, '6.00'))
+
+
+class BookChangeRetentionTests(TestCase):
+    """prune_book_changes keeps the latest change of every book"""
+
+    def test_superseded_old_changes_are_deleted(self):
+        kept = Book.objects.create(title='Kept', author='A', price='5.00', stock=1)
+        kept.stock = 2
+        kept.save()
+        gone = Book.objects.create(title='Gone', author='A', price='5.00', stock=1)
+        gone.delete()
+        BookChange.objects.update(created_at=timezone.now() - timedelta(days=8))
+        young = Book.objects.create(title='Young', author='A', price='5.00', stock=1)
+        young.stock = 2
+        young.save()  # superseded, but within the retention period
+
+        call_command('prune_book_changes', days=7, stdout=open(os.devnull, 'w'))
+        self.assertEqual(
+            list(BookChange.objects.values_list('book_id', 'operation', 'data__stock')),
+            [(kept.pk, BookChange.UPDATE, 2), (young.pk, BookChange.CREATE, 1), (young.pk, BookChange.UPDATE, 2)]
+        )
+
+
+class ImportBooksTests(TestCase):
+    """manage.py import_books"""
+
+    def import_feed(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        call_command('import_books', f.name, batch_size=2, stdout=mock.Mock(), stderr=mock.Mock())
+
+    def test_upserts_by_isbn_and_records_changes(self):
+        existing = Book.objects.create(isbn='9780000000001', title='Old', author='A', price='5.00', stock=7)
+        self.import_feed(
+            'isbn,title,author,price,stock\n'
+            '978-0-00-000000-1,New,A,6.00,\n'
+            '9780000000002,Second,B,3.50,4\n'
+            'not-an-isbn,Bad,C,1.00,1\n'
+        )
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.stock, existing.version), ('New', 7, 2))
+        self.assertEqual(Book.objects.get(isbn='9780000000002').stock, 4)
+        self.assertEqual(list(BookChange.objects.values_list('operation', flat=True)), ['create', 'create', 'update'])
+
+        self.import_feed('isbn,title,author,price\n9780000000002,Second,B,3.50\n')
+        self.assertEqual(BookChange.objects.count(), 3)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Replica strategies and read-your-writes pinning"""
+
+    def test_strategies(self):
+        round_robin = RoundRobin(['r1', 'r2'])
+        self.assertEqual([round_robin.acquire() for _ in range(4)], ['r1', 'r2', 'r1', 'r2'])
+        least_loaded = LeastLoaded(['r1', 'r2'])
+        self.assertEqual(least_loaded.acquire(), 'r1')
+        self.assertEqual(least_loaded.acquire(), 'r2')
+        least_loaded.release('r2')
+        self.assertEqual(least_loaded.acquire(), 'r2')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        factory = RequestFactory()
+        self.assertFalse(wants_primary(factory.get('/')))
+        self.assertTrue(wants_primary(factory.get('/', HTTP_X_READ_CONSISTENCY='primary')))
+        cookie = pin_to_primary(HttpResponse()).cookies[PIN_COOKIE].value
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = cookie
+        self.assertTrue(wants_primary(request))
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertFalse(wants_primary(request))
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Bounded reuse of raw connections"""
+
+    def test_reuses_connections_up_to_max_size(self):
+        pool = ConnectionPool('test', max_size=1, timeout=0.05, max_lifetime=300)
+        opened = []
+
+        def connect():
+            opened.append(mock.Mock())
+            return opened[-1]
+
+        raw = pool.checkout(connect, lambda raw: True, health_check=True)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(connect, lambda raw: True, health_check=True)
+        pool.checkin(raw, reusable=True)
+        self.assertIs(pool.checkout(connect, lambda raw: True, health_check=True), raw)
+        pool.checkin(raw, reusable=True)
+
+        # A dead idle connection is replaced without growing the pool
+        replacement = pool.checkout(connect, lambda raw: False, health_check=True)
+        self.assertIsNot(replacement, raw)
+        raw.close.assert_called_once()
+        self.assertEqual((len(opened), pool.size), (2, 1))
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """Many threads reserving one hot book at once"""
+    THREADS = 16
+    ATTEMPTS = 25  # per thread
+    STOCK = 100
+
+    def test_hot_book_is_never_oversold(self):
+        book = Book.objects.create(title='Hot book', author='A', price='10.00', stock=self.STOCK)
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []  # (finished_at, reserved)
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.ATTEMPTS):
+                    reservation = StockReservation.reserve(book.pk, 1, 60)
+                    with lock:
+                        outcomes.append((time.monotonic(), reservation is not None))
+            except Exception as e:  # surfaced through the assertion below
+                errors.append(e)
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(outcomes), self.THREADS * self.ATTEMPTS)
+        self.assertEqual(sum(1 for _, reserved in outcomes if reserved), self.STOCK)
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 0)
+        self.assertEqual(
+            StockReservation.objects.filter(book=book).aggregate(total=Sum('quantity'))['total'],
+            self.STOCK
+        )
+        self.assertEqual(BookChange.objects.filter(book_id=book.pk).count(), self.STOCK + 1)
+
+        # Throughput must not collapse as contention goes on: compare the
+        # first and second half of the attempts.
+        finished = sorted(at for at, _ in outcomes)
+        half = len(finished) // 2
+        first_rate = half / max(finished[half - 1] - started, 1e-6)
+        second_rate = (len(finished) - half) / max(finished[-1] - finished[half - 1], 1e-6)
+        self.assertGreater(second_rate, first_rate / 10)
@@ -1,33 +1,73 @@
 """Views for Book API"""
+import base64
+import hashlib
+import json
+import zlib
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from .models import Book
-from .serializers import BookSerializer
+from book_service.db_routing import ReplicaReadsMixin
+from .models import Book, BookChange, StockReservation
+from .search import search_book_ids, search_terms
+from .serializers import (
+    BookSerializer,
+    BookChangeSerializer,
+    BulkReserveStockSerializer,
+    BulkStockAdjustmentSerializer,
+    ReleaseReservationsSerializer,
+    ReserveStockSerializer,
+    StockReservationSerializer
+)
 
 
-class BookViewSet(viewsets.ModelViewSet):
+# Catalog sort keys; each has a (key, id) index for keyset pagination
+CATALOG_SORT_KEYS = ('id', 'title', 'author', 'price')
+
+
+class BookViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     ViewSet for Book CRUD operations
     """
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [AllowAny]
+    # Read-only actions served by a read replica (when READ_REPLICAS has any)
+    replica_actions = ('list', 'retrieve', 'get_by_id', 'catalog', 'batch', 'search')
     
     def retrieve(self, request, *args, **kwargs):
         """Override retrieve to return consistent format"""
         try:
             instance = self.get_object()
+            last_modified = instance.updated_at.timestamp()
+            not_modified = get_conditional_response(
+                request, etag=instance.etag, last_modified=last_modified
+            )
+            if not_modified is not None:
+                return with_validators(not_modified, instance.etag, last_modified)
             serializer = self.get_serializer(instance)
-            return Response(
+            response = Response(
                 {
                     'success': True,
                     'data': serializer.data
                 },
                 status=status.HTTP_200_OK
             )
+            return with_validators(response, instance.etag, last_modified)
         except Book.DoesNotExist:
             return Response(
                 {
@@ -37,15 +77,407 @@ class BookViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    def update(self, request, *args, **kwargs):
+        """Update a book (PUT/PATCH); 409 if it changed after it was read"""
+        try:
+            return super().update(request, *args, **kwargs)
+        except Book.VersionConflict:
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Book was changed concurrently, read it again and retry',
+                    'version': Book.objects.filter(pk=kwargs.get('pk')).values_list('version', flat=True).first()
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+    
     @action(detail=False, methods=['get'])
     def catalog(self, request):
-        """Get all books (catalog)"""
-        books = self.get_queryset()
-        serializer = self.get_serializer(books, many=True)
+        """Get the catalog one page at a time (?sort=title&page_size=500&cursor=...&fields=title,price)
+        
+        Keyset pagination: ``cursor`` is the opaque ``next_cursor`` of the
+        previous page and resumes after its last (sort key, id) pair.
+        """
+        try:
+            sort = request.query_params.get('sort', 'id')
+            if sort not in CATALOG_SORT_KEYS:
+                raise ValueError(f'Invalid sort key. Choose from: {", ".join(CATALOG_SORT_KEYS)}')
+            fields = parse_fields(request.query_params.get('fields'))
+            page_size = int(request.query_params.get('page_size', 100))
+            cursor = decode_cursor(request.query_params.get('cursor'), sort)
+        except ValueError as e:
+            return Response(
+                {
+                    'success': False,
+                    'message': str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        page_size = max(1, min(page_size, getattr(settings, 'BOOK_CATALOG_MAX_PAGE_SIZE', 1000)))
+        
+        etag, last_modified = catalog_validators(request.query_params)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return with_validators(not_modified, etag, last_modified)
+        
+        books = Book.objects.order_by(*dict.fromkeys([sort, 'id']))
+        if fields is not None:
+            books = books.only(*projected_columns(fields, sort))
+        if cursor is not None:
+            if sort == 'id':
+                books = books.filter(id__gt=cursor[0])
+            else:
+                value, last_id = cursor
+                books = books.filter(Q(**{f'{sort}__gt': value}) | Q(**{sort: value, 'id__gt': last_id}))
+        books = list(books[:page_size + 1])
+        has_more = len(books) > page_size
+        books = books[:page_size]
+        serializer = self.get_serializer(books, many=True, fields=fields)
+        response = Response(
+            {
+                'success': True,
+                'data': serializer.data,
+                'next_cursor': encode_cursor(books[-1], sort) if has_more else None,
+                'has_more': has_more
+            },
+            status=status.HTTP_200_OK
+        )
+        return with_validators(response, etag, last_modified)
+    
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """Get several books by ID (?ids=1,2,3&fields=title,price)"""
+        try:
+            ids = parse_id_list(request.query_params.get('ids', ''))
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response(
+                {
+                    'success': False,
+                    'message': str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        max_ids = getattr(settings, 'BOOK_BATCH_MAX_IDS', 200)
+        if len(ids) > max_ids:
+            return Response(
+                {
+                    'success': False,
+                    'message': f'Too many ids. Maximum per request: {max_ids}'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        books = {book.id: book for book in Book.objects.filter(pk__in=ids)}
+        found = [books[book_id] for book_id in ids if book_id in books]
+        serializer = self.get_serializer(found, many=True, fields=fields)
+        return Response(
+            {
+                'success': True,
+                'data': serializer.data,
+                'missing': [book_id for book_id in ids if book_id not in books]
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Full-text search over title and author (?q=harry pot&page=1&page_size=20&fields=title,price)
+        
+        Every word of ``q`` must match a word of the title or author (the
+        last one may be the start of a word); results are ordered by relevance.
+        """
+        try:
+            terms = search_terms(request.query_params.get('q', ''))
+            fields = parse_fields(request.query_params.get('fields'))
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', 20))
+            if page < 1:
+                raise ValueError('Parameter "page" must be at least 1')
+        except ValueError as e:
+            return Response(
+                {
+                    'success': False,
+                    'message': str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        page_size = max(1, min(page_size, getattr(settings, 'BOOK_SEARCH_MAX_PAGE_SIZE', 100)))
+        offset = (page - 1) * page_size
+        max_results = getattr(settings, 'BOOK_SEARCH_MAX_RESULTS', 1000)
+        if offset >= max_results:
+            return Response(
+                {
+                    'success': False,
+                    'message': f'Only the first {max_results} results can be paged through; refine the query'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        ids = search_book_ids(terms, offset, page_size + 1)
+        has_more = len(ids) > page_size and offset + page_size < max_results
+        ids = ids[:page_size]
+        books = Book.objects.all()
+        if fields is not None:
+            books = books.only(*projected_columns(fields, 'id'))
+        books = books.in_bulk(ids)
+        found = [books[book_id] for book_id in ids if book_id in books]
+        serializer = self.get_serializer(found, many=True, fields=fields)
+        return Response(
+            {
+                'success': True,
+                'data': serializer.data,
+                'page': page,
+                'has_more': has_more
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Ordered change feed from the outbox (?after=<cursor>&limit=500)"""
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = int(request.query_params.get('limit', 500))
+        except ValueError:
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Parameters "after" and "limit" must be integers'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, getattr(settings, 'BOOK_CHANGE_FEED_MAX_LIMIT', 1000)))
+        
+        # Ids are assigned before commit, so a recent change with a lower id
+        # may still become visible; only serve changes old enough to be settled.
+        settle = getattr(settings, 'BOOK_CHANGE_FEED_SETTLE_SECONDS', 1)
+        changes = list(
+            BookChange.objects
+            .filter(id__gt=after, created_at__lte=timezone.now() - timedelta(seconds=settle))
+            .order_by('id')[:limit + 1]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        serializer = BookChangeSerializer(changes, many=True)
+        return Response(
+            {
+                'success': True,
+                'data': serializer.data,
+                'next_cursor': changes[-1].id if changes else after,
+                'has_more': has_more
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole catalog as NDJSON (?since=<ISO datetime>)
+        
+        Books are read in keyset batches and written out as they are read,
+        so memory use does not grow with the catalog. The response carries
+        the change feed position taken before the export started
+        (``X-Book-Changes-Cursor``); replaying the feed from there catches a
+        copy up with writes made while it was streaming.
+        """
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response(
+                    {
+                        'success': False,
+                        'message': 'Parameter "since" must be an ISO 8601 datetime'
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        
+        cursor = BookChange.objects.aggregate(position=Max('id'))['position'] or 0
+        chunk_size = getattr(settings, 'BOOK_EXPORT_CHUNK_SIZE', 1000)
+        content = export_lines(since, chunk_size)
+        gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if gzipped:
+            content = gzip_stream(content)
+        response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+        response['X-Book-Changes-Cursor'] = str(cursor)
+        response['Vary'] = 'Accept-Encoding'
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='stock')
+    def adjust_stock(self, request):
+        """Adjust the stock of many books at once with optimistic concurrency
+        
+        {"adjustments": [{"id": 1, "expected_version": 3, "delta": -2},
+                         {"id": 2, "expected_version": 7, "stock": 40}]}
+        
+        Each row is applied only if the book is still at ``expected_version``
+        (its ``version`` field). The response lists every row with its
+        status (``updated``, ``conflict``, ``insufficient_stock`` or
+        ``not_found``) and the book's current version and stock, so
+        conflicting rows can be re-read and retried.
+        """
+        serializer = BulkStockAdjustmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'success': False,
+                    'errors': serializer.errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        results = Book.adjust_stock(
+            serializer.validated_data['adjustments'],
+            chunk_size=getattr(settings, 'BOOK_STOCK_ADJUST_CHUNK_SIZE', 500)
+        )
+        counts = Counter(result['status'] for result in results)
+        return Response(
+            {
+                'success': True,
+                'data': results,
+                'updated': counts['updated'],
+                'conflicts': counts['conflict'],
+                'insufficient_stock': counts['insufficient_stock'],
+                'not_found': counts['not_found']
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=True, methods=['post'])
+    def reserve(self, request, pk=None):
+        """Reserve stock for a limited time ({"quantity": 2, "ttl": 900})"""
+        serializer = ReserveStockSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'success': False,
+                    'errors': serializer.errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        quantity = serializer.validated_data['quantity']
+        ttl = serializer.validated_data.get('ttl', getattr(settings, 'BOOK_RESERVATION_DEFAULT_TTL', 900))
+        
+        try:
+            reservation = StockReservation.reserve(pk, quantity, ttl)
+        except (Book.DoesNotExist, ValueError):
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Book not found'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if reservation is None:
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Insufficient stock',
+                    'available': Book.objects.filter(pk=pk).values_list('stock', flat=True).first()
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        data = StockReservationSerializer(reservation).data
+        data['book'] = BookSerializer(reservation.book).data
+        return Response(
+            {
+                'success': True,
+                'data': data
+            },
+            status=status.HTTP_201_CREATED
+        )
+    
+    @action(detail=False, methods=['post'], url_path='reserve')
+    def reserve_many(self, request):
+        """Reserve stock of several books at once, all or nothing
+        
+        {"items": [{"book_id": 1, "quantity": 2}, {"book_id": 5, "quantity": 1}], "ttl": 900}
+        
+        Responds 201 with one reservation per item, or 409 with one error
+        per unknown (``not_found``) or short (``insufficient_stock``) book
+        and nothing reserved.
+        """
+        serializer = BulkReserveStockSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'success': False,
+                    'errors': serializer.errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        items = {item['book_id']: item['quantity'] for item in serializer.validated_data['items']}
+        ttl = serializer.validated_data.get('ttl', getattr(settings, 'BOOK_RESERVATION_DEFAULT_TTL', 900))
+        
+        reservations, failures = StockReservation.reserve_many(items, ttl)
+        if failures:
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Some books could not be reserved',
+                    'errors': failures
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        data = []
+        for reservation in reservations:
+            item = StockReservationSerializer(reservation).data
+            item['book'] = BookSerializer(reservation.book).data
+            data.append(item)
+        return Response(
+            {
+                'success': True,
+                'data': data
+            },
+            status=status.HTTP_201_CREATED
+        )
+    
+    @action(detail=False, methods=['post'], url_path='reservations/release')
+    def release_reservations(self, request):
+        """Release several reservations at once ({"ids": [...]}); inactive ones are skipped"""
+        serializer = ReleaseReservationsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'success': False,
+                    'errors': serializer.errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        released = StockReservation.release_many(serializer.validated_data['ids'])
+        return Response(
+            {
+                'success': True,
+                'released': released
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['post'], url_path='reservations/(?P<reservation_id>[0-9a-fA-F-]+)/release')
+    def release_reservation(self, request, reservation_id=None):
+        """Release a reservation before it expires"""
+        try:
+            reservation = StockReservation.objects.get(pk=reservation_id)
+        except (StockReservation.DoesNotExist, ValidationError):
+            return Response(
+                {
+                    'success': False,
+                    'message': 'Reservation not found'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+        released = reservation.release()
         return Response(
             {
                 'success': True,
-                'data': serializer.data
+                'message': 'Reservation released' if released else f'Reservation already {reservation.status}',
+                'data': StockReservationSerializer(reservation).data
             },
             status=status.HTTP_200_OK
         )
@@ -53,4 +485,115 @@ class BookViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def get_by_id(self, request, pk=None):
         """Get book by ID"""
-        return self.retrieve(request, pk=pk)
\ No newline at end of file
+        return self.retrieve(request, pk=pk)
+
+
+def catalog_validators(params=None):
+    """ETag and Last-Modified for the catalog (or one page of it)
+    
+    Every Book write appends to the BookChange outbox, so the latest change
+    id works as a catalog-wide version counter. Query parameters are folded
+    into the ETag so each page/projection validates separately.
+    """
+    latest = BookChange.objects.aggregate(version=Max('id'), modified=Max('created_at'))
+    etag = f'catalog-v{latest["version"] or 0}'
+    if params:
+        query = urlencode(sorted(params.items()))
+        etag += '-' + hashlib.sha1(query.encode()).hexdigest()[:12]
+    last_modified = latest['modified'].timestamp() if latest['modified'] else None
+    return f'"{etag}"', last_modified
+
+
+def with_validators(response, etag, last_modified=None):
+    """Set ETag/Last-Modified headers on a response"""
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def parse_id_list(value):
+    """Parse a comma-separated list of book IDs, dropping duplicates"""
+    ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f'Invalid book id: {part}')
+        ids.append(int(part))
+    if not ids:
+        raise ValueError('Query parameter "ids" is required')
+    return list(dict.fromkeys(ids))
+
+
+def parse_fields(value):
+    """Parse the ``fields`` projection parameter"""
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = set(fields) - set(BookSerializer.Meta.fields)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return fields
+
+
+def projected_columns(fields, sort):
+    """Model fields to load for a ``fields`` projection"""
+    columns = {'id', sort}
+    for name in fields:
+        columns.add('stock' if name == 'is_available' else name)
+    return sorted(columns)
+
+
+def encode_cursor(book, sort):
+    """Opaque keyset cursor pointing just after ``book`` in ``sort`` order"""
+    position = [book.pk] if sort == 'id' else [str(getattr(book, sort)), book.pk]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value, sort):
+    """Decode a cursor from ``encode_cursor``; None when no cursor is given"""
+    if not value:
+        return None
+    try:
+        position = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        expected = 1 if sort == 'id' else 2
+        if not isinstance(position, list) or len(position) != expected or not isinstance(position[-1], int):
+            raise ValueError
+        if sort == 'price':
+            position[0] = Decimal(position[0])
+    except (ValueError, TypeError, ArithmeticError):
+        raise ValueError('Invalid cursor')
+    return position
+
+
+EXPORT_FIELDS = ('id', 'isbn', 'title', 'author', 'price', 'stock', 'version', 'updated_at')
+
+
+def export_lines(since=None, chunk_size=1000):
+    """Yield the catalog as NDJSON, one chunk of ``chunk_size`` lines at a time"""
+    books = Book.objects.order_by('id').values(*EXPORT_FIELDS)
+    if since is not None:
+        books = books.filter(updated_at__gte=since)
+    last_id = 0
+    while True:
+        rows = list(books.filter(id__gt=last_id)[:chunk_size])
+        if not rows:
+            return
+        lines = []
+        for row in rows:
+            row['is_available'] = row['stock'] > 0
+            lines.append(json.dumps(row, cls=DjangoJSONEncoder, separators=(',', ':')))
+        last_id = rows[-1]['id']
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def gzip_stream(chunks):
+    """Gzip-compress a stream of byte chunks, flushing after each chunk"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
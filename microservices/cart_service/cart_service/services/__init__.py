@@ -1,5 +1,21 @@
 """Service clients"""
 from .book_service_client import BookServiceClient
+from .book_lookup import BookLookup
+from .book_cache import book_cache_stats
 from .customer_service_client import CustomerServiceClient
+from .customer_tokens import customer_token_error, uses_token
+from .resilience import CircuitOpenError, breaker_stats
+from .transport import get_session, pool_stats
 
-__all__ = ['BookServiceClient', 'CustomerServiceClient']
\ No newline at end of file
+__all__ = [
+    'BookServiceClient',
+    'BookLookup',
+    'CustomerServiceClient',
+    'CircuitOpenError',
+    'customer_token_error',
+    'uses_token',
+    'book_cache_stats',
+    'breaker_stats',
+    'get_session',
+    'pool_stats',
+]
\ No newline at end of file
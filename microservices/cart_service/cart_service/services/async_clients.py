@@ -0,0 +1,197 @@
+"""Async service clients used by the ASGI cart views
+
+Calls made for one request share an ``asyncio.Semaphore`` so they can run
+concurrently without opening an unbounded number of connections.
+"""
+import asyncio
+import time
+import weakref
+import httpx
+from django.conf import settings
+from service_common.metrics import observe_outbound
+from service_common.tracing import client_span
+from .book_cache import MISSING, get_book_cache
+from .resilience import get_breaker
+from .transport import ACCEPT, NO_COOKIES, decode, get_pool_config
+
+
+# One httpx client per event loop and service; httpx clients cannot be
+# shared between loops (runserver runs each async view in its own loop).
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client(service_name):
+    """Return the pooled httpx client for a service on the running loop"""
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(service_name)
+    if client is None:
+        pool_size = get_pool_config(service_name)['POOL_SIZE']
+        client = clients[service_name] = httpx.AsyncClient(
+            headers={'Accept': ACCEPT},
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            )
+        )
+        client.cookies.jar.set_policy(NO_COOKIES)
+    return client
+
+
+def outbound_semaphore():
+    """Semaphore bounding concurrent outbound calls for one request"""
+    return asyncio.Semaphore(getattr(settings, 'ASYNC_OUTBOUND_CONCURRENCY', 10))
+
+
+class AsyncServiceClient:
+    """Base class for async clients"""
+    service_name = None
+
+    def __init__(self, semaphore=None):
+        self.timeout = 5  # seconds
+        self.semaphore = semaphore or outbound_semaphore()
+        self.client = get_async_client(self.service_name)
+
+    async def _get(self, url, params=None):
+        """GET a JSON endpoint; returns (status_code, data) or (None, None) on error"""
+        status_code, data = await self._request('GET', url, params=params)
+        return status_code, data if status_code == 200 else None
+
+    async def _post(self, url, payload=None):
+        """POST JSON; returns (status_code, data) or (None, None) on error"""
+        return await self._request('POST', url, json=payload)
+
+    async def _request(self, method, url, **kwargs):
+        breaker = get_breaker(self.service_name)
+        if not breaker.allow():
+            print(f"Error calling {self.service_name} service: circuit is open")
+            return None, None
+        with client_span(self.service_name, method, url) as (span, headers):
+            start = time.monotonic()
+            failed = True
+            status = None
+            try:
+                async with self.semaphore:
+                    response = await self.client.request(
+                        method, url, headers=headers, timeout=self.timeout, **kwargs
+                    )
+                status = response.status_code
+                failed = status >= 500
+                span['status'] = response.status_code
+                span['bytes'] = len(response.content)
+                if failed or not response.content:
+                    return response.status_code, None
+                return response.status_code, decode(response)
+            except (httpx.HTTPError, ValueError) as e:
+                span['error'] = type(e).__name__
+                print(f"Error calling {self.service_name} service: {e}")
+                return None, None
+            finally:
+                duration = time.monotonic() - start
+                breaker.record(failed, duration)
+                observe_outbound(self.service_name, method, status, duration)
+
+
+class AsyncBookServiceClient(AsyncServiceClient):
+    """Async client to communicate with Book Service"""
+    service_name = 'book'
+
+    def __init__(self, semaphore=None):
+        super().__init__(semaphore)
+        self.base_url = getattr(settings, 'BOOK_SERVICE_URL', 'http://localhost:8002/api/v1')
+        self.chunk_size = getattr(settings, 'ASYNC_BOOK_CHUNK_SIZE', 20)
+        self.cache = get_book_cache()
+
+    async def get_book(self, book_id):
+        """Get book by ID"""
+        book_id = int(book_id)
+        if self.cache is not None:
+            cached = self.cache.peek(book_id)
+            if cached is not None:
+                return None if cached is MISSING else cached
+        status_code, data = await self._get(f'{self.base_url}/books/{book_id}/')
+        book = None
+        if data and data.get('success'):
+            book = data.get('data')
+        if self.cache is not None:
+            self.cache.put(book_id, book if book else (MISSING if status_code == 404 else None))
+        return book
+
+    async def get_books(self, book_ids):
+        """Get several books, fetching chunks of ids concurrently
+
+        Returns a dict mapping book ID to book data, like
+        ``BookServiceClient.get_books``.
+        """
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        books = {}
+        to_fetch = []
+        for book_id in book_ids:
+            cached = self.cache.peek(book_id) if self.cache is not None else None
+            if cached is None:
+                to_fetch.append(book_id)
+            elif cached is not MISSING:
+                books[book_id] = cached
+
+        chunks = [
+            to_fetch[start:start + self.chunk_size]
+            for start in range(0, len(to_fetch), self.chunk_size)
+        ]
+        results = await asyncio.gather(*(self._fetch_chunk(chunk) for chunk in chunks))
+        for chunk_books in results:
+            for book_id, book in chunk_books.items():
+                if self.cache is not None:
+                    self.cache.put(book_id, book)
+                if book is not MISSING:
+                    books[book_id] = book
+        return books
+
+    async def reserve_stock(self, book_id, quantity, ttl=None):
+        """Reserve stock of a book, like ``BookServiceClient.reserve_stock``"""
+        payload = {'quantity': quantity}
+        if ttl:
+            payload['ttl'] = ttl
+        status_code, data = await self._post(f'{self.base_url}/books/{book_id}/reserve/', payload)
+        if status_code == 201 and self.cache is not None:
+            book = data['data']['book']
+            self.cache.put(book['id'], book)
+        return status_code, data
+
+    async def release_reservation(self, reservation_id):
+        """Release a stock reservation; returns True if book-service accepted it"""
+        status_code, _ = await self._post(f'{self.base_url}/books/reservations/{reservation_id}/release/')
+        return status_code == 200
+
+    async def _fetch_chunk(self, book_ids):
+        _, data = await self._get(
+            f'{self.base_url}/books/batch/',
+            params={'ids': ','.join(str(book_id) for book_id in book_ids)}
+        )
+        books = {}
+        if data and data.get('success'):
+            for book in data.get('data', []):
+                books[book['id']] = book
+            for book_id in data.get('missing', []):
+                books[book_id] = MISSING
+        return books
+
+
+class AsyncCustomerServiceClient(AsyncServiceClient):
+    """Async client to communicate with Customer Service"""
+    service_name = 'customer'
+
+    def __init__(self, semaphore=None):
+        super().__init__(semaphore)
+        self.base_url = getattr(settings, 'CUSTOMER_SERVICE_URL', 'http://localhost:8001/api/v1')
+
+    async def get_customer(self, customer_id):
+        """Get customer by ID"""
+        _, data = await self._get(f'{self.base_url}/customers/{customer_id}/')
+        if data and data.get('success'):
+            return data.get('data')
+        return None
+
+    async def validate_customer(self, customer_id):
+        """Validate if customer exists"""
+        customer = await self.get_customer(customer_id)
+        return customer is not None
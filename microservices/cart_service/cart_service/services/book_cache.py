@@ -0,0 +1,384 @@
+"""Process-wide book cache shared across requests
+
+Entries live for ``TTL`` seconds, after which they may still be served for
+``STALE_TTL`` seconds while a background refresh runs (stale-while-revalidate).
+Books that book-service reports as missing (404) are cached for
+``NEGATIVE_TTL`` seconds. Concurrent misses for the same id are coalesced
+into a single upstream call.
+
+Entries keep the ETag they were loaded with; expired entries are kept for
+``KEEP_EXPIRED`` more seconds so single-book reloads can revalidate with
+``If-None-Match`` and reuse the cached value on 304.
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+DEFAULT_CACHE_CONFIG = {
+    'ENABLED': True,
+    'BACKEND': 'memory',     # 'memory' or 'django' (uses CACHES[ALIAS])
+    'ALIAS': 'default',
+    'MAX_ENTRIES': 10000,    # memory backend only
+    'TTL': 60,               # seconds an entry is fresh
+    'STALE_TTL': 30,         # seconds a stale entry may be served while refreshing (0 disables)
+    'NEGATIVE_TTL': 10,      # seconds a 404 is remembered (0 disables)
+    'WAIT_TIMEOUT': 5,       # seconds a coalesced caller waits for the leader
+    'KEEP_EXPIRED': 300,     # seconds an expired entry is kept for revalidation
+}
+
+# Returned by loaders when book-service answered 404 for a book
+MISSING = object()
+
+# Returned by loaders when book-service answered 304 to a revalidation
+NOT_MODIFIED = object()
+
+
+class CacheEntry:
+    """Cached value with its freshness window and validator"""
+    __slots__ = ('value', 'fresh_until', 'stale_until', 'etag')
+
+    def __init__(self, value, fresh_until, stale_until, etag=None):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.etag = etag
+
+
+class MemoryBackend:
+    """Bounded LRU store kept in process memory"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """Store backed by a Django cache alias (locmem, file, memcached, ...)"""
+    MISSING_MARKER = '__missing__'
+
+    def __init__(self, alias, keep_expired):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.keep_expired = keep_expired
+        self.evictions = 0  # not observable through the Django cache API
+
+    def _key(self, key):
+        return f'book-cache:{key}'
+
+    def get(self, key):
+        data = self.cache.get(self._key(key))
+        if data is None:
+            return None
+        value, fresh_until, stale_until = data[:3]
+        etag = data[3] if len(data) > 3 else None
+        # MISSING does not survive pickling, so it is stored as a marker
+        if value == self.MISSING_MARKER:
+            value = MISSING
+        return CacheEntry(value, fresh_until, stale_until, etag)
+
+    def set(self, key, entry):
+        timeout = max(entry.stale_until - time.time(), 1) + self.keep_expired
+        value = self.MISSING_MARKER if entry.value is MISSING else entry.value
+        self.cache.set(
+            self._key(key),
+            (value, entry.fresh_until, entry.stale_until, entry.etag),
+            timeout
+        )
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def __len__(self):
+        return 0
+
+
+class Flight:
+    """In-progress upstream fetch that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+
+
+class BookCache:
+    """TTL cache with negative caching, single-flight and stale-while-revalidate"""
+
+    def __init__(self, config):
+        self.ttl = config['TTL']
+        self.stale_ttl = config['STALE_TTL']
+        self.negative_ttl = config['NEGATIVE_TTL']
+        self.wait_timeout = config['WAIT_TIMEOUT']
+        if config['BACKEND'] == 'django':
+            self.backend = DjangoCacheBackend(config['ALIAS'], config['KEEP_EXPIRED'])
+        else:
+            self.backend = MemoryBackend(config['MAX_ENTRIES'])
+        self.counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'negative_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'refreshes': 0,
+            'revalidated': 0,
+            'load_errors': 0,
+        }
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _lookup(self, key):
+        """Return (entry, is_fresh) or (None, False) when nothing usable is cached"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None, False
+        now = time.time()
+        if now < entry.fresh_until:
+            return entry, True
+        if now < entry.stale_until:
+            return entry, False
+        return None, False
+
+    def _store(self, key, value, etag=None):
+        """Cache a loaded value; transient failures (None) are not cached"""
+        if value is None:
+            self._count('load_errors')
+            return
+        now = time.time()
+        if value is MISSING:
+            if self.negative_ttl <= 0:
+                return
+            entry = CacheEntry(MISSING, now + self.negative_ttl, now + self.negative_ttl)
+        else:
+            fresh_until = now + self.ttl
+            entry = CacheEntry(value, fresh_until, fresh_until + self.stale_ttl, etag)
+        self.backend.set(key, entry)
+
+    def _hit(self, entry, fresh):
+        if entry.value is MISSING:
+            self._count('negative_hits')
+        elif fresh:
+            self._count('hits')
+        else:
+            self._count('stale_hits')
+        return entry.value
+
+    def _claim(self, key):
+        """Register a flight for key; returns (flight, is_leader)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def _land(self, key, flight, value, etag=None):
+        self._store(key, value, etag)
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.value = value
+        flight.done.set()
+
+    def _wait(self, flight):
+        self._count('coalesced')
+        flight.done.wait(self.wait_timeout)
+        return flight.value
+
+    def _load(self, key, loader, previous):
+        """Call a single-key loader, revalidating ``previous`` when it has an ETag"""
+        etag = None
+        if previous is not None and previous.value is not MISSING:
+            etag = previous.etag
+        value, new_etag = loader(key, etag)
+        if value is NOT_MODIFIED:
+            self._count('revalidated')
+            return previous.value, etag
+        return value, new_etag
+
+    def _refresh_in_background(self, key, loader, previous):
+        flight, leader = self._claim(key)
+        if not leader:
+            return
+        self._count('refreshes')
+
+        def refresh():
+            value, etag = None, None
+            try:
+                value, etag = self._load(key, loader, previous)
+            finally:
+                self._land(key, flight, value, etag)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _refresh_many_in_background(self, keys, loader):
+        """Refresh stale keys with one background ``loader(keys)`` call
+
+        Keys already being loaded by another caller are left to that flight.
+        """
+        flights = {}
+        for key in keys:
+            flight, leader = self._claim(key)
+            if leader:
+                flights[key] = flight
+        if not flights:
+            return
+        self._count('refreshes', len(flights))
+
+        def refresh():
+            loaded = {}
+            try:
+                loaded = loader(list(flights))
+            finally:
+                for key, flight in flights.items():
+                    self._land(key, flight, loaded.get(key))
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, key, loader):
+        """Get a value, calling ``loader(key, etag)`` on a miss
+
+        ``loader`` returns ``(value, etag)`` where value is the loaded value,
+        ``MISSING`` for a definitive 404, ``None`` for a transient failure or
+        ``NOT_MODIFIED`` when the ``etag`` it was given is still current.
+        """
+        entry, fresh = self._lookup(key)
+        if entry is not None:
+            if not fresh:
+                self._refresh_in_background(key, loader, entry)
+            return self._hit(entry, fresh)
+
+        self._count('misses')
+        flight, leader = self._claim(key)
+        if not leader:
+            return self._wait(flight)
+        value, etag = None, None
+        try:
+            value, etag = self._load(key, loader, self.backend.get(key))
+        finally:
+            self._land(key, flight, value, etag)
+        return value
+
+    def get_many(self, keys, loader):
+        """Get several values, loading all misses with one ``loader(keys)`` call
+
+        ``loader`` returns a dict of key -> value/``MISSING``; keys absent from
+        it are treated as transient failures. The result only contains keys
+        that have a value or ``MISSING``.
+        """
+        results = {}
+        to_load = []
+        to_refresh = []
+        flights = {}
+        waiting = {}
+        for key in keys:
+            entry, fresh = self._lookup(key)
+            if entry is not None:
+                if not fresh:
+                    to_refresh.append(key)
+                results[key] = self._hit(entry, fresh)
+                continue
+            self._count('misses')
+            flight, leader = self._claim(key)
+            if leader:
+                flights[key] = flight
+                to_load.append(key)
+            else:
+                waiting[key] = flight
+
+        if to_refresh:
+            self._refresh_many_in_background(to_refresh, loader)
+        if to_load:
+            loaded = {}
+            try:
+                loaded = loader(to_load)
+            finally:
+                for key in to_load:
+                    self._land(key, flights[key], loaded.get(key))
+            results.update({key: value for key, value in loaded.items() if key in flights})
+
+        for key, flight in waiting.items():
+            value = self._wait(flight)
+            if value is not None:
+                results[key] = value
+        return results
+
+    def peek(self, key):
+        """Return a cached value (or MISSING) without loading; None when absent or stale"""
+        entry, fresh = self._lookup(key)
+        if entry is None or not fresh:
+            return None
+        return self._hit(entry, fresh)
+
+    def put(self, key, value, etag=None):
+        """Store a value loaded outside of get()/get_many() (e.g. by async clients)"""
+        self._store(key, value, etag)
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['negative_hits'] + stats['misses']
+        served = lookups - stats['misses']
+        stats['hit_ratio'] = round(served / lookups, 4) if lookups else 0.0
+        stats['evictions'] = self.backend.evictions
+        stats['size'] = len(self.backend)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache_config():
+    config = dict(DEFAULT_CACHE_CONFIG)
+    config.update(getattr(settings, 'BOOK_CACHE', {}))
+    return config
+
+
+def get_book_cache():
+    """Return the process-wide book cache, or None when it is disabled"""
+    global _cache
+    if _cache is None:
+        config = get_cache_config()
+        if not config['ENABLED']:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = BookCache(config)
+    return _cache
+
+
+def book_cache_stats():
+    """Book cache counters (empty when the cache is disabled or unused)"""
+    return _cache.stats() if _cache is not None else {}
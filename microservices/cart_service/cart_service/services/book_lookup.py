@@ -0,0 +1,69 @@
+"""Request-scoped book lookups"""
+from .book_service_client import BookServiceClient
+
+
+class BookLookup:
+    """Memoizes book data for the duration of one request
+
+    Every book id is fetched from book-service at most once; missing books
+    are remembered as ``None`` so they are not requested again either.
+    """
+
+    def __init__(self, client=None, local=None):
+        self.client = client or BookServiceClient()
+        # Optional local source (e.g. replicated snapshots) tried before book-service
+        self.local = local
+        self.hits = 0
+        self.misses = 0
+        self.local_hits = 0
+        self._books = {}
+
+    def get(self, book_id):
+        """Get one book, fetching it only on the first access"""
+        book_id = int(book_id)
+        if book_id in self._books:
+            self.hits += 1
+            return self._books[book_id]
+        self.misses += 1
+        book = self._fetch_many([book_id]).get(book_id)
+        self._books[book_id] = book
+        return book
+
+    def get_many(self, book_ids):
+        """Get several books, fetching the unknown ones with one batch request"""
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        missing = [book_id for book_id in book_ids if book_id not in self._books]
+        self.hits += len(book_ids) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            books = self._fetch_many(missing)
+            for book_id in missing:
+                self._books[book_id] = books.get(book_id)
+        return {
+            book_id: self._books[book_id]
+            for book_id in book_ids
+            if self._books[book_id] is not None
+        }
+
+    def _fetch_many(self, book_ids):
+        """Fetch from the local source first, then book-service for the rest"""
+        books = self.local.get_books(book_ids) if self.local is not None else {}
+        self.local_hits += len(books)
+        remaining = [book_id for book_id in book_ids if book_id not in books]
+        if len(remaining) == 1:
+            book = self.client.get_book(remaining[0])
+            if book:
+                books[remaining[0]] = book
+        elif remaining:
+            books.update(self.client.get_books(remaining))
+        return books
+
+    def prime(self, book_ids, books):
+        """Record books fetched elsewhere (e.g. concurrently by async views)"""
+        self.misses += len(book_ids)
+        for book_id in book_ids:
+            self._books[int(book_id)] = books.get(int(book_id))
+
+    def stats_header(self):
+        """Value for the X-Book-Lookup debug header"""
+        return f'hits={self.hits}; misses={self.misses}; local={self.local_hits}'
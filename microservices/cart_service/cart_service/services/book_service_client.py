@@ -1,6 +1,18 @@
 """Book Service API Client"""
+import threading
+from collections import OrderedDict
 import requests
 from django.conf import settings
+from .book_cache import MISSING, NOT_MODIFIED, get_book_cache
+from .resilience import get_resilient_session
+from .transport import decode
+
+
+# Last response per catalog page with its ETag, for conditional refreshes.
+# Bounded so walking a large catalog does not keep all of it in memory.
+CATALOG_VALIDATOR_PAGES = 32
+_catalog_validators = OrderedDict()
+_catalog_validators_lock = threading.Lock()  # shared by all request threads
 
 
 class BookServiceClient:
@@ -9,35 +21,219 @@ class BookServiceClient:
     def __init__(self):
         self.base_url = getattr(settings, 'BOOK_SERVICE_URL', 'http://localhost:8002/api/v1')
         self.timeout = 5  # seconds
+        self.session = get_resilient_session('book')
+        self.batch_size = getattr(settings, 'BOOK_SERVICE_BATCH_SIZE', 200)
+        self.cache = get_book_cache()
     
     def get_book(self, book_id):
-        """Get book by ID"""
+        """Get book by ID (served from the shared book cache when enabled)"""
+        if self.cache is None:
+            book, _ = self._fetch_book(book_id)
+        else:
+            book = self.cache.get(int(book_id), self._fetch_book)
+        return None if book is MISSING else book
+    
+    def get_books(self, book_ids, fields=None):
+        """Get several books by ID in as few requests as possible
+        
+        Returns a dict mapping book ID to book data. Books that do not exist
+        (or could not be fetched) are absent from the result.
+        """
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        if self.cache is None or fields:
+            books = self._fetch_books(book_ids, fields)
+        else:
+            books = self.cache.get_many(book_ids, self._fetch_books)
+        return {book_id: book for book_id, book in books.items() if book is not MISSING}
+    
+    def _fetch_book(self, book_id, etag=None):
+        """Fetch one book, revalidating with ``etag`` when given
+        
+        Returns (book, etag); book is MISSING on 404, NOT_MODIFIED on 304 and
+        None on other failures.
+        """
+        headers = {'If-None-Match': etag} if etag else {}
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/books/{book_id}/',
+                headers=headers,
                 timeout=self.timeout
             )
+            if response.status_code == 304:
+                return NOT_MODIFIED, etag
             if response.status_code == 200:
-                data = response.json()
+                data = decode(response)
                 if data.get('success'):
-                    return data.get('data')
-            return None
+                    return data.get('data'), response.headers.get('ETag')
+            if response.status_code == 404:
+                return MISSING, None
+            return None, None
         except requests.exceptions.RequestException as e:
             print(f"Error calling book service: {e}")
-            return None
+            return None, None
+    
+    def _fetch_books(self, book_ids, fields=None):
+        """Fetch books with batch requests; ids reported missing map to MISSING"""
+        books = {}
+        for start in range(0, len(book_ids), self.batch_size):
+            chunk = book_ids[start:start + self.batch_size]
+            params = {'ids': ','.join(str(book_id) for book_id in chunk)}
+            if fields:
+                params['fields'] = ','.join(fields)
+            try:
+                response = self.session.get(
+                    f'{self.base_url}/books/batch/',
+                    params=params,
+                    timeout=self.timeout
+                )
+                if response.status_code == 200:
+                    data = decode(response)
+                    if data.get('success'):
+                        for book in data.get('data', []):
+                            books[book['id']] = book
+                        for book_id in data.get('missing', []):
+                            books[book_id] = MISSING
+            except requests.exceptions.RequestException as e:
+                print(f"Error calling book service: {e}")
+        return books
+    
+    def reserve_stock(self, book_id, quantity, ttl=None):
+        """Reserve stock of a book
+        
+        Returns (status_code, data): 201 with the reservation (including the
+        updated book), 404 for unknown books, 409 when stock is insufficient,
+        or (None, None) if book-service could not be reached.
+        """
+        payload = {'quantity': quantity}
+        if ttl:
+            payload['ttl'] = ttl
+        try:
+            response = self.session.post(
+                f'{self.base_url}/books/{book_id}/reserve/',
+                json=payload,
+                timeout=self.timeout
+            )
+            data = decode(response) if response.content else None
+            if response.status_code == 201 and self.cache is not None:
+                book = data['data']['book']
+                self.cache.put(book['id'], book)
+            return response.status_code, data
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error calling book service: {e}")
+            return None, None
+    
+    def reserve_stock_many(self, items, ttl=None):
+        """Reserve stock of several books with one call, all or nothing
+        
+        ``items`` maps book ID to quantity. Returns (status_code, data) like
+        ``reserve_stock``: 201 with one reservation per book, 409 with one
+        error per unknown or short book (nothing is reserved then), or
+        (None, None) if book-service could not be reached.
+        """
+        payload = {'items': [{'book_id': book_id, 'quantity': quantity} for book_id, quantity in items.items()]}
+        if ttl:
+            payload['ttl'] = ttl
+        try:
+            response = self.session.post(
+                f'{self.base_url}/books/reserve/',
+                json=payload,
+                timeout=self.timeout
+            )
+            data = decode(response) if response.content else None
+            if response.status_code == 201 and self.cache is not None:
+                for reservation in data['data']:
+                    book = reservation['book']
+                    self.cache.put(book['id'], book)
+            return response.status_code, data
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error calling book service: {e}")
+            return None, None
     
-    def get_book_catalog(self):
-        """Get all books"""
+    def release_reservation(self, reservation_id):
+        """Release a stock reservation; returns True if book-service accepted it"""
         try:
-            response = requests.get(
-                f'{self.base_url}/books/catalog/',
+            response = self.session.post(
+                f'{self.base_url}/books/reservations/{reservation_id}/release/',
+                timeout=self.timeout
+            )
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling book service: {e}")
+            return False
+    
+    def release_reservations(self, reservation_ids):
+        """Release several stock reservations with one call; returns True if book-service accepted it"""
+        try:
+            response = self.session.post(
+                f'{self.base_url}/books/reservations/release/',
+                json={'ids': [str(reservation_id) for reservation_id in reservation_ids]},
+                timeout=self.timeout
+            )
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling book service: {e}")
+            return False
+    
+    def get_book_changes(self, after=0, limit=500):
+        """Read the book change feed after a cursor
+        
+        Returns the feed page (``data``, ``next_cursor``, ``has_more``) or
+        None if book-service could not be reached.
+        """
+        try:
+            response = self.session.get(
+                f'{self.base_url}/books/changes/',
+                params={'after': after, 'limit': limit},
                 timeout=self.timeout
             )
             if response.status_code == 200:
-                data = response.json()
+                data = decode(response)
                 if data.get('success'):
-                    return data.get('data', [])
-            return []
+                    return data
+            return None
         except requests.exceptions.RequestException as e:
             print(f"Error calling book service: {e}")
-            return []
\ No newline at end of file
+            return None
+    
+    def get_book_catalog(self, page_size=500, fields=None, sort='id'):
+        """Iterate over all books, fetching catalog pages lazily
+        
+        Pages are revalidated with their last ETag when still remembered.
+        Iteration stops early if book service cannot be reached.
+        """
+        url = f'{self.base_url}/books/catalog/'
+        params = {'page_size': page_size, 'sort': sort}
+        if fields:
+            params['fields'] = ','.join(fields)
+        while True:
+            page = self._fetch_catalog_page(url, params)
+            if page is None:
+                return
+            yield from page.get('data', [])
+            if not page.get('has_more'):
+                return
+            params['cursor'] = page['next_cursor']
+    
+    def _fetch_catalog_page(self, url, params):
+        key = (url, tuple(sorted(params.items())))
+        with _catalog_validators_lock:
+            etag, cached = _catalog_validators.get(key, (None, None))
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached is not None:
+                return cached
+            if response.status_code == 200:
+                page = decode(response)
+                if page.get('success'):
+                    if response.headers.get('ETag'):
+                        with _catalog_validators_lock:
+                            _catalog_validators.pop(key, None)
+                            _catalog_validators[key] = (response.headers['ETag'], page)
+                            while len(_catalog_validators) > CATALOG_VALIDATOR_PAGES:
+                                _catalog_validators.popitem(last=False)
+                    return page
+            return None
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling book service: {e}")
+            return None
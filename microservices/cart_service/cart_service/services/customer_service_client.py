@@ -1,6 +1,8 @@
 """Customer Service API Client"""
 import requests
 from django.conf import settings
+from .resilience import get_resilient_session
+from .transport import decode
 
 
 class CustomerServiceClient:
@@ -9,16 +11,17 @@ class CustomerServiceClient:
     def __init__(self):
         self.base_url = getattr(settings, 'CUSTOMER_SERVICE_URL', 'http://localhost:8001/api/v1')
         self.timeout = 5  # seconds
+        self.session = get_resilient_session('customer')
     
     def get_customer(self, customer_id):
         """Get customer by ID"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f'{self.base_url}/customers/{customer_id}/',
                 timeout=self.timeout
             )
             if response.status_code == 200:
-                data = response.json()
+                data = decode(response)
                 if data.get('success'):
                     return data.get('data')
             return None
@@ -29,4 +32,20 @@ class CustomerServiceClient:
     def validate_customer(self, customer_id):
         """Validate if customer exists"""
         customer = self.get_customer(customer_id)
-        return customer is not None
\ No newline at end of file
+        return customer is not None
+    
+    def get_revoked_customers(self):
+        """IDs of deleted customers whose tokens must be rejected, or None on error"""
+        try:
+            response = self.session.get(
+                f'{self.base_url}/customers/revoked/',
+                timeout=self.timeout
+            )
+            if response.status_code == 200:
+                data = decode(response)
+                if data.get('success'):
+                    return data.get('data')
+            return None
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling customer service: {e}")
+            return None
@@ -0,0 +1,138 @@
+"""Local verification of customer tokens issued by customer-service
+
+Tokens are ``django.core.signing`` values signed with one of
+``CUSTOMER_TOKEN_KEYS`` (the same list customer-service signs with), so a
+cart request is authenticated without calling customer-service. Deleted
+customers come from customer-service's revocation list. It is loaded once on
+the first token check (tokens are rejected until that succeeds), then
+refreshed in a background thread every ``CUSTOMER_REVOCATION_REFRESH``
+seconds, off the request path.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core import signing
+
+
+TOKEN_SALT = 'customers.token'  # must match customer-service
+
+
+class InvalidToken(Exception):
+    """Token is malformed, has a bad signature or has expired"""
+
+
+def verify_token(token):
+    """Return the customer id carried by a valid token, else raise InvalidToken"""
+    keys = getattr(settings, 'CUSTOMER_TOKEN_KEYS', None) or []
+    if not keys:
+        raise InvalidToken('No token keys configured')
+    try:
+        payload = signing.loads(token, key=keys[0], fallback_keys=keys[1:], salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise InvalidToken('Bad signature')
+    if not isinstance(payload, dict) or not isinstance(payload.get('sub'), int):
+        raise InvalidToken('Malformed token')
+    if payload.get('exp', 0) < time.time():
+        raise InvalidToken('Token has expired')
+    return payload['sub']
+
+
+class RevocationListUnavailable(Exception):
+    """The revocation list has never been loaded, so tokens cannot be trusted yet"""
+
+
+class RevocationList:
+    """Revoked customer ids, refreshed from customer-service off the request path"""
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.customer_ids = frozenset()
+        self.loaded_at = None
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, customer_id):
+        if self.loaded_at is None:
+            self._load()
+        else:
+            self._maybe_refresh()
+        return customer_id in self.customer_ids
+
+    def _load(self):
+        """First load, on the request path; concurrent callers wait for a single fetch"""
+        with self._lock:
+            now = time.monotonic()
+            if self.loaded_at is None and now >= self._next_refresh:
+                # A failed load is retried after refresh_interval, not by every request
+                self._next_refresh = now + self.refresh_interval
+                self.refresh()
+        if self.loaded_at is None:
+            raise RevocationListUnavailable('Revoked customers could not be loaded from customer-service')
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        with self._lock:
+            if now < self._next_refresh:
+                return
+            # Also spaces out retries while customer-service is unavailable
+            self._next_refresh = now + self.refresh_interval
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        from .customer_service_client import CustomerServiceClient
+        customer_ids = CustomerServiceClient().get_revoked_customers()
+        if customer_ids is not None:
+            self.customer_ids = frozenset(customer_ids)
+            self.loaded_at = time.time()
+
+
+_revocations = None
+_revocations_lock = threading.Lock()
+
+
+def get_revocation_list():
+    global _revocations
+    if _revocations is None:
+        with _revocations_lock:
+            if _revocations is None:
+                _revocations = RevocationList(getattr(settings, 'CUSTOMER_REVOCATION_REFRESH', 30))
+    return _revocations
+
+
+def bearer_token(headers):
+    """Token from an ``Authorization: Bearer <token>`` header, or None"""
+    scheme, _, token = headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+def uses_token(headers):
+    """Whether the request is authenticated by token rather than by asking customer-service"""
+    return bearer_token(headers) is not None or getattr(settings, 'CUSTOMER_TOKEN_REQUIRED', False)
+
+
+def customer_token_error(headers, customer_id):
+    """Check the request's token for ``customer_id`` locally
+
+    Returns ``(message, status)`` when the request must be rejected and None
+    when the token is valid. Callers only use this when a token was sent or
+    tokens are required (see ``uses_token``).
+    """
+    token = bearer_token(headers)
+    if token is None:
+        return 'Authentication token required', 401
+    try:
+        token_customer_id = verify_token(token)
+    except InvalidToken:
+        return 'Invalid or expired token', 401
+    if str(token_customer_id) != str(customer_id):
+        return 'Token does not belong to this customer', 403
+    try:
+        if get_revocation_list().is_revoked(token_customer_id):
+            return 'Customer not found', 404
+    except RevocationListUnavailable:
+        return 'Customer service unavailable', 503
+    return None
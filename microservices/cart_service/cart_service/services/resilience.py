@@ -0,0 +1,274 @@
+"""Circuit breaking and hedged requests for outbound service calls
+
+Each downstream service has one ``CircuitBreaker`` per process. It trips
+(``open``) when the failure rate or slow-call rate over the last calls
+exceeds its threshold, rejects calls for ``OPEN_SECONDS`` and then lets a
+few probe calls through (``half_open``) to decide whether to close again.
+Rejected calls raise ``CircuitOpenError``, a ``RequestException``, so the
+clients' existing error handling returns their "unavailable" result at once.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from service_common.metrics import observe_outbound
+from service_common.tracing import client_span
+from .transport import get_service_config, get_session
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+BREAKER_STATES = (CLOSED, OPEN, HALF_OPEN)
+
+DEFAULT_BREAKER_CONFIG = {
+    'ENABLED': True,
+    'FAILURE_RATE_THRESHOLD': 0.5,    # fraction of failed calls that opens the circuit
+    'SLOW_CALL_RATE_THRESHOLD': 0.5,  # fraction of slow calls that opens the circuit
+    'SLOW_CALL_SECONDS': 1.0,         # calls slower than this count as slow
+    'MINIMUM_CALLS': 10,              # calls needed in the window before evaluating rates
+    'WINDOW_SIZE': 50,                # number of recent calls considered
+    'OPEN_SECONDS': 10,               # how long to reject calls before probing
+    'HALF_OPEN_CALLS': 3,             # probe calls allowed while half-open
+}
+
+DEFAULT_HEDGING_CONFIG = {
+    'ENABLED': False,
+    'PERCENTILE': 95,       # hedge after this latency percentile ...
+    'MIN_DELAY': 0.05,      # ... but never sooner than this (seconds)
+    'MIN_SAMPLES': 20,      # latency samples needed before hedging starts
+    'MAX_WORKERS': 16,      # threads available for hedged requests
+}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling a service whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker with failure-rate and slow-call thresholds"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.enabled = config['ENABLED']
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_in_flight = 0
+        self.half_open_successes = 0
+        self.calls = deque(maxlen=config['WINDOW_SIZE'])  # (failed, slow)
+        self.transitions = {}
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        key = f'{self.state}->{state}'
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        self.half_open_in_flight = 0
+        self.half_open_successes = 0
+        if state == CLOSED:
+            self.calls.clear()
+
+    def allow(self):
+        """Return True if a call may be attempted now"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.config['OPEN_SECONDS']:
+                    self.rejected += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.half_open_in_flight >= self.config['HALF_OPEN_CALLS']:
+                    self.rejected += 1
+                    return False
+                self.half_open_in_flight += 1
+            return True
+
+    def record(self, failed, duration):
+        """Record the outcome of an allowed call"""
+        if not self.enabled:
+            return
+        slow = duration >= self.config['SLOW_CALL_SECONDS']
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.half_open_in_flight = max(self.half_open_in_flight - 1, 0)
+                if failed or slow:
+                    self._transition(OPEN)
+                else:
+                    self.half_open_successes += 1
+                    if self.half_open_successes >= self.config['HALF_OPEN_CALLS']:
+                        self._transition(CLOSED)
+                return
+            if self.state != CLOSED:
+                return
+            self.calls.append((failed, slow))
+            if len(self.calls) < self.config['MINIMUM_CALLS']:
+                return
+            failure_rate = sum(1 for f, _ in self.calls if f) / len(self.calls)
+            slow_rate = sum(1 for _, s in self.calls if s) / len(self.calls)
+            if (failure_rate >= self.config['FAILURE_RATE_THRESHOLD']
+                    or slow_rate >= self.config['SLOW_CALL_RATE_THRESHOLD']):
+                self._transition(OPEN)
+
+    def stats(self):
+        with self._lock:
+            calls = len(self.calls)
+            return {
+                'state': self.state,
+                'rejected': self.rejected,
+                'transitions': dict(self.transitions),
+                'window_calls': calls,
+                'failure_rate': round(sum(1 for f, _ in self.calls if f) / calls, 4) if calls else 0.0,
+                'slow_call_rate': round(sum(1 for _, s in self.calls if s) / calls, 4) if calls else 0.0,
+            }
+
+
+class LatencyTracker:
+    """Recent call latencies, used to pick the hedging delay"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self.samples.append(duration)
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        index = min(int(len(samples) * pct / 100), len(samples) - 1)
+        return samples[index]
+
+
+class ResilientSession:
+    """Wraps a service's pooled session with its circuit breaker and hedging
+
+    Only ``get`` is provided: hedging is only safe for idempotent requests.
+    """
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.session = get_session(service_name)
+        self.breaker_config = get_service_config(
+            'SERVICE_CIRCUIT_BREAKER', DEFAULT_BREAKER_CONFIG, service_name
+        )
+        self.hedging_config = get_service_config(
+            'SERVICE_HEDGING', DEFAULT_HEDGING_CONFIG, service_name
+        )
+        self.breaker = CircuitBreaker(service_name, self.breaker_config)
+        self.latency = LatencyTracker()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._executor = None
+        if self.hedging_config['ENABLED']:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.hedging_config['MAX_WORKERS'],
+                thread_name_prefix=f'hedge-{service_name}'
+            )
+
+    def get(self, url, **kwargs):
+        return self._call('GET', self._get, url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """POST through the circuit breaker (never hedged)"""
+        return self._call('POST', self.session.post, url, **kwargs)
+
+    def _call(self, method, send, url, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'{self.service_name} service circuit is open')
+        with client_span(self.service_name, method, url) as (span, headers):
+            kwargs['headers'] = {**headers, **(kwargs.get('headers') or {})}
+            start = time.monotonic()
+            failed = True
+            status = None
+            try:
+                response = send(url, **kwargs)
+                status = response.status_code
+                failed = status >= 500
+                span['status'] = status
+                span['bytes'] = len(response.content)
+                return response
+            finally:
+                duration = time.monotonic() - start
+                self.breaker.record(failed, duration)
+                observe_outbound(self.service_name, method, status, duration)
+                if not failed:
+                    self.latency.add(duration)
+
+    def _hedge_delay(self):
+        if self._executor is None:
+            return None
+        if len(self.latency.samples) < self.hedging_config['MIN_SAMPLES']:
+            return None
+        delay = self.latency.percentile(self.hedging_config['PERCENTILE'])
+        return max(delay, self.hedging_config['MIN_DELAY'])
+
+    def _get(self, url, **kwargs):
+        delay = self._hedge_delay()
+        if delay is None:
+            return self.session.get(url, **kwargs)
+
+        primary = self._executor.submit(self.session.get, url, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        # Primary is slower than usual: race a second, identical request
+        with self.breaker._lock:
+            self.hedged += 1
+        hedge = self._executor.submit(self.session.get, url, **kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                if future is hedge:
+                    with self.breaker._lock:
+                        self.hedge_wins += 1
+                return future.result()
+        raise error
+
+    def stats(self):
+        stats = self.breaker.stats()
+        with self.breaker._lock:
+            stats['hedged'] = self.hedged
+            stats['hedge_wins'] = self.hedge_wins
+        p95 = self.latency.percentile(95)
+        stats['p95_seconds'] = round(p95, 4) if p95 is not None else None
+        return stats
+
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def get_resilient_session(service_name):
+    """Return the process-wide resilient session for a downstream service"""
+    session = _sessions.get(service_name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(service_name)
+            if session is None:
+                session = _sessions[service_name] = ResilientSession(service_name)
+    return session
+
+
+def get_breaker(service_name):
+    return get_resilient_session(service_name).breaker
+
+
+def breaker_stats():
+    """Circuit breaker state, transition counts and hedging counters per service"""
+    return {name: session.stats() for name, session in list(_sessions.items())}
@@ -0,0 +1,158 @@
+"""Shared HTTP transport for service clients
+
+Every downstream service gets one process-wide ``requests.Session`` with its
+own keep-alive connection pool, so clients can be created freely without
+opening a new TCP connection per call.
+
+Sessions ask for MessagePack (``application/msgpack``, falling back to JSON)
+when the optional ``msgpack`` package is installed; ``decode`` parses either
+body based on the response's ``Content-Type``.
+"""
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+DEFAULT_POOL_CONFIG = {
+    'POOL_SIZE': 20,         # max connections kept per host
+    'POOL_BLOCK': False,     # block instead of opening extra connections when full
+    'MAX_RETRIES': 2,        # retries for idempotent requests
+    'BACKOFF_FACTOR': 0.1,   # seconds, doubled on every retry
+}
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+ACCEPT = f'{MSGPACK_MEDIA_TYPE}, application/json' if msgpack is not None else 'application/json'
+
+# Sessions are shared by every user of the process, so they never keep
+# cookies (e.g. book-service's read-your-writes pin)
+NO_COOKIES = DefaultCookiePolicy(allowed_domains=[])
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+class ResponseDecodeError(requests.exceptions.RequestException, ValueError):
+    """Response body could not be parsed"""
+
+
+def decode(response):
+    """Parsed body of a JSON or MessagePack response (requests or httpx)"""
+    content_type = response.headers.get('Content-Type', '')
+    if msgpack is not None and content_type.startswith(MSGPACK_MEDIA_TYPE):
+        try:
+            return msgpack.unpackb(response.content, raw=False)
+        except ValueError as e:
+            raise ResponseDecodeError(f'Invalid MessagePack body: {e}')
+    return response.json()
+
+
+def get_service_config(setting_name, defaults, service_name):
+    """Merge defaults, global values and per-service overrides of a settings dict
+
+    Top-level keys apply to every service; a nested dict keyed by the service
+    name ('book', 'customer') overrides them for that service only.
+    """
+    config = dict(defaults)
+    overrides = getattr(settings, setting_name, {})
+    config.update({k: v for k, v in overrides.items() if not isinstance(v, dict)})
+    config.update(overrides.get(service_name, {}))
+    return config
+
+
+def get_pool_config(service_name):
+    """Return pool settings for a service (SERVICE_HTTP_POOL)"""
+    return get_service_config('SERVICE_HTTP_POOL', DEFAULT_POOL_CONFIG, service_name)
+
+
+def build_session(config):
+    """Create a session with a bounded pool and retries on GET/HEAD"""
+    retry = Retry(
+        total=config['MAX_RETRIES'],
+        backoff_factor=config['BACKOFF_FACTOR'],
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=config['POOL_SIZE'],
+        pool_block=config['POOL_BLOCK'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers['Connection'] = 'keep-alive'
+    session.headers['Accept'] = ACCEPT
+    session.cookies.set_policy(NO_COOKIES)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(service_name):
+    """Return the process-wide session for a downstream service"""
+    session = _sessions.get(service_name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(service_name)
+            if session is None:
+                session = build_session(get_pool_config(service_name))
+                _sessions[service_name] = session
+    return session
+
+
+def _queued_connections(pool):
+    """(in_use, idle) connections of one urllib3 pool, or None
+
+    urllib3 has no public API for this, so it reads the pool's queue; None
+    when those internals are not what this code expects.
+    """
+    try:
+        queue = pool.pool
+        if queue is None:  # pool was closed
+            return 0, 0
+        # The queue holds idle connections plus None for slots never filled
+        idle = sum(1 for conn in list(queue.queue) if conn is not None)
+        return queue.maxsize - queue.qsize(), idle
+    except (AttributeError, TypeError):
+        return None
+
+
+def pool_stats():
+    """Connection pool statistics per downstream service
+
+    ``in_use`` and ``idle`` are current values; ``created`` and ``reused``
+    are counters since the pool was created.
+    """
+    stats = {}
+    for service_name, session in list(_sessions.items()):
+        totals = {'in_use': 0, 'idle': 0, 'created': 0, 'reused': 0}
+        pools = session.get_adapter('http://').poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:  # evicted meanwhile
+                continue
+            created = getattr(pool, 'num_connections', 0)
+            totals['created'] += created
+            totals['reused'] += max(getattr(pool, 'num_requests', 0) - created, 0)
+            queued = _queued_connections(pool)
+            if queued is not None:
+                totals['in_use'] += queued[0]
+                totals['idle'] += queued[1]
+        stats[service_name] = totals
+    return stats
+
+
+def close_sessions():
+    """Close all sessions (used on shutdown and in tests)"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
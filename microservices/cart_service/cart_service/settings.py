@@ -10,11 +10,19 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+from importlib.util import find_spec
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared modules (metrics, tracing, wire format, db_pool) live in microservices/service_common
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -42,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'service_common.tracing.TracingMiddleware',
+    'service_common.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +95,44 @@ DATABASES = {
     }
 }
 
+# Local SQLite database instead of MySQL (used by loadtest.py), e.g.
+# SERVICE_SQLITE_PATH=/tmp/cart_service.sqlite3 python manage.py runserver
+if os.environ.get('SERVICE_SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['SERVICE_SQLITE_PATH'],
+            'OPTIONS': {
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file, not the default in-memory database: tests with several
+            # threads would otherwise fail with "database table is locked"
+            'TEST': {
+                'NAME': f"{os.environ['SERVICE_SQLITE_PATH']}.test",
+            },
+        }
+    }
+
+# Persistent connections: keep a worker's connection for DB_CONN_MAX_AGE
+# seconds and check it still works before reusing it in the next request.
+# DB_POOL=1 switches to a bounded per-process pool instead
+# (service_common/db_pool), which also reuses connections across the
+# threads of the development server; its stats are served at /metrics.
+DATABASE_POOL = {
+    'ENABLED': os.environ.get('DB_POOL') == '1',
+    'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),  # per process and alias
+    'TIMEOUT': 5,         # seconds to wait for a free connection
+    'MAX_LIFETIME': 300,  # seconds before a connection is replaced
+}
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True
+    if DATABASE_POOL['ENABLED']:
+        database['ENGINE'] = database['ENGINE'].replace('django.db.backends.', 'service_common.db_pool.')
+        database['CONN_MAX_AGE'] = 0  # connections go back to the pool after every request
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -96,8 +144,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'service_common.wire.ContentNegotiation',
 }
 
+# MessagePack for internal calls (clients listing application/msgpack first in
+# Accept) when the optional msgpack package is installed; JSON stays the default
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('service_common.wire.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('service_common.wire.MessagePackParser')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,5 +196,97 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Microservices configuration
-CUSTOMER_SERVICE_URL = 'http://localhost:8001/api/v1'
-BOOK_SERVICE_URL = 'http://localhost:8002/api/v1'
\ No newline at end of file
+CUSTOMER_SERVICE_URL = os.environ.get('CUSTOMER_SERVICE_URL', 'http://localhost:8001/api/v1')
+BOOK_SERVICE_URL = os.environ.get('BOOK_SERVICE_URL', 'http://localhost:8002/api/v1')
+BOOK_SERVICE_BATCH_SIZE = 200  # max ids per batch lookup
+
+# Outbound HTTP connection pools (keys can be overridden per service: 'book', 'customer')
+SERVICE_HTTP_POOL = {
+    'POOL_SIZE': 20,
+    'POOL_BLOCK': False,
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.1,
+}
+
+# Adds an X-Book-Lookup header (book lookup hits/misses) to cart responses
+BOOK_LOOKUP_DEBUG_HEADER = DEBUG
+
+# Cross-request book cache (see cart_service/services/book_cache.py).
+# Set 'BACKEND': 'django' to store entries in CACHES[ALIAS] instead of process memory.
+BOOK_CACHE = {
+    'ENABLED': True,
+    'BACKEND': 'memory',
+    'ALIAS': 'default',
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+    'STALE_TTL': 30,
+    'NEGATIVE_TTL': 10,
+}
+
+# Async cart views: max concurrent outbound calls per request and ids per batch request
+ASYNC_OUTBOUND_CONCURRENCY = 10
+ASYNC_BOOK_CHUNK_SIZE = 20
+
+# Circuit breaker per downstream service (keys can be overridden per service: 'book', 'customer')
+SERVICE_CIRCUIT_BREAKER = {
+    'ENABLED': True,
+    'FAILURE_RATE_THRESHOLD': 0.5,
+    'SLOW_CALL_RATE_THRESHOLD': 0.5,
+    'SLOW_CALL_SECONDS': 1.0,
+    'MINIMUM_CALLS': 10,
+    'WINDOW_SIZE': 50,
+    'OPEN_SECONDS': 10,
+    'HALF_OPEN_CALLS': 3,
+}
+
+# Hedged GET requests: resend after the p95 latency if the first call is still running
+SERVICE_HEDGING = {
+    'ENABLED': False,
+    'PERCENTILE': 95,
+    'MIN_DELAY': 0.05,
+}
+
+# Local book snapshots replicated by `manage.py sync_book_snapshots`; cart views
+# read them instead of calling book-service while replication is at most MAX_AGE seconds behind
+BOOK_SNAPSHOT = {
+    'ENABLED': True,
+    'MAX_AGE': 30,
+    'BATCH_SIZE': 500,
+}
+
+# Batch cart updates (PATCH /carts/customer/<id>/items/)
+CART_BATCH_MAX_OPERATIONS = 100
+
+# Seconds book-service holds stock reserved by add-to-cart (None: book-service default)
+BOOK_RESERVATION_TTL = 900
+
+# Cart summary: subtotals older than this many seconds are reported as possibly stale
+CART_PRICE_MAX_AGE = 300
+
+# Request tracing (spans at /api/v1/traces/; set FILE to also append them as JSONL)
+SERVICE_NAME = 'cart'
+TRACING = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 5000,
+    'FILE': os.environ.get('TRACE_FILE'),
+}
+
+# Prometheus-style metrics at /metrics (set METRICS_DIR when running several
+# worker processes so the scrape merges all of them)
+METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_DIR'),
+    'FLUSH_INTERVAL': 5,
+}
+
+# Signed customer tokens (issued by customer_service at login, verified here
+# without a network call). Keys must match customer_service. Without
+# CUSTOMER_TOKEN_REQUIRED, requests that send no token are still validated by
+# calling customer_service.
+CUSTOMER_TOKEN_KEYS = [key for key in os.environ.get('CUSTOMER_TOKEN_KEYS', '').split(',') if key]
+if not CUSTOMER_TOKEN_KEYS:
+    if not DEBUG:
+        raise ImproperlyConfigured('Set CUSTOMER_TOKEN_KEYS: the development key is only used with DEBUG')
+    CUSTOMER_TOKEN_KEYS = ['dev-customer-token-key']
+CUSTOMER_TOKEN_REQUIRED = os.environ.get('CUSTOMER_TOKEN_REQUIRED', '') == '1'
+CUSTOMER_REVOCATION_REFRESH = 30  # seconds between revocation list refreshes
@@ -1,6 +1,94 @@
 from django.apps import AppConfig
 
 
+CACHE_LOOKUPS = ('hits', 'stale_hits', 'negative_hits', 'misses')
+
+
+def collect_book_cache(registry):
+    """Book cache counters of this process, read at scrape time"""
+    from cart_service.services import book_cache_stats
+    stats = book_cache_stats()
+    for name in CACHE_LOOKUPS:
+        if name in stats:
+            registry.set('book_cache_lookups_total', (('result', name),), stats[name])
+    if 'evictions' in stats:
+        registry.set('book_cache_evictions_total', (), stats['evictions'])
+        registry.set('book_cache_entries', (), stats['size'])
+
+
+def collect_breakers(registry):
+    """Circuit breaker state and counters per downstream service, read at scrape time"""
+    from cart_service.services import breaker_stats
+    from cart_service.services.resilience import BREAKER_STATES
+    for service, stats in breaker_stats().items():
+        labels = (('service', service),)
+        for state in BREAKER_STATES:
+            registry.set('circuit_breaker_state', labels + (('state', state),), int(stats['state'] == state))
+        for transition, count in stats['transitions'].items():
+            from_state, to_state = transition.split('->')
+            registry.set('circuit_breaker_transitions_total', labels + (('from', from_state), ('to', to_state)), count)
+        registry.set('circuit_breaker_rejected_total', labels, stats['rejected'])
+        registry.set('hedged_requests_total', labels, stats['hedged'])
+        registry.set('hedge_wins_total', labels, stats['hedge_wins'])
+
+
+def collect_http_pools(registry):
+    """Outbound HTTP connection pool usage per downstream service, read at scrape time"""
+    from cart_service.services import pool_stats
+    for service, stats in pool_stats().items():
+        labels = (('service', service),)
+        registry.set('http_pool_connections', labels + (('state', 'idle'),), stats['idle'])
+        registry.set('http_pool_connections', labels + (('state', 'in_use'),), stats['in_use'])
+        registry.set('http_pool_connections_created_total', labels, stats['created'])
+        registry.set('http_pool_connections_reused_total', labels, stats['reused'])
+
+
+def derive_book_cache_hit_ratio(merged):
+    """Share of lookups served from the cache, over all processes"""
+    counts = {
+        name: merged.get(('book_cache_lookups_total', (('result', name),)), 0)
+        for name in CACHE_LOOKUPS
+    }
+    lookups = sum(counts.values())
+    if lookups:
+        merged[('book_cache_hit_ratio', ())] = round((lookups - counts['misses']) / lookups, 4)
+
+
+def derive_replication_lag(merged):
+    """Book snapshot replication lag, read once per scrape (the cursor is shared by all processes)"""
+    from django.db import DatabaseError
+    from .replication import replication_status
+    try:
+        status = replication_status()
+    except DatabaseError:
+        return
+    merged[('book_replication_last_change_id', ())] = status['position']
+    if status['lag_seconds'] is not None:
+        merged[('book_replication_lag_seconds', ())] = status['lag_seconds']
+
+
 class CartsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'carts'
+
+    def ready(self):
+        from service_common import metrics
+        metrics.define('book_cache_lookups_total', 'counter', 'Book cache lookups by result')
+        metrics.define('book_cache_evictions_total', 'counter', 'Book cache entries evicted')
+        metrics.define('book_cache_entries', 'gauge', 'Entries held in the book cache')
+        metrics.define('book_cache_hit_ratio', 'gauge', 'Share of book cache lookups served without loading')
+        metrics.define('circuit_breaker_state', 'gauge', 'Processes whose breaker for the downstream service is in this state')
+        metrics.define('circuit_breaker_transitions_total', 'counter', 'Circuit breaker state changes by downstream service')
+        metrics.define('circuit_breaker_rejected_total', 'counter', 'Calls rejected by an open or half-open circuit breaker')
+        metrics.define('hedged_requests_total', 'counter', 'GETs that sent a hedge request by downstream service')
+        metrics.define('hedge_wins_total', 'counter', 'Hedged GETs answered by the hedge first')
+        metrics.define('book_replication_lag_seconds', 'gauge', 'Seconds since book snapshot replication last reached the feed head')
+        metrics.define('book_replication_last_change_id', 'gauge', 'Last book change feed id applied to the snapshots')
+        metrics.define('http_pool_connections', 'gauge', 'Outbound HTTP connections by downstream service and state (idle or in_use)')
+        metrics.define('http_pool_connections_created_total', 'counter', 'Outbound HTTP connections opened by downstream service')
+        metrics.define('http_pool_connections_reused_total', 'counter', 'Outbound HTTP requests sent on a kept-alive connection')
+        metrics.register_collector(collect_book_cache)
+        metrics.register_collector(collect_http_pools)
+        metrics.register_collector(collect_breakers)
+        metrics.register_derived(derive_book_cache_hit_ratio)
+        metrics.register_derived(derive_replication_lag)
@@ -0,0 +1,206 @@
+"""Async views for Cart API
+
+Same responses as ``CartViewSet.get_by_customer`` and ``CartViewSet.add_item``,
+but all outbound customer/book calls of a request run concurrently. Best run
+under ASGI (``uvicorn cart_service.asgi:application``).
+"""
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import prefetch_related_objects
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.utils.encoders import JSONEncoder
+from cart_service.services import BookLookup, customer_token_error, uses_token
+from cart_service.services.async_clients import (
+    AsyncBookServiceClient,
+    AsyncCustomerServiceClient,
+    outbound_semaphore,
+)
+from .models import Cart
+from .replication import SnapshotBookSource
+from .serializers import CartSerializer, CartItemSerializer, AddToCartSerializer
+from .views import add_book_to_cart, reprice_if_fetched, reservation_error
+
+
+def json_response(payload, status, lookup=None):
+    """JSON response in the same envelope (and debug header) as CartViewSet"""
+    response = JsonResponse(
+        payload,
+        status=status,
+        encoder=JSONEncoder,
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False}
+    )
+    if lookup is not None and getattr(settings, 'BOOK_LOOKUP_DEBUG_HEADER', settings.DEBUG):
+        response['X-Book-Lookup'] = lookup.stats_header()
+    return response
+
+
+def load_cart(customer_id):
+    """Existing cart with its items prefetched, or None"""
+    cart = Cart.objects.filter(customer_id=customer_id).first()
+    if cart is not None:
+        prefetch_related_objects([cart], 'items')
+    return cart
+
+
+def load_or_create_cart(customer_id):
+    cart, _ = Cart.objects.get_or_create(customer_id=customer_id)
+    prefetch_related_objects([cart], 'items')
+    return cart
+
+
+async def fetch_cart_books(customer_id, book_client):
+    """Load the cart and fetch all of its books"""
+    cart = await sync_to_async(load_cart)(customer_id)
+    if cart is None:
+        return None, [], {}
+    book_ids = [item.book_id for item in cart.items.all()]
+    books = await sync_to_async(SnapshotBookSource().get_books)(book_ids)
+    remaining = [book_id for book_id in book_ids if book_id not in books]
+    if remaining:
+        books.update(await book_client.get_books(remaining))
+    return cart, book_ids, books
+
+
+async def remote_customer_error(customer_id, customer_client):
+    """Validate the customer with customer-service (requests without a token)"""
+    if not await customer_client.validate_customer(customer_id):
+        return 'Customer not found', 404
+    return None
+
+
+@require_GET
+async def get_by_customer(request, customer_id):
+    """Get cart by customer ID"""
+    semaphore = outbound_semaphore()
+    customer_client = AsyncCustomerServiceClient(semaphore)
+    book_client = AsyncBookServiceClient(semaphore)
+
+    if uses_token(request.headers):
+        # Verified locally, before any book lookups
+        # Thread: the first check may load the revocation list synchronously
+        customer_failure = await sync_to_async(customer_token_error, thread_sensitive=False)(
+            request.headers, customer_id
+        )
+        cart, book_ids, books = (None, [], {}) if customer_failure else await fetch_cart_books(customer_id, book_client)
+    else:
+        # Customer validation and book lookups run concurrently
+        customer_failure, (cart, book_ids, books) = await asyncio.gather(
+            remote_customer_error(customer_id, customer_client),
+            fetch_cart_books(customer_id, book_client),
+        )
+    if customer_failure:
+        return json_response(
+            {
+                'success': False,
+                'message': customer_failure[0]
+            },
+            status=customer_failure[1]
+        )
+
+    if cart is None:
+        cart = await sync_to_async(load_or_create_cart)(customer_id)
+    lookup = BookLookup()
+    lookup.prime(book_ids, books)
+    serializer = CartSerializer(cart, context={'request': request, 'book_lookup': lookup})
+    data = await sync_to_async(lambda: serializer.data)()
+    if cart.prices_stale(getattr(settings, 'CART_PRICE_MAX_AGE', 300)):
+        # Books were just fetched for the response; reuse them to refresh the summary
+        await sync_to_async(reprice_if_fetched)(cart, books)
+    return json_response(
+        {
+            'success': True,
+            'data': data
+        },
+        status=200,
+        lookup=lookup
+    )
+
+
+@csrf_exempt
+@require_POST
+async def add_item(request, customer_id):
+    """Add item to cart"""
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return json_response(
+            {
+                'success': False,
+                'message': 'Invalid JSON body'
+            },
+            status=400
+        )
+
+    serializer = AddToCartSerializer(data=payload)
+    if not serializer.is_valid():
+        return json_response(
+            {
+                'success': False,
+                'errors': serializer.errors
+            },
+            status=400
+        )
+
+    book_id = serializer.validated_data['book_id']
+    quantity = serializer.validated_data['quantity']
+
+    semaphore = outbound_semaphore()
+    book_client = AsyncBookServiceClient(semaphore)
+    ttl = getattr(settings, 'BOOK_RESERVATION_TTL', None)
+    if uses_token(request.headers):
+        # Verified locally, so no stock is reserved for a rejected token
+        # Thread: the first check may load the revocation list synchronously
+        customer_failure = await sync_to_async(customer_token_error, thread_sensitive=False)(
+            request.headers, customer_id
+        )
+        status_code, data = (None, None) if customer_failure else await book_client.reserve_stock(book_id, quantity, ttl=ttl)
+    else:
+        customer_failure, (status_code, data) = await asyncio.gather(
+            remote_customer_error(customer_id, AsyncCustomerServiceClient(semaphore)),
+            book_client.reserve_stock(book_id, quantity, ttl=ttl),
+        )
+    error = reservation_error(status_code, data)
+    if customer_failure:
+        if not error:
+            await book_client.release_reservation(data['data']['id'])
+        return json_response(
+            {
+                'success': False,
+                'message': customer_failure[0]
+            },
+            status=customer_failure[1]
+        )
+    if error:
+        return json_response(
+            {
+                'success': False,
+                'message': error[0]
+            },
+            status=error[1]
+        )
+
+    reservation = data['data']
+    book = reservation['book']
+    try:
+        cart_item = await sync_to_async(add_book_to_cart)(customer_id, book_id, quantity, reservation)
+    except DatabaseError:
+        await book_client.release_reservation(reservation['id'])
+        raise
+
+    lookup = BookLookup()
+    lookup.prime([book_id], {book_id: book})
+    item_serializer = CartItemSerializer(cart_item, context={'request': request, 'book_lookup': lookup})
+    return json_response(
+        {
+            'success': True,
+            'message': 'Item added to cart',
+            'data': item_serializer.data
+        },
+        status=200,
+        lookup=lookup
+    )
@@ -0,0 +1,159 @@
+"""Benchmark sync vs async outbound fan-out for a cart view
+
+Runs a stub book/customer service with a fixed per-request latency in a
+background thread, then times the outbound calls a cart view makes:
+
+- ``sync-per-item``: one ``get_book`` per item, one after another
+- ``sync``: customer check, then one batch lookup (``CartViewSet`` path)
+- ``async-per-item``: customer check and one ``get_book`` per item, concurrently
+- ``async``: customer check and batch lookups concurrently (async views path)
+
+Usage: python manage.py bench_cart_fanout --items 1,10,50 --latency-ms 20
+"""
+import asyncio
+import json
+import re
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from cart_service.services import BookServiceClient, CustomerServiceClient
+from cart_service.services.async_clients import (
+    AsyncBookServiceClient,
+    AsyncCustomerServiceClient,
+    outbound_semaphore,
+)
+
+
+def stub_book(book_id):
+    return {
+        'id': book_id,
+        'title': f'Book {book_id}',
+        'author': 'Bench',
+        'price': '10.00',
+        'stock': 100,
+        'is_available': True,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers book/customer lookups after ``latency`` seconds"""
+    latency = 0.02
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        if url.path == '/api/v1/books/batch/':
+            ids = [int(i) for i in parse_qs(url.query)['ids'][0].split(',')]
+            payload = {'success': True, 'data': [stub_book(i) for i in ids], 'missing': []}
+        elif re.match(r'^/api/v1/books/\d+/$', url.path):
+            payload = {'success': True, 'data': stub_book(int(url.path.split('/')[-2]))}
+        elif re.match(r'^/api/v1/customers/\d+/$', url.path):
+            payload = {'success': True, 'data': {'id': int(url.path.split('/')[-2])}}
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare sync and async cart fan-out latency against a stub service'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', default='1,10,50', help='Comma-separated cart sizes')
+        parser.add_argument('--latency-ms', type=float, default=20, help='Stub latency per request')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs per measurement')
+
+    def handle(self, *args, **options):
+        StubHandler.latency = options['latency_ms'] / 1000
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/api/v1'
+
+        sizes = [int(size) for size in options['items'].split(',')]
+        try:
+            with override_settings(
+                BOOK_SERVICE_URL=base_url,
+                CUSTOMER_SERVICE_URL=base_url,
+                BOOK_CACHE={'ENABLED': False},
+            ):
+                self.run(sizes, options['repeat'], options['latency_ms'])
+        finally:
+            server.shutdown()
+
+    def run(self, sizes, repeat, latency_ms):
+        modes = [
+            ('sync-per-item', lambda ids: self.time_sync(self.sync_per_item, ids, repeat)),
+            ('sync', lambda ids: self.time_sync(self.sync_batch, ids, repeat)),
+            ('async-per-item', lambda ids: asyncio.run(self.time_async(self.async_per_item, ids, repeat))),
+            ('async', lambda ids: asyncio.run(self.time_async(self.async_batch, ids, repeat))),
+        ]
+        self.stdout.write(f'Stub latency: {latency_ms:g} ms, {repeat} runs each (median ms)')
+        self.stdout.write(f'{"items":>6}' + ''.join(f'{name:>16}' for name, _ in modes))
+        for size in sizes:
+            book_ids = list(range(1, size + 1))
+            row = f'{size:>6}'
+            for _, measure in modes:
+                row += f'{statistics.median(measure(book_ids)):>16.1f}'
+            self.stdout.write(row)
+
+    def time_sync(self, func, book_ids, repeat):
+        func(book_ids)  # warm up the connection pool
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(book_ids)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    async def time_async(self, func, book_ids, repeat):
+        # All runs share one event loop, as they would in an ASGI worker
+        await func(book_ids)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await func(book_ids)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def sync_per_item(self, book_ids):
+        CustomerServiceClient().validate_customer(1)
+        client = BookServiceClient()
+        return [client.get_book(book_id) for book_id in book_ids]
+
+    def sync_batch(self, book_ids):
+        CustomerServiceClient().validate_customer(1)
+        return BookServiceClient().get_books(book_ids)
+
+    async def async_per_item(self, book_ids):
+        semaphore = outbound_semaphore()
+        book_client = AsyncBookServiceClient(semaphore)
+        return await asyncio.gather(
+            AsyncCustomerServiceClient(semaphore).validate_customer(1),
+            *(book_client.get_book(book_id) for book_id in book_ids)
+        )
+
+    async def async_batch(self, book_ids):
+        semaphore = outbound_semaphore()
+        return await asyncio.gather(
+            AsyncCustomerServiceClient(semaphore).validate_customer(1),
+            AsyncBookServiceClient(semaphore).get_books(book_ids)
+        )
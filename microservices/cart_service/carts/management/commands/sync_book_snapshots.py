@@ -0,0 +1,35 @@
+"""Keep BookSnapshot rows up to date from the book-service change feed
+
+Usage:
+    python manage.py sync_book_snapshots            # catch up once
+    python manage.py sync_book_snapshots --follow   # keep polling
+"""
+import time
+from django.core.management.base import BaseCommand
+from carts.replication import replication_status, sync_book_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Replicate books from the book-service change feed into BookSnapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true', help='Keep polling the feed')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls')
+        parser.add_argument('--batch-size', type=int, default=None, help='Changes per feed request')
+
+    def handle(self, *args, **options):
+        while True:
+            applied = sync_book_snapshots(batch_size=options['batch_size'])
+            status = replication_status()
+            if applied is None:
+                self.stderr.write(
+                    f'Book service unreachable; snapshot lag {status["lag_seconds"]}s'
+                )
+            elif applied or not options['follow']:
+                self.stdout.write(
+                    f'Applied {applied} changes; cursor {status["position"]}, '
+                    f'lag {status["lag_seconds"]}s'
+                )
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
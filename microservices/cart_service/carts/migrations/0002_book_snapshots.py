@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('book_id', models.BigIntegerField(unique=True)),
+                ('title', models.CharField(max_length=200)),
+                ('author', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock', models.IntegerField(default=0)),
+                ('change_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'book_snapshots',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReplicationCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('caught_up_at', models.DateTimeField(blank=True, null=True)),
+                ('last_change_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'replication_cursors',
+            },
+        ),
+    ]
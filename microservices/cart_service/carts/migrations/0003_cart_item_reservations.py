@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0002_book_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItemReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservation_id', models.UUIDField(unique=True)),
+                ('quantity', models.IntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cart_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='carts.cartitem')),
+            ],
+            options={
+                'db_table': 'cart_item_reservations',
+            },
+        ),
+    ]
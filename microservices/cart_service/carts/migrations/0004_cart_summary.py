@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:49
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_cart_summaries(apps, schema_editor):
+    """Fill item counts for existing carts; their prices are unknown until items change or are viewed"""
+    Cart = apps.get_model('carts', 'Cart')
+    carts = Cart.objects.annotate(items_count=Count('items'), items_quantity=Sum('items__quantity'))
+    for cart in carts.filter(items_count__gt=0).iterator():
+        Cart.objects.filter(pk=cart.pk).update(
+            item_count=cart.items_count,
+            total_quantity=cart.items_quantity or 0
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0003_cart_item_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='prices_as_of',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal_snapshot',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_quantity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='priced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cartitem',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(backfill_cart_summaries, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,18 @@
 """Cart models for cart-service microservice"""
+from decimal import Decimal
 from django.db import models
+from django.db.models import Count, DecimalField, F, Min, Q, Sum
+from django.utils import timezone
 
 
 class Cart(models.Model):
     """Cart model - stores customer_id reference (not FK since customer is in another service)"""
     customer_id = models.IntegerField(unique=True)
+    # Denormalized summary, recomputed by refresh_summary() whenever items change
+    item_count = models.IntegerField(default=0)
+    total_quantity = models.IntegerField(default=0)
+    subtotal_snapshot = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    prices_as_of = models.DateTimeField(null=True, blank=True)  # oldest item price capture; None if any is unknown
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -14,6 +22,44 @@ class Cart(models.Model):
     
     def __str__(self):
         return f"Cart for customer {self.customer_id}"
+    
+    @classmethod
+    def lock(cls, customer_id):
+        """Get or create a customer's cart and lock its row for the current transaction
+        
+        Item changes lock the cart first so summary refreshes of concurrent
+        changes to the same cart cannot overwrite each other.
+        """
+        cart, _ = cls.objects.get_or_create(customer_id=customer_id)
+        return cls.objects.select_for_update().get(pk=cart.pk)
+    
+    def refresh_summary(self):
+        """Recompute item_count, total_quantity and subtotal_snapshot from the items"""
+        totals = self.items.aggregate(
+            item_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            subtotal=Sum(
+                F('quantity') * F('unit_price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+            prices_as_of=Min('priced_at'),
+            unpriced=Count('id', filter=Q(unit_price__isnull=True)),
+        )
+        self.item_count = totals['item_count']
+        self.total_quantity = totals['total_quantity'] or 0
+        self.subtotal_snapshot = Decimal(totals['subtotal'] or 0).quantize(Decimal('0.01'))
+        self.prices_as_of = None if totals['unpriced'] else totals['prices_as_of']
+        self.save(update_fields=[
+            'item_count', 'total_quantity', 'subtotal_snapshot', 'prices_as_of', 'updated_at'
+        ])
+    
+    def prices_stale(self, max_age):
+        """True if the subtotal may not match current book prices"""
+        if not self.item_count:
+            return False
+        if self.prices_as_of is None:
+            return True
+        return (timezone.now() - self.prices_as_of).total_seconds() > max_age
 
 
 class CartItem(models.Model):
@@ -21,6 +67,8 @@ class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     book_id = models.IntegerField()  # Reference to book in book-service
     quantity = models.IntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # price when last seen
+    priced_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -29,3 +77,59 @@ class CartItem(models.Model):
     
     def __str__(self):
         return f"CartItem: Book {self.book_id} x {self.quantity}"
+
+
+class CartItemReservation(models.Model):
+    """Book-service stock reservation backing part of a cart item's quantity"""
+    cart_item = models.ForeignKey(CartItem, on_delete=models.CASCADE, related_name='reservations')
+    reservation_id = models.UUIDField(unique=True)  # StockReservation id in book-service
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'cart_item_reservations'
+    
+    def __str__(self):
+        return f"Reservation {self.reservation_id}: book {self.cart_item.book_id} x {self.quantity}"
+
+
+class BookSnapshot(models.Model):
+    """Local read-only copy of a book, replicated from the book-service change feed"""
+    book_id = models.BigIntegerField(unique=True)
+    title = models.CharField(max_length=200)
+    author = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.IntegerField(default=0)
+    change_id = models.BigIntegerField()  # last applied change feed id
+
+    class Meta:
+        db_table = 'book_snapshots'
+
+    def __str__(self):
+        return f"BookSnapshot: {self.title} ({self.book_id})"
+
+    def to_book_data(self):
+        """Same shape as book-service's Book representation"""
+        return {
+            'id': self.book_id,
+            'title': self.title,
+            'author': self.author,
+            'price': str(self.price),
+            'stock': self.stock,
+            'is_available': self.stock > 0,
+        }
+
+
+class ReplicationCursor(models.Model):
+    """Position of a change feed consumer"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    caught_up_at = models.DateTimeField(null=True, blank=True)  # last time the feed head was reached
+    last_change_at = models.DateTimeField(null=True, blank=True)  # created_at of the last applied change
+
+    class Meta:
+        db_table = 'replication_cursors'
+
+    def __str__(self):
+        return f"{self.name} at {self.position}"
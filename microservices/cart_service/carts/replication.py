@@ -0,0 +1,133 @@
+"""Book snapshot replication from the book-service change feed
+
+``sync_book_snapshots`` applies change feed pages to ``BookSnapshot`` rows.
+``SnapshotBookSource`` serves those rows to cart views while the snapshot
+is fresh enough; otherwise callers fall back to live book-service calls.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cart_service.services import BookServiceClient
+from .models import BookSnapshot, ReplicationCursor
+
+
+CURSOR_NAME = 'book_changes'
+
+
+def get_snapshot_config():
+    config = {
+        'ENABLED': True,
+        'MAX_AGE': 30,      # seconds since the feed head was last reached
+        'BATCH_SIZE': 500,  # changes per feed request
+    }
+    config.update(getattr(settings, 'BOOK_SNAPSHOT', {}))
+    return config
+
+
+def apply_changes(changes):
+    """Upsert/delete snapshots for one page of changes (last change per book wins)"""
+    latest = {}
+    for change in changes:
+        latest[change['book_id']] = change
+
+    deleted = [book_id for book_id, change in latest.items() if change['operation'] == 'delete']
+    upserts = [change for change in latest.values() if change['operation'] != 'delete']
+
+    if deleted:
+        BookSnapshot.objects.filter(book_id__in=deleted).delete()
+    if upserts:
+        # MySQL upserts on any unique key and rejects an explicit target
+        unique_fields = ['book_id'] if connection.features.supports_update_conflicts_with_target else None
+        BookSnapshot.objects.bulk_create(
+            [
+                BookSnapshot(
+                    book_id=change['book_id'],
+                    title=change['data']['title'],
+                    author=change['data']['author'],
+                    price=Decimal(change['data']['price']),
+                    stock=change['data']['stock'],
+                    change_id=change['id'],
+                )
+                for change in upserts
+            ],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['title', 'author', 'price', 'stock', 'change_id'],
+        )
+
+
+def sync_book_snapshots(client=None, batch_size=None, max_pages=None):
+    """Pull and apply changes until the feed head is reached
+
+    Returns the number of changes applied, or None if book-service could
+    not be reached.
+    """
+    client = client or BookServiceClient()
+    batch_size = batch_size or get_snapshot_config()['BATCH_SIZE']
+    cursor, _ = ReplicationCursor.objects.get_or_create(name=CURSOR_NAME)
+    applied = 0
+    pages = 0
+    while max_pages is None or pages < max_pages:
+        page = client.get_book_changes(after=cursor.position, limit=batch_size)
+        if page is None:
+            return None
+        pages += 1
+        changes = page.get('data', [])
+        with transaction.atomic():
+            apply_changes(changes)
+            cursor.position = page.get('next_cursor', cursor.position)
+            if changes:
+                cursor.last_change_at = parse_datetime(changes[-1]['created_at'])
+            if not page.get('has_more'):
+                cursor.caught_up_at = timezone.now()
+            cursor.save()
+        applied += len(changes)
+        if not page.get('has_more'):
+            break
+    return applied
+
+
+def replication_status():
+    """Cursor position and replication lag of the snapshot table"""
+    cursor = ReplicationCursor.objects.filter(name=CURSOR_NAME).first()
+    if cursor is None or cursor.caught_up_at is None:
+        return {'position': 0, 'caught_up_at': None, 'lag_seconds': None, 'fresh': False}
+    lag = (timezone.now() - cursor.caught_up_at).total_seconds()
+    return {
+        'position': cursor.position,
+        'caught_up_at': cursor.caught_up_at,
+        'last_change_at': cursor.last_change_at,
+        'lag_seconds': round(lag, 3),
+        'fresh': lag <= get_snapshot_config()['MAX_AGE'],
+    }
+
+
+class SnapshotBookSource:
+    """Reads books from local snapshots while replication is fresh
+
+    The freshness check is done once per instance (i.e. once per request).
+    """
+
+    def __init__(self):
+        self._fresh = None
+
+    def is_fresh(self):
+        if self._fresh is None:
+            config = get_snapshot_config()
+            self._fresh = config['ENABLED'] and ReplicationCursor.objects.filter(
+                name=CURSOR_NAME,
+                caught_up_at__gte=timezone.now() - timedelta(seconds=config['MAX_AGE'])
+            ).exists()
+        return self._fresh
+
+    def get_books(self, book_ids):
+        """Snapshot data for the given ids; empty when the snapshot is stale"""
+        if not book_ids or not self.is_fresh():
+            return {}
+        return {
+            snapshot.book_id: snapshot.to_book_data()
+            for snapshot in BookSnapshot.objects.filter(book_id__in=book_ids)
+        }
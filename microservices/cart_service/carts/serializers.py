@@ -1,7 +1,8 @@
 """Serializers for Cart API"""
+from django.conf import settings
 from rest_framework import serializers
 from .models import Cart, CartItem
-from cart_service.services import BookServiceClient
+from cart_service.services import BookLookup
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -15,8 +16,7 @@ class CartItemSerializer(serializers.ModelSerializer):
     
     def get_book_info(self, obj):
         """Get book info from book-service"""
-        book_client = BookServiceClient()
-        book = book_client.get_book(obj.book_id)
+        book = self._get_book(obj.book_id)
         if book:
             return {
                 'id': book.get('id'),
@@ -29,6 +29,13 @@ class CartItemSerializer(serializers.ModelSerializer):
             'title': 'Unknown Book',
             'error': 'Book service unavailable'
         }
+    
+    def _get_book(self, book_id):
+        """Get book through the request-scoped lookup when one is available"""
+        lookup = self.context.get('book_lookup')
+        if lookup is None:
+            lookup = self.context['book_lookup'] = BookLookup()
+        return lookup.get(book_id)
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -41,19 +48,79 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer_id', 'items', 'total', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
     
+    def to_representation(self, instance):
+        """Fetch all books of the cart with a single batch request"""
+        lookup = self.context.get('book_lookup')
+        if lookup is None:
+            lookup = self.context['book_lookup'] = BookLookup()
+        lookup.get_many(item.book_id for item in instance.items.all())
+        return super().to_representation(instance)
+    
     def get_total(self, obj):
         """Calculate total from book prices"""
-        book_client = BookServiceClient()
+        lookup = self.context['book_lookup']
         total = 0
         for item in obj.items.all():
-            book = book_client.get_book(item.book_id)
+            book = lookup.get(item.book_id)
             if book:
                 price = float(book.get('price', 0))
                 total += price * item.quantity
         return total
 
 
+class CartSummarySerializer(serializers.ModelSerializer):
+    """Denormalized cart summary (item count and subtotal at last known prices)"""
+    subtotal = serializers.DecimalField(
+        source='subtotal_snapshot', max_digits=12, decimal_places=2, read_only=True
+    )
+    prices_stale = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Cart
+        fields = ['customer_id', 'item_count', 'total_quantity', 'subtotal', 'prices_as_of', 'prices_stale']
+        read_only_fields = fields
+    
+    def get_prices_stale(self, obj):
+        """True if book prices may have changed since the subtotal was computed"""
+        return obj.prices_stale(getattr(settings, 'CART_PRICE_MAX_AGE', 300))
+
+
 class AddToCartSerializer(serializers.Serializer):
     """Serializer for adding item to cart"""
     book_id = serializers.IntegerField(required=True)
-    quantity = serializers.IntegerField(default=1, min_value=1)
\ No newline at end of file
+    quantity = serializers.IntegerField(default=1, min_value=1)
+
+
+class CartItemOperationSerializer(serializers.Serializer):
+    """One operation of a batch cart update
+    
+    ``add`` increases the quantity (default 1), ``set`` replaces it (0
+    removes the item) and ``remove`` deletes the item if it is in the cart.
+    """
+    ADD = 'add'
+    SET = 'set'
+    REMOVE = 'remove'
+    
+    op = serializers.ChoiceField(choices=[ADD, SET, REMOVE])
+    book_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(required=False, min_value=0)
+    
+    def validate(self, attrs):
+        if attrs['op'] == self.ADD:
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Must be at least 1 for "add".'})
+        elif attrs['op'] == self.SET and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'Required for "set".'})
+        return attrs
+
+
+class UpdateCartItemsSerializer(serializers.Serializer):
+    """Serializer for a batch of cart item operations"""
+    operations = CartItemOperationSerializer(many=True, allow_empty=False)
+    
+    def validate_operations(self, operations):
+        max_operations = getattr(settings, 'CART_BATCH_MAX_OPERATIONS', 100)
+        if len(operations) > max_operations:
+            raise serializers.ValidationError(f'Too many operations. Maximum per request: {max_operations}')
+        return operations
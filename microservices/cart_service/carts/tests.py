@@ -1,3 +1,641 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core import signing
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from service_common import metrics
+from service_common.tracing import TracingMiddleware
+from cart_service.services import transport
+from cart_service.services.book_cache import DEFAULT_CACHE_CONFIG, MISSING, BookCache, CacheEntry
+from cart_service.services.customer_tokens import (
+    TOKEN_SALT,
+    InvalidToken,
+    RevocationList,
+    customer_token_error,
+    verify_token,
+)
+from cart_service.services.resilience import (
+    CLOSED,
+    DEFAULT_BREAKER_CONFIG,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientSession,
+)
+from .apps import collect_breakers, collect_http_pools
+from .models import Cart, CartItem, ReplicationCursor
+from .replication import CURSOR_NAME
 
-# Create your tests here.
+
+def wait_until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('Timed out waiting for condition')
+        time.sleep(0.005)
+
+
+def make_token(customer_id, key, ttl=60):
+    return signing.dumps({'sub': customer_id, 'exp': int(time.time()) + ttl}, key=key, salt=TOKEN_SALT)
+
+
+def loaded_revocations(customer_ids=()):
+    revocations = RevocationList(refresh_interval=60)
+    revocations.customer_ids = frozenset(customer_ids)
+    revocations.loaded_at = time.time()
+    revocations._next_refresh = time.monotonic() + 60
+    return revocations
+
+
+class BookCacheTests(SimpleTestCase):
+    """Single-flight, negative caching and stale-while-revalidate"""
+
+    def make_cache(self, **config):
+        return BookCache(dict(DEFAULT_CACHE_CONFIG, **config))
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = self.make_cache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader(key, etag):
+            calls.append(key)
+            started.set()
+            release.wait(2)
+            return {'id': key}, None
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get(1, loader))) for _ in range(5)]
+        threads[0].start()
+        started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        wait_until(lambda: cache.stats()['coalesced'] == 4)
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [{'id': 1}] * 5)
+
+    def test_missing_books_are_cached_for_the_negative_ttl(self):
+        cache = self.make_cache(NEGATIVE_TTL=10)
+        loader = mock.Mock(return_value=(MISSING, None))
+        self.assertIs(cache.get(1, loader), MISSING)
+        self.assertIs(cache.get(1, loader), MISSING)
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(cache.stats()['negative_hits'], 1)
+
+        cache = self.make_cache(NEGATIVE_TTL=0)
+        cache.get(1, loader)
+        cache.get(1, loader)
+        self.assertEqual(loader.call_count, 3)
+
+    def test_transient_failures_are_not_cached(self):
+        cache = self.make_cache()
+        loader = mock.Mock(side_effect=[(None, None), ({'id': 1}, None)])
+        self.assertIsNone(cache.get(1, loader))
+        self.assertEqual(cache.get(1, loader), {'id': 1})
+        self.assertEqual(cache.stats()['load_errors'], 1)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        cache = self.make_cache()
+        now = time.time()
+        cache.backend.set(1, CacheEntry({'id': 1, 'price': '1.00'}, now - 1, now + 30))
+        loader = mock.Mock(return_value=({'id': 1, 'price': '2.00'}, None))
+        self.assertEqual(cache.get(1, loader), {'id': 1, 'price': '1.00'})
+        wait_until(lambda: cache.peek(1) is not None)
+        self.assertEqual(cache.get(1, loader), {'id': 1, 'price': '2.00'})
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual((cache.stats()['stale_hits'], cache.stats()['refreshes']), (1, 1))
+
+    def test_entry_past_its_stale_window_is_reloaded(self):
+        cache = self.make_cache()
+        now = time.time()
+        cache.backend.set(1, CacheEntry({'id': 1, 'price': '1.00'}, now - 60, now - 1))
+        loader = mock.Mock(return_value=({'id': 1, 'price': '2.00'}, None))
+        self.assertEqual(cache.get(1, loader), {'id': 1, 'price': '2.00'})
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_get_many_loads_all_misses_in_one_call(self):
+        cache = self.make_cache()
+        cache.put(1, {'id': 1})
+        loader = mock.Mock(return_value={2: {'id': 2}, 3: MISSING})
+        self.assertEqual(cache.get_many([1, 2, 3, 4], loader), {1: {'id': 1}, 2: {'id': 2}, 3: MISSING})
+        loader.assert_called_once_with([2, 3, 4])
+
+    def test_get_many_refreshes_stale_entries_in_one_call(self):
+        cache = self.make_cache()
+        now = time.time()
+        for key in (1, 2, 3):
+            cache.backend.set(key, CacheEntry({'id': key, 'price': '1.00'}, now - 1, now + 30))
+        cache._claim(3)  # already being refreshed by another request
+        loader = mock.Mock(return_value={1: {'id': 1, 'price': '2.00'}, 2: MISSING})
+        self.assertEqual(cache.get_many([1, 2, 3], loader), {key: {'id': key, 'price': '1.00'} for key in (1, 2, 3)})
+        wait_until(lambda: cache.peek(1) is not None and cache.peek(2) is not None)
+        loader.assert_called_once_with([1, 2])
+        self.assertEqual(cache.peek(1), {'id': 1, 'price': '2.00'})
+        self.assertEqual(cache.stats()['refreshes'], 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """closed -> open -> half_open -> closed"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('book', dict(
+            DEFAULT_BREAKER_CONFIG, MINIMUM_CALLS=4, WINDOW_SIZE=4, OPEN_SECONDS=60, HALF_OPEN_CALLS=2
+        ))
+
+    def trip(self):
+        for failed in (False, True, True, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(failed, 0.01)
+
+    def expire_open_period(self):
+        self.breaker.opened_at -= 61
+
+    def test_opens_at_the_failure_rate_threshold(self):
+        self.trip()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_opens_on_slow_calls(self):
+        for _ in range(4):
+            self.breaker.allow()
+            self.breaker.record(False, 5.0)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_half_open_probes_close_the_circuit(self):
+        self.trip()
+        self.expire_open_period()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())  # only HALF_OPEN_CALLS probes at a time
+        self.breaker.record(False, 0.01)
+        self.breaker.record(False, 0.01)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.stats()['transitions'], {
+            'closed->open': 1, 'open->half_open': 1, 'half_open->closed': 1,
+        })
+
+    def test_breaker_metrics_are_exported_per_service(self):
+        self.trip()
+        self.breaker.allow()
+        stats = dict(self.breaker.stats(), hedged=3, hedge_wins=1)
+        registry = metrics.Registry()
+        with mock.patch('cart_service.services.breaker_stats', return_value={'book': stats}):
+            collect_breakers(registry)
+        service = (('service', 'book'),)
+        self.assertEqual(registry.values[('circuit_breaker_state', service + (('state', OPEN),))], 1)
+        self.assertEqual(registry.values[('circuit_breaker_state', service + (('state', CLOSED),))], 0)
+        self.assertEqual(
+            registry.values[('circuit_breaker_transitions_total', service + (('from', CLOSED), ('to', OPEN)))], 1
+        )
+        self.assertEqual(registry.values[('circuit_breaker_rejected_total', service)], 1)
+        self.assertEqual(registry.values[('hedged_requests_total', service)], 3)
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.trip()
+        self.expire_open_period()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True, 0.01)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.content = body
+        self.status_code = status_code
+
+
+class FakeSession:
+    """First GET hangs until released; later ones answer at once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.release.wait(2)
+            return FakeResponse(b'primary')
+        return FakeResponse(b'hedge')
+
+    def post(self, url, **kwargs):
+        return FakeResponse(b'posted', 500)
+
+
+class ResilientSessionTests(SimpleTestCase):
+    """Hedged GETs and calls through an open circuit"""
+
+    def make_session(self):
+        session = ResilientSession('book')
+        session.session = FakeSession()
+        self.addCleanup(session.session.release.set)
+        return session
+
+    @override_settings(SERVICE_HEDGING={'ENABLED': True, 'PERCENTILE': 50, 'MIN_DELAY': 0.01, 'MIN_SAMPLES': 3})
+    def test_slow_get_is_hedged_and_the_first_answer_wins(self):
+        session = self.make_session()
+        self.addCleanup(session._executor.shutdown, wait=False)
+        for _ in range(3):
+            session.latency.add(0.01)
+        response = session.get('http://book-service/api/v1/books/1/')
+        self.assertEqual(response.content, b'hedge')
+        self.assertEqual((session.hedged, session.hedge_wins), (1, 1))
+        self.assertEqual(session.session.calls, 2)
+
+    @override_settings(SERVICE_HEDGING={'ENABLED': True, 'MIN_SAMPLES': 3})
+    def test_no_hedging_before_enough_latency_samples(self):
+        session = self.make_session()
+        self.addCleanup(session._executor.shutdown, wait=False)
+        session.session.release.set()
+        self.assertEqual(session.get('http://book-service/api/v1/books/1/').content, b'primary')
+        self.assertEqual(session.hedged, 0)
+
+    @override_settings(SERVICE_CIRCUIT_BREAKER={'MINIMUM_CALLS': 2, 'WINDOW_SIZE': 2})
+    def test_open_circuit_rejects_calls_without_sending_them(self):
+        session = self.make_session()
+        for _ in range(2):
+            self.assertEqual(session.post('http://book-service/api/v1/books/1/reserve/').status_code, 500)
+        self.assertEqual(session.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            session.post('http://book-service/api/v1/books/1/reserve/')
+        with self.assertRaises(CircuitOpenError):
+            session.get('http://book-service/api/v1/books/1/')
+        self.assertEqual(session.session.calls, 0)
+
+
+class HttpPoolStatsTests(SimpleTestCase):
+    """pool_stats() and its /metrics export"""
+
+    def setUp(self):
+        session = transport.get_session('stats-test')
+        self.addCleanup(lambda: transport._sessions.pop('stats-test').close())
+        self.pools = session.get_adapter('http://').poolmanager
+
+    def test_checked_out_connections_are_in_use(self):
+        pool = self.pools.connection_from_url('http://127.0.0.1:1/')
+        pool.pool.get()  # what a request does while it holds a connection
+        registry = metrics.Registry()
+        collect_http_pools(registry)
+        labels = (('service', 'stats-test'),)
+        self.assertEqual(registry.values[('http_pool_connections', labels + (('state', 'in_use'),))], 1)
+        self.assertEqual(registry.values[('http_pool_connections', labels + (('state', 'idle'),))], 0)
+        self.assertEqual(registry.values[('http_pool_connections_created_total', labels)], 0)
+
+    def test_unexpected_pool_internals_only_drop_the_queue_counts(self):
+        pool = self.pools.connection_from_url('http://127.0.0.1:1/')
+        pool.pool = object()
+        pool.num_connections, pool.num_requests = 2, 5
+        self.assertEqual(
+            transport.pool_stats()['stats-test'], {'in_use': 0, 'idle': 0, 'created': 2, 'reused': 3}
+        )
+
+
+class FakeBookService:
+    """Stands in for BookServiceClient: books, stock and reservations in memory"""
+
+    def __init__(self, books):
+        self.books = {book['id']: dict(book) for book in books}
+        self.holds = {}
+        self.bulk_calls = 0
+
+    def __call__(self):
+        return self
+
+    def get_book(self, book_id):
+        return self.books.get(int(book_id))
+
+    def get_books(self, book_ids, fields=None):
+        return {book_id: self.books[book_id] for book_id in book_ids if book_id in self.books}
+
+    def reserve_stock(self, book_id, quantity, ttl=None):
+        book = self.books.get(book_id)
+        if book is None:
+            return 404, {}
+        if book['stock'] < quantity:
+            return 409, {'available': book['stock']}
+        book['stock'] -= quantity
+        reservation_id = str(uuid.uuid4())
+        self.holds[reservation_id] = (book_id, quantity)
+        return 201, {'data': {
+            'id': reservation_id,
+            'expires_at': (timezone.now() + timedelta(minutes=15)).isoformat(),
+            'book': dict(book),
+        }}
+
+    def release_reservation(self, reservation_id):
+        hold = self.holds.pop(str(reservation_id), None)
+        if hold is not None:
+            self.books[hold[0]]['stock'] += hold[1]
+        return True
+
+    def reserve_stock_many(self, items, ttl=None):
+        self.bulk_calls += 1
+        errors = []
+        for book_id, quantity in items.items():
+            book = self.books.get(book_id)
+            if book is None:
+                errors.append({'book_id': book_id, 'status': 'not_found', 'available': None})
+            elif book['stock'] < quantity:
+                errors.append({'book_id': book_id, 'status': 'insufficient_stock', 'available': book['stock']})
+        if errors:
+            return 409, {'errors': errors}
+        reservations = []
+        for book_id, quantity in items.items():
+            reservation = self.reserve_stock(book_id, quantity, ttl)[1]['data']
+            reservations.append(dict(reservation, book_id=book_id, quantity=quantity))
+        return 201, {'data': reservations}
+
+    def release_reservations(self, reservation_ids):
+        self.bulk_calls += 1
+        for reservation_id in reservation_ids:
+            self.release_reservation(reservation_id)
+        return True
+
+    def stock(self, book_id):
+        return self.books[book_id]['stock']
+
+
+class CartApiTestCase(TestCase):
+    """Cart endpoints against an in-memory book-service and an accepting customer-service"""
+
+    def setUp(self):
+        self.books = FakeBookService([
+            {'id': 1, 'title': 'One', 'author': 'A', 'price': '10.00', 'stock': 10},
+            {'id': 2, 'title': 'Two', 'author': 'B', 'price': '2.50', 'stock': 3},
+            {'id': 3, 'title': 'Three', 'author': 'C', 'price': '4.00', 'stock': 5},
+        ])
+        for target in ('carts.views.BookServiceClient', 'cart_service.services.book_lookup.BookServiceClient'):
+            patcher = mock.patch(target, self.books)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('carts.views.CustomerServiceClient')
+        patcher.start().return_value.validate_customer.return_value = True
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def update(self, *operations):
+        return self.client.patch('/api/v1/carts/customer/1/items/', {'operations': list(operations)}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart__customer_id=1).values_list('book_id', 'quantity'))
+
+    def summary(self):
+        return self.client.get('/api/v1/carts/customer/1/summary/').data['data']
+
+
+class BatchCartUpdateTests(CartApiTestCase):
+    """PATCH /carts/customer/<id>/items/"""
+
+    def test_applies_every_operation_and_reserves_the_increases(self):
+        self.update({'op': 'add', 'book_id': 3, 'quantity': 1})
+        self.books.bulk_calls = 0
+        response = self.update(
+            {'op': 'add', 'book_id': 1, 'quantity': 2},
+            {'op': 'set', 'book_id': 2, 'quantity': 3},
+            {'op': 'remove', 'book_id': 3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {1: 2, 2: 3})
+        self.assertEqual((self.books.stock(1), self.books.stock(2), self.books.stock(3)), (8, 0, 5))
+        self.assertEqual(self.books.bulk_calls, 2)  # one reserve for books 1 and 2, one release for book 3
+
+    def test_failing_operation_rolls_back_the_batch(self):
+        response = self.update(
+            {'op': 'add', 'book_id': 1, 'quantity': 2},
+            {'op': 'add', 'book_id': 2, 'quantity': 4},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'book_id': 2, 'message': 'Insufficient stock. Available: 3'},
+        ])
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual((self.books.stock(1), self.books.stock(2)), (10, 3))
+        self.assertEqual(self.books.holds, {})
+
+    def test_unknown_books_are_reported_by_operation_index(self):
+        response = self.update(
+            {'op': 'add', 'book_id': 1},
+            {'op': 'remove', 'book_id': 99},
+            {'op': 'set', 'book_id': 42, 'quantity': 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'], [{'index': 2, 'book_id': 42, 'message': 'Book not found'}])
+        self.assertEqual(self.books.stock(1), 10)
+
+    def test_decrease_releases_only_the_removed_quantity(self):
+        self.update({'op': 'set', 'book_id': 1, 'quantity': 5})
+        self.assertEqual(self.update({'op': 'set', 'book_id': 1, 'quantity': 2}).status_code, 200)
+        self.assertEqual(self.quantities(), {1: 2})
+        self.assertEqual(self.books.stock(1), 8)
+
+        self.update({'op': 'set', 'book_id': 1, 'quantity': 0})
+        self.assertEqual(self.quantities(), {})
+        self.assertEqual(self.books.stock(1), 10)
+
+    def test_invalid_operation_is_rejected(self):
+        response = self.update({'op': 'set', 'book_id': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('operations', response.data['errors'])
+
+
+class CartSummaryTests(CartApiTestCase):
+    """GET /carts/customer/<id>/summary/ follows every item change"""
+
+    def test_summary_is_recomputed_after_add_update_and_remove(self):
+        self.assertEqual(self.summary()['item_count'], 0)
+
+        response = self.client.post('/api/v1/carts/customer/1/add/', {'book_id': 1, 'quantity': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        summary = self.summary()
+        self.assertEqual((summary['item_count'], summary['total_quantity'], summary['subtotal']), (1, 2, '20.00'))
+        self.assertFalse(summary['prices_stale'])
+
+        self.update({'op': 'set', 'book_id': 2, 'quantity': 2})
+        summary = self.summary()
+        self.assertEqual((summary['item_count'], summary['total_quantity'], summary['subtotal']), (2, 4, '25.00'))
+
+        item = CartItem.objects.get(cart__customer_id=1, book_id=1)
+        self.assertEqual(self.client.delete(f'/api/v1/carts/item/{item.pk}/').status_code, 200)
+        summary = self.summary()
+        self.assertEqual((summary['item_count'], summary['total_quantity'], summary['subtotal']), (1, 2, '5.00'))
+        self.assertEqual(self.books.stock(1), 10)
+
+    @override_settings(CART_PRICE_MAX_AGE=60)
+    def test_reading_a_stale_cart_reprices_it(self):
+        self.update({'op': 'add', 'book_id': 1, 'quantity': 2})
+        CartItem.objects.update(priced_at=timezone.now() - timedelta(minutes=5))
+        Cart.objects.get(customer_id=1).refresh_summary()
+        self.assertTrue(self.summary()['prices_stale'])
+
+        self.books.books[1]['price'] = '12.00'
+        self.assertEqual(self.client.get('/api/v1/carts/customer/1/').status_code, 200)
+        summary = self.summary()
+        self.assertEqual(summary['subtotal'], '24.00')
+        self.assertFalse(summary['prices_stale'])
+
+    @override_settings(CART_PRICE_MAX_AGE=60)
+    def test_stale_cart_shown_with_placeholders_is_not_repriced(self):
+        self.update({'op': 'add', 'book_id': 1}, {'op': 'add', 'book_id': 2})
+        CartItem.objects.update(priced_at=timezone.now() - timedelta(minutes=5))
+        Cart.objects.get(customer_id=1).refresh_summary()
+
+        unavailable = self.books.books.pop(2)
+        with mock.patch('carts.views.reprice_cart') as reprice_cart:
+            self.assertEqual(self.client.get('/api/v1/carts/customer/1/').status_code, 200)
+        reprice_cart.assert_not_called()
+        self.assertTrue(self.summary()['prices_stale'])
+
+        self.books.books[2] = unavailable
+        self.client.get('/api/v1/carts/customer/1/')
+        self.assertFalse(self.summary()['prices_stale'])
+
+    @override_settings(CUSTOMER_TOKEN_KEYS=['cart-test-key'], CUSTOMER_TOKEN_REQUIRED=True)
+    def test_summary_requires_the_customers_token(self):
+        self.assertEqual(self.client.get('/api/v1/carts/customer/1/summary/').status_code, 401)
+        with mock.patch('cart_service.services.customer_tokens.get_revocation_list', return_value=loaded_revocations()):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(2, "cart-test-key")}')
+            self.assertEqual(self.client.get('/api/v1/carts/customer/1/summary/').status_code, 403)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(1, "cart-test-key")}')
+            self.assertEqual(self.client.get('/api/v1/carts/customer/1/summary/').status_code, 200)
+
+    @override_settings(CUSTOMER_TOKEN_KEYS=['cart-test-key'])
+    def test_removing_an_item_requires_the_owners_token(self):
+        self.update({'op': 'add', 'book_id': 1, 'quantity': 2})
+        item = CartItem.objects.get()
+        url = f'/api/v1/carts/item/{item.pk}/'
+        with mock.patch('cart_service.services.customer_tokens.get_revocation_list', return_value=loaded_revocations()):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(2, "cart-test-key")}')
+            self.assertEqual(self.client.delete(url).status_code, 403)
+            self.assertEqual(self.books.stock(1), 8)
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {make_token(1, "cart-test-key")}')
+            self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.books.stock(1), 10)
+
+
+@override_settings(CUSTOMER_TOKEN_KEYS=['new-key', 'old-key'])
+class CustomerTokenTests(SimpleTestCase):
+    """Local token verification, key rotation and revocation"""
+
+    def test_valid_token_carries_the_customer(self):
+        self.assertEqual(verify_token(make_token(7, 'new-key')), 7)
+
+    def test_token_signed_with_a_fallback_key_is_accepted_until_the_key_is_dropped(self):
+        token = make_token(7, 'old-key')
+        self.assertEqual(verify_token(token), 7)
+        with override_settings(CUSTOMER_TOKEN_KEYS=['new-key']):
+            with self.assertRaises(InvalidToken):
+                verify_token(token)
+
+    def test_forged_and_expired_tokens_are_rejected(self):
+        for token in (make_token(7, 'other-key'), make_token(7, 'new-key', ttl=-1), 'garbage'):
+            with self.assertRaises(InvalidToken):
+                verify_token(token)
+
+    def test_token_error_by_case(self):
+        headers = {'Authorization': f'Bearer {make_token(7, "new-key")}'}
+        with mock.patch('cart_service.services.customer_tokens.get_revocation_list',
+                        return_value=loaded_revocations([7])):
+            self.assertEqual(customer_token_error({}, 7), ('Authentication token required', 401))
+            self.assertEqual(customer_token_error({'Authorization': 'Bearer x'}, 7)[1], 401)
+            self.assertEqual(customer_token_error(headers, 8)[1], 403)
+            self.assertEqual(customer_token_error(headers, 7), ('Customer not found', 404))
+
+    @mock.patch('cart_service.services.customer_service_client.CustomerServiceClient.get_revoked_customers')
+    def test_revocation_list_is_loaded_before_the_first_check(self, get_revoked_customers):
+        get_revoked_customers.return_value = [7]
+        revocations = RevocationList(refresh_interval=60)
+        self.assertTrue(revocations.is_revoked(7))
+        self.assertFalse(revocations.is_revoked(8))
+        self.assertEqual(get_revoked_customers.call_count, 1)
+
+    @mock.patch('cart_service.services.customer_service_client.CustomerServiceClient.get_revoked_customers')
+    def test_tokens_are_rejected_until_the_revocation_list_loads(self, get_revoked_customers):
+        get_revoked_customers.return_value = None
+        headers = {'Authorization': f'Bearer {make_token(7, "new-key")}'}
+        revocations = RevocationList(refresh_interval=60)
+        with mock.patch('cart_service.services.customer_tokens.get_revocation_list', return_value=revocations):
+            self.assertEqual(customer_token_error(headers, 7), ('Customer service unavailable', 503))
+            # A failed load is not retried by every request
+            self.assertEqual(customer_token_error(headers, 7)[1], 503)
+            self.assertEqual(get_revoked_customers.call_count, 1)
+
+            get_revoked_customers.return_value = []
+            revocations._next_refresh = 0.0
+            self.assertIsNone(customer_token_error(headers, 7))
+
+
+class MetricsSnapshotTests(TestCase):
+    """Merging the snapshots of several worker processes"""
+
+    def test_snapshots_of_exited_workers_are_dropped(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(os.path.join(directory, name)) for name in os.listdir(directory)])
+        live = os.path.join(directory, f'cart-{os.getppid()}.json')
+        dead = os.path.join(directory, 'cart-999999999.json')
+        for path in (live, dead):
+            with open(path, 'w') as f:
+                json.dump([['worker_test_gauge', [], 5]], f)
+        with override_settings(METRICS={'MULTIPROCESS_DIR': directory}, SERVICE_NAME='cart'):
+            merged = metrics.collect()
+        self.assertEqual(merged[('worker_test_gauge', ())], 5)
+        self.assertTrue(os.path.exists(live))
+        self.assertFalse(os.path.exists(dead))
+
+
+class ReplicationMetricsTests(TestCase):
+    """/metrics reports the book snapshot replication lag"""
+
+    def test_lag_and_cursor_position_are_exported(self):
+        self.assertNotIn(('book_replication_lag_seconds', ()), metrics.collect())
+        ReplicationCursor.objects.create(
+            name=CURSOR_NAME, position=42, caught_up_at=timezone.now() - timedelta(seconds=30)
+        )
+        merged = metrics.collect()
+        self.assertEqual(merged[('book_replication_last_change_id', ())], 42)
+        self.assertGreaterEqual(merged[('book_replication_lag_seconds', ())], 30)
+
+
+async def async_view(request):
+    return HttpResponse('ok')
+
+
+def sync_view(request):
+    return HttpResponse('ok')
+
+
+class AsyncMiddlewareTests(SimpleTestCase):
+    """Shared middleware keeps async views on the event loop under ASGI"""
+
+    def test_tracing_middleware_follows_the_handler(self):
+        self.assertFalse(iscoroutinefunction(TracingMiddleware(sync_view)))
+        middleware = TracingMiddleware(async_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().get('/', HTTP_X_REQUEST_ID='trace-1'))
+        self.assertEqual(response['X-Request-ID'], 'trace-1')
+
+    @override_settings(CUSTOMER_TOKEN_REQUIRED=True)
+    def test_async_view_through_the_middleware_stack(self):
+        response = async_to_sync(AsyncClient().get)('/api/v1/async/carts/customer/1/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('X-Request-ID', response)
@@ -2,10 +2,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CartViewSet
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'carts', CartViewSet, basename='cart')
 
 urlpatterns = [
     path('api/v1/', include(router.urls)),
+    # Async variants (concurrent outbound calls, best served under ASGI)
+    path('api/v1/async/carts/customer/<int:customer_id>/', async_views.get_by_customer, name='async-cart-detail'),
+    path('api/v1/async/carts/customer/<int:customer_id>/add/', async_views.add_item, name='async-cart-add'),
 ]
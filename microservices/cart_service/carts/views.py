@@ -1,15 +1,31 @@
 """Views for Cart API"""
+from decimal import Decimal
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from .models import Cart, CartItem
+from .models import Cart, CartItem, CartItemReservation
+from .replication import SnapshotBookSource
 from .serializers import (
     CartSerializer,
     CartItemSerializer,
-    AddToCartSerializer
+    AddToCartSerializer,
+    CartItemOperationSerializer,
+    CartSummarySerializer,
+    UpdateCartItemsSerializer
+)
+from cart_service.services import (
+    BookLookup,
+    BookServiceClient,
+    CustomerServiceClient,
+    customer_token_error,
+    uses_token
 )
-from cart_service.services import BookServiceClient, CustomerServiceClient
 
 
 class CartViewSet(viewsets.ModelViewSet):
@@ -20,22 +36,70 @@ class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [AllowAny]
     
+    @property
+    def book_lookup(self):
+        """Book lookups memoized for the current request"""
+        if not hasattr(self.request, 'book_lookup'):
+            self.request.book_lookup = BookLookup(local=SnapshotBookSource())
+        return self.request.book_lookup
+    
+    def get_serializer_context(self):
+        """Share the request-scoped book lookup with serializers"""
+        context = super().get_serializer_context()
+        context['book_lookup'] = self.book_lookup
+        return context
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Report book lookup hits/misses in a debug header"""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        lookup = getattr(request, 'book_lookup', None)
+        if lookup is not None and getattr(settings, 'BOOK_LOOKUP_DEBUG_HEADER', settings.DEBUG):
+            response['X-Book-Lookup'] = lookup.stats_header()
+        return response
+    
     @action(detail=False, methods=['get'], url_path='customer/(?P<customer_id>[^/.]+)')
     def get_by_customer(self, request, customer_id=None):
         """Get cart by customer ID"""
-        # Validate customer exists
-        customer_client = CustomerServiceClient()
-        if not customer_client.validate_customer(customer_id):
+        error = customer_error(request, customer_id)
+        if error:
             return Response(
                 {
                     'success': False,
-                    'message': 'Customer not found'
+                    'message': error[0]
                 },
-                status=status.HTTP_404_NOT_FOUND
+                status=error[1]
             )
         
         cart, created = Cart.objects.get_or_create(customer_id=customer_id)
+        prefetch_related_objects([cart], 'items')
         serializer = self.get_serializer(cart)
+        data = serializer.data
+        if cart.prices_stale(getattr(settings, 'CART_PRICE_MAX_AGE', 300)):
+            # Books were just looked up for the response; reuse them to refresh the summary
+            reprice_if_fetched(cart, self.book_lookup.get_many(item.book_id for item in cart.items.all()))
+        return Response(
+            {
+                'success': True,
+                'data': data
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['get'], url_path='customer/(?P<customer_id>[^/.]+)/summary')
+    def summary(self, request, customer_id=None):
+        """Item count and subtotal from the cart row alone (no book lookups)"""
+        error = customer_error(request, customer_id)
+        if error:
+            return Response(
+                {
+                    'success': False,
+                    'message': error[0]
+                },
+                status=error[1]
+            )
+        
+        cart = Cart.objects.filter(customer_id=customer_id).first() or Cart(customer_id=customer_id)
+        serializer = CartSummarySerializer(cart, context=self.get_serializer_context())
         return Response(
             {
                 'success': True,
@@ -47,15 +111,14 @@ class CartViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'], url_path='customer/(?P<customer_id>[^/.]+)/add')
     def add_item(self, request, customer_id=None):
         """Add item to cart"""
-        # Validate customer
-        customer_client = CustomerServiceClient()
-        if not customer_client.validate_customer(customer_id):
+        error = customer_error(request, customer_id)
+        if error:
             return Response(
                 {
                     'success': False,
-                    'message': 'Customer not found'
+                    'message': error[0]
                 },
-                status=status.HTTP_404_NOT_FOUND
+                status=error[1]
             )
         
         serializer = AddToCartSerializer(data=request.data)
@@ -71,58 +134,84 @@ class CartViewSet(viewsets.ModelViewSet):
         book_id = serializer.validated_data['book_id']
         quantity = serializer.validated_data['quantity']
         
-        # Validate book exists and check stock
+        # Reserve the stock in book-service (atomic there, no local check-then-act)
         book_client = BookServiceClient()
-        book = book_client.get_book(book_id)
-        if not book:
+        status_code, data = book_client.reserve_stock(
+            book_id, quantity, ttl=getattr(settings, 'BOOK_RESERVATION_TTL', None)
+        )
+        error = reservation_error(status_code, data)
+        if error:
             return Response(
                 {
                     'success': False,
-                    'message': 'Book not found'
+                    'message': error[0]
                 },
-                status=status.HTTP_404_NOT_FOUND
+                status=error[1]
             )
+        reservation = data['data']
+        self.book_lookup.prime([book_id], {book_id: reservation['book']})
+        
+        try:
+            cart_item = add_book_to_cart(customer_id, book_id, quantity, reservation)
+        except DatabaseError:
+            book_client.release_reservation(reservation['id'])
+            raise
         
-        # Check stock availability
-        if book.get('stock', 0) < quantity:
+        item_serializer = CartItemSerializer(cart_item, context=self.get_serializer_context())
+        return Response(
+            {
+                'success': True,
+                'message': 'Item added to cart',
+                'data': item_serializer.data
+            },
+            status=status.HTTP_200_OK
+        )
+    
+    @action(detail=False, methods=['patch'], url_path='customer/(?P<customer_id>[^/.]+)/items')
+    def update_items(self, request, customer_id=None):
+        """Apply a batch of add/set/remove operations to the cart atomically"""
+        error = customer_error(request, customer_id)
+        if error:
             return Response(
                 {
                     'success': False,
-                    'message': f'Insufficient stock. Available: {book.get("stock", 0)}'
+                    'message': error[0]
                 },
-                status=status.HTTP_400_BAD_REQUEST
+                status=error[1]
             )
         
-        # Get or create cart
-        cart, _ = Cart.objects.get_or_create(customer_id=customer_id)
+        serializer = UpdateCartItemsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {
+                    'success': False,
+                    'errors': serializer.errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        operations = serializer.validated_data['operations']
         
-        # Get or create cart item
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            book_id=book_id,
-            defaults={'quantity': quantity}
+        # One batched lookup for every book that is added or set
+        books = self.book_lookup.get_many(
+            op['book_id'] for op in operations if op['op'] != CartItemOperationSerializer.REMOVE
         )
+        cart, errors = apply_cart_operations(customer_id, operations, books)
+        if errors:
+            return Response(
+                {
+                    'success': False,
+                    'message': 'No changes were applied',
+                    'errors': errors
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        if not created:
-            # Check if new total quantity exceeds stock
-            new_quantity = cart_item.quantity + quantity
-            if book.get('stock', 0) < new_quantity:
-                return Response(
-                    {
-                        'success': False,
-                        'message': f'Cannot add more items. Stock limit exceeded.'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            cart_item.quantity = new_quantity
-            cart_item.save()
-        
-        item_serializer = CartItemSerializer(cart_item)
+        prefetch_related_objects([cart], 'items')
         return Response(
             {
                 'success': True,
-                'message': 'Item added to cart',
-                'data': item_serializer.data
+                'message': 'Cart updated',
+                'data': self.get_serializer(cart).data
             },
             status=status.HTTP_200_OK
         )
@@ -131,20 +220,331 @@ class CartViewSet(viewsets.ModelViewSet):
     def remove_item(self, request, item_id=None):
         """Remove item from cart"""
         try:
-            cart_item = CartItem.objects.get(id=item_id)
-            cart_item.delete()
+            cart_item = CartItem.objects.select_related('cart').get(id=item_id)
+        except (CartItem.DoesNotExist, ValueError):
             return Response(
                 {
-                    'success': True,
-                    'message': 'Item removed from cart'
+                    'success': False,
+                    'message': 'Cart item not found'
                 },
-                status=status.HTTP_200_OK
+                status=status.HTTP_404_NOT_FOUND
             )
-        except CartItem.DoesNotExist:
+        error = customer_error(request, cart_item.cart.customer_id)
+        if error:
             return Response(
                 {
                     'success': False,
-                    'message': 'Cart item not found'
+                    'message': error[0]
                 },
-                status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+                status=error[1]
+            )
+        
+        release_cart_item_reservations(cart_item)
+        with transaction.atomic():
+            cart = Cart.lock(cart_item.cart.customer_id)
+            cart_item.delete()
+            cart.refresh_summary()
+        return Response(
+            {
+                'success': True,
+                'message': 'Item removed from cart'
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+def customer_error(request, customer_id):
+    """(message, HTTP status) when the request may not use this customer's cart; None if it may
+
+    A bearer token is verified locally. Requests without one (allowed unless
+    CUSTOMER_TOKEN_REQUIRED) still validate the customer with customer-service.
+    """
+    if uses_token(request.headers):
+        return customer_token_error(request.headers, customer_id)
+    if not CustomerServiceClient().validate_customer(customer_id):
+        return 'Customer not found', status.HTTP_404_NOT_FOUND
+    return None
+
+
+def reservation_error(status_code, data):
+    """Map a failed reserve_stock() call to (message, HTTP status); None on success"""
+    if status_code == 201:
+        return None
+    if status_code == 404:
+        return 'Book not found', status.HTTP_404_NOT_FOUND
+    if status_code == 409:
+        return f'Insufficient stock. Available: {data.get("available", 0)}', status.HTTP_400_BAD_REQUEST
+    if status_code == 400:
+        return 'Invalid reservation request', status.HTTP_400_BAD_REQUEST
+    return 'Book service unavailable', status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+def add_book_to_cart(customer_id, book_id, quantity, reservation):
+    """Add quantity of a book, already reserved in book-service, to the customer's cart"""
+    price = Decimal(reservation['book']['price'])
+    with transaction.atomic():
+        cart = Cart.lock(customer_id)
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=cart,
+            book_id=book_id,
+            defaults={'quantity': quantity, 'unit_price': price, 'priced_at': timezone.now()}
+        )
+        if not created:
+            CartItem.objects.filter(pk=cart_item.pk).update(
+                quantity=F('quantity') + quantity,
+                unit_price=price,
+                priced_at=timezone.now()
+            )
+            cart_item.refresh_from_db(fields=['quantity', 'unit_price', 'priced_at'])
+        CartItemReservation.objects.create(
+            cart_item=cart_item,
+            reservation_id=reservation['id'],
+            quantity=quantity,
+            expires_at=parse_datetime(reservation['expires_at'])
+        )
+        cart.refresh_summary()
+    return cart_item
+
+
+def release_cart_item_reservations(cart_item, client=None):
+    """Give back the stock still held for a cart item (best effort; unreleased holds expire)"""
+    reservations = list(cart_item.reservations.filter(expires_at__gt=timezone.now()))
+    if reservations:
+        release_holds(client or BookServiceClient(), reservations)
+
+
+def apply_cart_operations(customer_id, operations, books, client=None, attempts=3):
+    """Apply add/set/remove operations to the customer's cart atomically
+    
+    ``books`` maps book ID to book data for every added or set book. The
+    operations are applied in order to the current quantities; every
+    increase is then reserved in book-service with one bulk call (only the
+    added quantity, as ``add_item`` does) and the items are written in one transaction with
+    one bulk insert, one bulk update and one delete. Holds covering a
+    decrease or a removed item are released once that is committed.
+    
+    Returns (cart, None) on success or (None, errors) if any operation
+    fails, in which case nothing is written and every hold taken for the
+    batch is released. If the cart changes while the holds are taken, they
+    are released and the batch is retried.
+    """
+    errors = []
+    for index, operation in enumerate(operations):
+        if operation['op'] != CartItemOperationSerializer.REMOVE and operation['book_id'] not in books:
+            errors.append({'index': index, 'book_id': operation['book_id'], 'message': 'Book not found'})
+    if errors:
+        return None, errors
+    
+    client = client or BookServiceClient()
+    book_ids = {operation['book_id'] for operation in operations}
+    for _ in range(attempts):
+        current = dict(
+            CartItem.objects.filter(cart__customer_id=customer_id, book_id__in=book_ids)
+            .values_list('book_id', 'quantity')
+        )
+        quantities, last_index = target_quantities(current, operations)
+        holds, errors = reserve_increases(client, quantities, current, last_index)
+        if errors:
+            release_holds(client, holds.values())
+            return None, errors
+        try:
+            written = write_cart_items(customer_id, current, quantities, books, holds)
+        except DatabaseError:
+            release_holds(client, holds.values())
+            raise
+        if written is None:
+            release_holds(client, holds.values())
+            continue
+        cart, released, surplus = written
+        release_holds(client, released)
+        rehold(client, surplus)
+        return cart, None
+    return None, [{'index': None, 'book_id': None, 'message': 'The cart changed during the update; try again'}]
+
+
+def target_quantities(current, operations):
+    """Quantities after applying ``operations`` in order, and the last operation index per book"""
+    quantities = dict(current)
+    last_index = {}
+    for index, operation in enumerate(operations):
+        book_id = operation['book_id']
+        last_index[book_id] = index
+        if operation['op'] == CartItemOperationSerializer.ADD:
+            quantities[book_id] = quantities.get(book_id, 0) + operation['quantity']
+        elif operation['op'] == CartItemOperationSerializer.SET:
+            quantities[book_id] = operation['quantity']
+        else:
+            quantities[book_id] = 0
+    return quantities, last_index
+
+
+def reserve_increases(client, quantities, current, last_index):
+    """Reserve the added quantity of every increased item with one bulk call
+    
+    Returns ({book_id: reservation}, errors); book-service reserves all
+    or nothing, so there are no holds when there are errors.
+    """
+    increases = {
+        book_id: quantity - current.get(book_id, 0)
+        for book_id, quantity in quantities.items()
+        if quantity > current.get(book_id, 0)
+    }
+    if not increases:
+        return {}, []
+    status_code, data = client.reserve_stock_many(increases, ttl=getattr(settings, 'BOOK_RESERVATION_TTL', None))
+    if status_code == 201:
+        return {reservation['book_id']: reservation for reservation in data['data']}, []
+    if status_code == 409:
+        failures = [
+            (failure['book_id'], reservation_error(404 if failure['status'] == 'not_found' else 409, failure))
+            for failure in data['errors']
+        ]
+    else:
+        error = reservation_error(status_code, data)
+        failures = [(book_id, error) for book_id in increases]
+    errors = [
+        {'index': last_index[book_id], 'book_id': book_id, 'message': error[0]}
+        for book_id, error in failures
+    ]
+    return {}, sorted(errors, key=lambda error: error['index'])
+
+
+def release_holds(client, reservations):
+    """Release book-service reservations (dicts or CartItemReservation rows) with one call; best effort"""
+    reservation_ids = [
+        reservation['id'] if isinstance(reservation, dict) else reservation.reservation_id
+        for reservation in reservations
+    ]
+    if reservation_ids:
+        client.release_reservations(reservation_ids)
+
+
+def rehold(client, surplus):
+    """Reserve again, with one bulk call, what released holds took beyond each item's decrease
+    
+    ``surplus`` is [(item, quantity)]. Books that are short by now are
+    dropped and the rest retried once; best effort, like the release.
+    """
+    ttl = getattr(settings, 'BOOK_RESERVATION_TTL', None)
+    items = {item.book_id: (item, quantity) for item, quantity in surplus}
+    for _ in range(2):
+        if not items:
+            return
+        status_code, data = client.reserve_stock_many(
+            {book_id: quantity for book_id, (_, quantity) in items.items()}, ttl=ttl
+        )
+        if status_code != 409:
+            break
+        for failure in data['errors']:
+            items.pop(failure['book_id'], None)
+    if status_code != 201:
+        return
+    CartItemReservation.objects.bulk_create([
+        CartItemReservation(
+            cart_item=items[reservation['book_id']][0],
+            reservation_id=reservation['id'],
+            quantity=reservation['quantity'],
+            expires_at=parse_datetime(reservation['expires_at'])
+        )
+        for reservation in data['data']
+    ])
+
+
+def write_cart_items(customer_id, current, quantities, books, holds):
+    """Write the new quantities if the cart still holds ``current``
+    
+    Returns None when it changed meanwhile, otherwise (cart, holds to
+    release, [(item, quantity to reserve again)]). Released holds are
+    picked newest first until they cover the decrease; as holds can only
+    be released whole, any excess is reserved again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        cart = Cart.lock(customer_id)
+        items = {
+            item.book_id: item
+            for item in CartItem.objects.select_for_update().filter(cart=cart, book_id__in=quantities)
+        }
+        if {book_id: item.quantity for book_id, item in items.items()} != current:
+            return None
+        
+        to_create = []
+        to_update = []
+        to_delete = []
+        released = []
+        surplus = []
+        for book_id, quantity in quantities.items():
+            item = items.get(book_id)
+            if item is not None and quantity < item.quantity:
+                active = list(item.reservations.filter(expires_at__gt=now).order_by('-created_at'))
+                excess = sum(hold.quantity for hold in active) - quantity
+                while excess > 0 and active:
+                    hold = active.pop(0)
+                    released.append(hold)
+                    excess -= hold.quantity
+                if excess < 0 and quantity > 0:
+                    surplus.append((item, -excess))
+            if quantity <= 0:
+                if item is not None:
+                    to_delete.append(item.id)
+                continue
+            price = Decimal(books[book_id]['price'])
+            if item is None:
+                to_create.append(CartItem(
+                    cart=cart, book_id=book_id, quantity=quantity, unit_price=price, priced_at=now
+                ))
+            else:
+                item.quantity = quantity
+                item.unit_price = price
+                item.priced_at = now
+                to_update.append(item)
+        if released:
+            CartItemReservation.objects.filter(id__in=[hold.id for hold in released]).delete()
+        if to_delete:
+            CartItem.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity', 'unit_price', 'priced_at'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if holds:
+            item_ids = dict(
+                CartItem.objects.filter(cart=cart, book_id__in=holds).values_list('book_id', 'id')
+            )
+            CartItemReservation.objects.bulk_create([
+                CartItemReservation(
+                    cart_item_id=item_ids[book_id],
+                    reservation_id=reservation['id'],
+                    quantity=quantities[book_id] - current.get(book_id, 0),
+                    expires_at=parse_datetime(reservation['expires_at'])
+                )
+                for book_id, reservation in holds.items()
+            ])
+        cart.refresh_summary()
+    return cart, released, surplus
+
+
+def reprice_if_fetched(cart, books):
+    """Reprice a stale cart only if ``books`` has data for every item; returns True if it did
+    
+    A book missing from ``books`` was shown as a placeholder (book-service
+    unavailable, circuit open or book deleted). Repricing would then leave
+    the prices stale, so every read would take the cart lock again.
+    """
+    if any(item.book_id not in books for item in cart.items.all()):
+        return False
+    reprice_cart(cart.customer_id, books)
+    return True
+
+
+def reprice_cart(customer_id, books):
+    """Update item prices from freshly fetched book data and refresh the cart summary"""
+    now = timezone.now()
+    with transaction.atomic():
+        cart = Cart.lock(customer_id)
+        items = [item for item in cart.items.all() if item.book_id in books]
+        for item in items:
+            item.unit_price = Decimal(books[item.book_id]['price'])
+            item.priced_at = now
+        if items:
+            CartItem.objects.bulk_update(items, ['unit_price', 'priced_at'])
+        cart.refresh_summary()
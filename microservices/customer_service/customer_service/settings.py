@@ -10,11 +10,19 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+from importlib.util import find_spec
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Shared modules (metrics, tracing, wire format, db_pool) live in microservices/service_common
+if str(BASE_DIR.parent) not in sys.path:
+    sys.path.append(str(BASE_DIR.parent))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -42,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'service_common.tracing.TracingMiddleware',
+    'service_common.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +95,44 @@ DATABASES = {
     }
 }
 
+# Local SQLite database instead of MySQL (used by loadtest.py), e.g.
+# SERVICE_SQLITE_PATH=/tmp/customer_service.sqlite3 python manage.py runserver
+if os.environ.get('SERVICE_SQLITE_PATH'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['SERVICE_SQLITE_PATH'],
+            'OPTIONS': {
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file, not the default in-memory database: tests with several
+            # threads would otherwise fail with "database table is locked"
+            'TEST': {
+                'NAME': f"{os.environ['SERVICE_SQLITE_PATH']}.test",
+            },
+        }
+    }
+
+# Persistent connections: keep a worker's connection for DB_CONN_MAX_AGE
+# seconds and check it still works before reusing it in the next request.
+# DB_POOL=1 switches to a bounded per-process pool instead
+# (service_common/db_pool), which also reuses connections across the
+# threads of the development server; its stats are served at /metrics.
+DATABASE_POOL = {
+    'ENABLED': os.environ.get('DB_POOL') == '1',
+    'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),  # per process and alias
+    'TIMEOUT': 5,         # seconds to wait for a free connection
+    'MAX_LIFETIME': 300,  # seconds before a connection is replaced
+}
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = True
+    if DATABASE_POOL['ENABLED']:
+        database['ENGINE'] = database['ENGINE'].replace('django.db.backends.', 'service_common.db_pool.')
+        database['CONN_MAX_AGE'] = 0  # connections go back to the pool after every request
+    else:
+        database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -96,8 +144,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'service_common.wire.ContentNegotiation',
 }
 
+# MessagePack for internal calls (clients listing application/msgpack first in
+# Accept) when the optional msgpack package is installed; JSON stays the default
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('service_common.wire.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('service_common.wire.MessagePackParser')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,3 +194,29 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Request tracing (spans at /api/v1/traces/; set FILE to also append them as JSONL)
+SERVICE_NAME = 'customer'
+TRACING = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 5000,
+    'FILE': os.environ.get('TRACE_FILE'),
+}
+
+# Prometheus-style metrics at /metrics (set METRICS_DIR when running several
+# worker processes so the scrape merges all of them)
+METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_DIR'),
+    'FLUSH_INTERVAL': 5,
+}
+
+# Signed customer tokens issued at login. The first key signs, every key
+# verifies: to rotate, prepend a new key (on every service) and drop the old
+# one once CUSTOMER_TOKEN_TTL has passed. Must match cart_service.
+CUSTOMER_TOKEN_KEYS = [key for key in os.environ.get('CUSTOMER_TOKEN_KEYS', '').split(',') if key]
+if not CUSTOMER_TOKEN_KEYS:
+    if not DEBUG:
+        raise ImproperlyConfigured('Set CUSTOMER_TOKEN_KEYS: the development key is only used with DEBUG')
+    CUSTOMER_TOKEN_KEYS = ['dev-customer-token-key']
+CUSTOMER_TOKEN_TTL = 900  # seconds
@@ -25,3 +25,15 @@ class Customer(models.Model):
     def check_password(self, raw_password):
         """Check password"""
         return check_password(raw_password, self.password)
+
+
+class RevokedCustomer(models.Model):
+    """Deleted customer whose already issued tokens must be rejected"""
+    customer_id = models.BigIntegerField(unique=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'revoked_customers'
+
+    def __str__(self):
+        return f"Customer {self.customer_id} revoked at {self.revoked_at}"
@@ -1,3 +1,59 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.core import signing
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Customer, RevokedCustomer
+from .tokens import TOKEN_SALT
 
-# Create your tests here.
+
+class CustomerTokenTests(TestCase):
+    """Tokens issued at login"""
+
+    def setUp(self):
+        self.customer = Customer(name='Ann', email='ann@example.com')
+        self.customer.set_password('secret')
+        self.customer.save()
+        self.client = APIClient()
+
+    def login(self, password='secret'):
+        return self.client.post(
+            '/api/v1/customers/login/', {'email': 'ann@example.com', 'password': password}, format='json'
+        )
+
+    @override_settings(CUSTOMER_TOKEN_KEYS=['current-key'], CUSTOMER_TOKEN_TTL=60)
+    def test_login_issues_a_signed_token_for_the_customer(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['expires_in'], 60)
+        payload = signing.loads(response.data['token'], key='current-key', salt=TOKEN_SALT)
+        self.assertEqual(payload['sub'], self.customer.pk)
+        self.assertGreater(payload['exp'], timezone.now().timestamp())
+
+    def test_wrong_password_gets_no_token(self):
+        response = self.login(password='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('token', response.data)
+
+    @override_settings(CUSTOMER_TOKEN_KEYS=['new-key', 'old-key'])
+    def test_tokens_are_signed_with_the_first_key_after_rotation(self):
+        token = self.login().data['token']
+        self.assertEqual(signing.loads(token, key='new-key', salt=TOKEN_SALT)['sub'], self.customer.pk)
+        with self.assertRaises(signing.BadSignature):
+            signing.loads(token, key='old-key', salt=TOKEN_SALT)
+
+
+@override_settings(CUSTOMER_TOKEN_TTL=60)
+class RevokedCustomerTests(TestCase):
+    """DELETE revokes the customer; /customers/revoked/ lists recent revocations"""
+
+    def test_deleted_customer_is_listed_until_its_tokens_expire(self):
+        customer = Customer.objects.create(name='Bob', email='bob@example.com', password='x')
+        client = APIClient()
+        self.assertEqual(client.delete(f'/api/v1/customers/{customer.pk}/').status_code, 204)
+        self.assertEqual(client.get('/api/v1/customers/revoked/').data['data'], [customer.pk])
+
+        RevokedCustomer.objects.filter(customer_id=customer.pk).update(
+            revoked_at=timezone.now() - timedelta(seconds=61)
+        )
+        self.assertEqual(client.get('/api/v1/customers/revoked/').data['data'], [])
@@ -0,0 +1,33 @@
+"""Signed customer tokens
+
+``issue_token`` signs ``{'sub': customer_id, 'exp': ...}`` with HMAC-SHA256
+(``django.core.signing``) using the first key of ``CUSTOMER_TOKEN_KEYS``.
+Other services verify tokens locally with the same key list; older keys stay
+in the list after the first one until tokens signed with them have expired,
+which is how keys are rotated.
+"""
+import time
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+
+
+TOKEN_SALT = 'customers.token'
+
+
+def get_token_keys():
+    keys = getattr(settings, 'CUSTOMER_TOKEN_KEYS', None)
+    if not keys:
+        raise ImproperlyConfigured('CUSTOMER_TOKEN_KEYS is not configured')
+    return keys
+
+
+def get_token_ttl():
+    return getattr(settings, 'CUSTOMER_TOKEN_TTL', 900)
+
+
+def issue_token(customer):
+    """Return (token, expires_in seconds) for the customer"""
+    ttl = get_token_ttl()
+    payload = {'sub': customer.pk, 'exp': int(time.time()) + ttl}
+    return signing.dumps(payload, key=get_token_keys()[0], salt=TOKEN_SALT), ttl
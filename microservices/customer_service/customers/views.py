@@ -1,14 +1,18 @@
 """Views for Customer API"""
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from .models import Customer
+from .models import Customer, RevokedCustomer
 from .serializers import (
     CustomerSerializer,
     CustomerLoginSerializer,
     CustomerResponseSerializer
 )
+from .tokens import get_token_ttl, issue_token
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
@@ -48,6 +52,25 @@ class CustomerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
     
+    def perform_destroy(self, instance):
+        """Delete the customer and revoke the tokens already issued to them"""
+        with transaction.atomic():
+            RevokedCustomer.objects.get_or_create(customer_id=instance.pk)
+            instance.delete()
+    
+    @action(detail=False, methods=['get'])
+    def revoked(self, request):
+        """IDs of customers revoked while their tokens may still be valid"""
+        since = timezone.now() - timedelta(seconds=get_token_ttl())
+        customer_ids = RevokedCustomer.objects.filter(revoked_at__gte=since).values_list('customer_id', flat=True)
+        return Response(
+            {
+                'success': True,
+                'data': list(customer_ids)
+            },
+            status=status.HTTP_200_OK
+        )
+    
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
     def register(self, request):
         """Register a new customer"""
@@ -91,11 +114,14 @@ class CustomerViewSet(viewsets.ModelViewSet):
             customer = Customer.objects.get(email=email)
             if customer.check_password(password):
                 response_serializer = CustomerResponseSerializer(customer)
+                token, expires_in = issue_token(customer)
                 return Response(
                     {
                         'success': True,
                         'message': 'Login successful',
-                        'data': response_serializer.data
+                        'data': response_serializer.data,
+                        'token': token,
+                        'expires_in': expires_in
                     },
                     status=status.HTTP_200_OK
                 )
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+Load-testing harness for the bookstore microservices
+Usage: python loadtest.py [--users 20] [--duration 30] [--cart-items 20] [--json report.json]
+
+Boots customer, book and cart services on their own ports against fresh
+SQLite databases, seeds customers, books and carts, then runs concurrent
+virtual users through a weighted mix of scenarios:
+
+    browse   GET  /books/catalog/           (first page, random sort)
+    book     GET  /books/{id}/
+    cart     GET  /carts/customer/{id}/     (cart with --cart-items items)
+    summary  GET  /carts/customer/{id}/summary/
+    add      POST /carts/customer/{id}/add/
+    login    POST /customers/login/
+
+Throughput and p50/p95/p99 latency per scenario are printed as a table and
+optionally written as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+import start_services
+
+PASSWORD = 'loadtest-password'
+DEFAULT_MIX = 'browse=25,book=15,cart=25,summary=10,add=15,login=10'
+
+
+# Seeding (runs inside each service's Django environment, see seed_service)
+
+def seed_customers(count):
+    from django.contrib.auth.hashers import make_password
+    from customers.models import Customer
+    password = make_password(PASSWORD)  # hashing is slow; every customer shares one hash
+    Customer.objects.bulk_create(
+        [
+            Customer(name=f'Load Test {i}', email=f'loadtest-{i}@example.com', password=password)
+            for i in range(1, count + 1)
+        ],
+        batch_size=1000
+    )
+
+def seed_books(count):
+    from decimal import Decimal
+    from books.models import Book, BookChange
+    words = ['Django', 'Python', 'Service', 'Cart', 'Catalog', 'Cache', 'Queue', 'Index', 'Stream', 'Shard']
+    for start in range(0, count, 1000):
+        books = Book.objects.bulk_create([
+            Book(
+                title=f'{random.choice(words)} {random.choice(words)} {i}',
+                author=f'Author {i % 500}',
+                price=Decimal(random.randint(500, 10000)) / 100,
+                stock=1_000_000,
+            )
+            for i in range(start, min(start + 1000, count))
+        ])
+        BookChange.record_many(books, BookChange.CREATE)
+
+def seed_carts(count, books, items):
+    from carts.models import Cart, CartItem
+    carts = Cart.objects.bulk_create([Cart(customer_id=i) for i in range(1, count + 1)])
+    cart_items = []
+    for cart in carts:
+        for book_id in random.sample(range(1, books + 1), min(items, books)):
+            cart_items.append(CartItem(cart=cart, book_id=book_id, quantity=random.randint(1, 3)))
+    CartItem.objects.bulk_create(cart_items, batch_size=1000)
+    for cart in carts:
+        cart.refresh_summary()
+
+
+# Service processes
+
+class Stack:
+    """The three services on their own ports and SQLite files"""
+
+    def __init__(self, options, workdir):
+        self.options = options
+        self.workdir = workdir
+        self.services = []
+        self.processes = []
+        self.logs = []
+        for offset, service in enumerate(start_services.SERVICES):
+            service = dict(service, port=options.base_port + offset)
+            self.services.append(service)
+        ports = {service['module']: service['port'] for service in self.services}
+        self.urls = {
+            module: f'http://127.0.0.1:{port}/api/v1' for module, port in ports.items()
+        }
+
+    def env(self, service):
+        env = dict(os.environ)
+        env['SERVICE_SQLITE_PATH'] = str(self.workdir / f"{service['module']}.sqlite3")
+        env['CUSTOMER_SERVICE_URL'] = self.urls['customer_service']
+        env['BOOK_SERVICE_URL'] = self.urls['book_service']
+        return env
+
+    def manage(self, service, *args):
+        subprocess.run(
+            [sys.executable, 'manage.py', *args],
+            cwd=service['path'], env=self.env(service), check=True,
+            stdout=subprocess.DEVNULL
+        )
+
+    def prepare(self, volumes):
+        """Create and seed the databases (services in parallel)"""
+        threads = []
+        for service in self.services:
+            def run(service=service):
+                self.manage(service, 'migrate', '--noinput')
+                subprocess.run(
+                    [sys.executable, str(Path(__file__).resolve()), '_seed', service['module'], json.dumps(volumes)],
+                    cwd=service['path'], env=self.env(service), check=True
+                )
+            thread = threading.Thread(target=run)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def start(self):
+        for service in self.services:
+            log = open(self.workdir / f"{service['module']}.log", 'wb')
+            self.logs.append(log)
+            command = start_services.build_command(service, self.options)
+            if not self.options.prod:
+                command.insert(-1, '--noreload')
+            self.processes.append(subprocess.Popen(
+                command, cwd=service['path'], env=self.env(service),
+                stdout=log, stderr=subprocess.STDOUT
+            ))
+        deadline = time.monotonic() + self.options.ready_timeout
+        for service, process in zip(self.services, self.processes):
+            while not start_services.is_ready(service['port']):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f"{service['name']} did not start; see {self.workdir / (service['module'] + '.log')}"
+                    )
+                time.sleep(0.2)
+
+    def stop(self):
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in self.logs:
+            log.close()
+
+
+# Load generation
+
+class VirtualUser(threading.Thread):
+    """Runs randomly chosen scenarios back to back until the deadline"""
+
+    def __init__(self, urls, options, scenarios, weights, deadline, results):
+        super().__init__(daemon=True)
+        self.urls = urls
+        self.options = options
+        self.scenarios = scenarios
+        self.weights = weights
+        self.deadline = deadline
+        self.results = results
+        self.session = requests.Session()
+        self.random = random.Random()
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            name = self.random.choices(self.scenarios, self.weights)[0]
+            method, url, body = getattr(self, f'scenario_{name}')()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, json=body, timeout=30)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            self.results.append((name, time.perf_counter() - start, ok))
+
+    def scenario_browse(self):
+        sort = self.random.choice(['id', 'title', 'author', 'price'])
+        return 'GET', f"{self.urls['book_service']}/books/catalog/?page_size=50&sort={sort}", None
+
+    def scenario_book(self):
+        book_id = self.random.randint(1, self.options.books)
+        return 'GET', f"{self.urls['book_service']}/books/{book_id}/", None
+
+    def scenario_cart(self):
+        customer_id = self.random.randint(1, self.options.carts)
+        return 'GET', f"{self.urls['cart_service']}/carts/customer/{customer_id}/", None
+
+    def scenario_summary(self):
+        customer_id = self.random.randint(1, self.options.carts)
+        return 'GET', f"{self.urls['cart_service']}/carts/customer/{customer_id}/summary/", None
+
+    def scenario_add(self):
+        # Customers without a seeded cart, so the measured carts keep their size
+        first = self.options.carts + 1 if self.options.customers > self.options.carts else 1
+        customer_id = self.random.randint(first, self.options.customers)
+        body = {'book_id': self.random.randint(1, self.options.books), 'quantity': 1}
+        return 'POST', f"{self.urls['cart_service']}/carts/customer/{customer_id}/add/", body
+
+    def scenario_login(self):
+        customer_id = self.random.randint(1, self.options.customers)
+        body = {'email': f'loadtest-{customer_id}@example.com', 'password': PASSWORD}
+        return 'POST', f"{self.urls['customer_service']}/customers/login/", body
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    index = min(max(int(round(pct / 100 * len(samples) + 0.5)) - 1, 0), len(samples) - 1)
+    return samples[index]
+
+def summarize(results, elapsed):
+    """Per-scenario throughput and latency percentiles (milliseconds)"""
+    by_name = {}
+    for name, latency, ok in results:
+        by_name.setdefault(name, []).append((latency, ok))
+    by_name['all'] = [(latency, ok) for _, latency, ok in results]
+    report = {}
+    for name, samples in by_name.items():
+        latencies = sorted(latency for latency, _ in samples)
+        report[name] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, ok in samples if not ok),
+            'rps': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+        }
+    return report
+
+def print_table(report):
+    columns = ['requests', 'errors', 'rps', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    print(f"{'scenario':<10}" + ''.join(f'{column:>11}' for column in columns))
+    for name in sorted(report, key=lambda name: (name == 'all', name)):
+        row = report[name]
+        print(f'{name:<10}' + ''.join(f'{row[column]:>11}' for column in columns))
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if not hasattr(VirtualUser, f'scenario_{name.strip()}'):
+            raise argparse.ArgumentTypeError(f'Unknown scenario: {name}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load-test the bookstore microservices on SQLite')
+    parser.add_argument('--customers', type=int, default=200, help='Customers to seed')
+    parser.add_argument('--books', type=int, default=2000, help='Books to seed')
+    parser.add_argument('--carts', type=int, default=100, help='Carts to seed (customers 1..N)')
+    parser.add_argument('--cart-items', type=int, default=20, help='Items per seeded cart')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help=f'Scenario weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--json', help='Write the report as JSON to this file ("-" for stdout)')
+    parser.add_argument('--base-port', type=int, default=18001, help='Port of the first service')
+    parser.add_argument('--prod', action='store_true', help='Serve with gunicorn/uvicorn as start_services.py --prod')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Workers per service with --prod')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default=None)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ready-timeout', type=float, default=60)
+    parser.add_argument('--workdir', help='Keep databases and server logs in this directory')
+    options = parser.parse_args()
+    if isinstance(options.mix, str):
+        options.mix = parse_mix(options.mix)
+    options.carts = min(options.carts, options.customers)
+    return options
+
+def main():
+    options = parse_args()
+    workdir = Path(options.workdir or tempfile.mkdtemp(prefix='bookstore-loadtest-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    for database in workdir.glob('*.sqlite3'):
+        database.unlink()
+    stack = Stack(options, workdir)
+    try:
+        print(f"Seeding {options.customers} customers, {options.books} books, "
+              f"{options.carts} carts x {options.cart_items} items in {workdir}...")
+        stack.prepare({
+            'customers': options.customers,
+            'books': options.books,
+            'carts': options.carts,
+            'items': options.cart_items,
+        })
+        stack.start()
+        print(f"Running {options.users} virtual users for {options.duration}s...")
+        results = []
+        scenarios = list(options.mix)
+        weights = [options.mix[name] for name in scenarios]
+        deadline = time.monotonic() + options.duration
+        started = time.monotonic()
+        users = [
+            VirtualUser(stack.urls, options, scenarios, weights, deadline, results)
+            for _ in range(options.users)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        report = summarize(results, time.monotonic() - started)
+    finally:
+        stack.stop()
+        if not options.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_table(report)
+    if options.json:
+        payload = json.dumps({
+            'config': {
+                'customers': options.customers,
+                'books': options.books,
+                'carts': options.carts,
+                'cart_items': options.cart_items,
+                'users': options.users,
+                'duration': options.duration,
+                'mix': options.mix,
+                'prod': options.prod,
+            },
+            'scenarios': report,
+        }, indent=2)
+        if options.json == '-':
+            print(payload)
+        else:
+            Path(options.json).write_text(payload)
+            print(f"\nReport written to {options.json}")
+
+def seed_service(module, volumes):
+    """Entry point of ``loadtest.py _seed``: seed one service's database"""
+    sys.path.insert(0, os.getcwd())
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'{module}.settings')
+    import django
+    django.setup()
+    volumes = json.loads(volumes)
+    if module == 'customer_service':
+        seed_customers(volumes['customers'])
+    elif module == 'book_service':
+        seed_books(volumes['books'])
+    else:
+        seed_carts(volumes['carts'], books=volumes['books'], items=volumes['items'])
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '_seed':
+        seed_service(sys.argv[2], sys.argv[3])
+    else:
+        main()
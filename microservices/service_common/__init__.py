@@ -0,0 +1,5 @@
+"""Code shared by every service: metrics, tracing, wire format and db_pool
+
+Each service's settings put the ``microservices`` directory on ``sys.path``
+so this package is importable as ``service_common``.
+"""
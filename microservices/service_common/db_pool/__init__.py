@@ -0,0 +1,211 @@
+"""Bounded per-process database connection pool
+
+Database engines ``service_common.db_pool.mysql`` and
+``service_common.db_pool.sqlite3`` wrap Django's backends: instead of
+opening a connection for every request and closing it afterwards, each
+request checks a connection out of the pool of its database alias and
+returns it when Django closes it. The pool is shared by all threads of the
+process, so it also saves the connection setup under the threaded
+development server, where ``CONN_MAX_AGE`` cannot.
+
+- At most ``MAX_SIZE`` connections per process and alias; a request that
+  finds none free waits up to ``TIMEOUT`` seconds, then fails with
+  ``PoolTimeout`` (an ``OperationalError``)
+- Idle connections are reused most recently used first; with the alias'
+  ``CONN_HEALTH_CHECKS`` they are pinged before reuse and replaced when dead
+- Connections older than ``MAX_LIFETIME`` seconds, broken ones and those
+  returned in an unknown state are closed instead of going back to the pool
+
+Checkouts, wait time, timeouts, opened/closed connections and the pool size
+are exported through ``/metrics``.
+"""
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.utils import OperationalError
+from django.utils.functional import cached_property
+from .. import metrics
+
+
+DEFAULT_POOL_CONFIG = {
+    'ENABLED': False,
+    'MAX_SIZE': 10,       # connections per process and database alias
+    'TIMEOUT': 5,         # seconds a request waits for a free connection
+    'MAX_LIFETIME': 300,  # seconds before a connection is replaced
+}
+
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+metrics.define('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool by alias')
+metrics.define('db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a free connection')
+metrics.define('db_pool_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection', WAIT_BUCKETS)
+metrics.define('db_pool_connections', 'gauge', 'Pooled connections by alias and state (idle or in_use)')
+metrics.define('db_connections_closed_total', 'counter', 'Pooled connections closed by alias and reason')
+
+
+def get_pool_config():
+    config = dict(DEFAULT_POOL_CONFIG)
+    config.update(getattr(settings, 'DATABASE_POOL', {}))
+    return config
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Raw driver connections of one database alias"""
+
+    def __init__(self, alias, max_size, timeout, max_lifetime):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.idle = []         # most recently returned last
+        self.opened_at = {}    # raw connection -> monotonic time it was opened
+        self.size = 0          # idle + checked out + being opened
+        self._condition = threading.Condition()
+        self.labels = (('alias', alias),)
+
+    def checkout(self, connect, is_usable, health_check):
+        """A connection from the pool, or a new one from ``connect()`` while below ``max_size``"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.registry.inc('db_pool_timeouts_total', self.labels)
+                    raise PoolTimeout(
+                        f'No free connection for database "{self.alias}" '
+                        f'after {self.timeout}s ({self.max_size} in use)'
+                    )
+                self._condition.wait(remaining)
+            raw = self.idle.pop() if self.idle else None
+            if raw is None:
+                self.size += 1  # reserve the slot before connecting outside the lock
+        metrics.registry.observe('db_pool_wait_seconds', self.labels, time.monotonic() - start)
+        metrics.registry.inc('db_pool_checkouts_total', self.labels)
+
+        if raw is not None:
+            if self.expired(raw):
+                self.discard(raw, 'max_lifetime', keep_slot=True)
+                raw = None
+            elif health_check and not is_usable(raw):
+                self.discard(raw, 'health_check', keep_slot=True)
+                raw = None
+        if raw is None:
+            try:
+                raw = connect()
+            except Exception:
+                with self._condition:
+                    self.size -= 1
+                    self._condition.notify()
+                raise
+            self.opened_at[raw] = time.monotonic()
+            metrics.registry.inc('db_connections_opened_total', self.labels)
+        return raw
+
+    def checkin(self, raw, reusable):
+        """Give a checked out connection back; closed instead when not reusable or too old"""
+        if not reusable:
+            self.discard(raw, 'error')
+        elif self.expired(raw):
+            self.discard(raw, 'max_lifetime')
+        else:
+            with self._condition:
+                self.idle.append(raw)
+                self._condition.notify()
+
+    def discard(self, raw, reason, keep_slot=False):
+        """Close a checked out connection; ``keep_slot`` when the caller opens a replacement"""
+        self.opened_at.pop(raw, None)
+        if not keep_slot:
+            with self._condition:
+                self.size -= 1
+                self._condition.notify()
+        try:
+            raw.close()
+        except Exception:
+            pass  # already broken
+        metrics.registry.inc('db_connections_closed_total', self.labels + (('reason', reason),))
+
+    def expired(self, raw):
+        return time.monotonic() - self.opened_at.get(raw, 0) > self.max_lifetime
+
+    def collect(self, registry):
+        with self._condition:
+            idle, size = len(self.idle), self.size
+        registry.set('db_pool_connections', self.labels + (('state', 'idle'),), idle)
+        registry.set('db_pool_connections', self.labels + (('state', 'in_use'),), size - idle)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    """The pool of ``alias`` in this process (a forked worker gets a new one)"""
+    pool = _pools.get(alias)
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None or pool.pid != os.getpid():
+                config = get_pool_config()
+                pool = ConnectionPool(alias, config['MAX_SIZE'], config['TIMEOUT'], config['MAX_LIFETIME'])
+                _pools[alias] = pool
+                metrics.register_collector(pool.collect)
+    return pool
+
+
+class PooledDatabaseWrapperMixin:
+    """Take connections from the alias' pool and give them back on close"""
+    pooled = True
+
+    @cached_property
+    def pool(self):
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                f'Database "{self.alias}" uses a connection pool: set CONN_MAX_AGE to 0, '
+                f'connections go back to the pool after every request'
+            )
+        return get_pool(self.alias)
+
+    def get_new_connection(self, conn_params):
+        parent = super()
+        return self.pool.checkout(
+            lambda: parent.get_new_connection(conn_params),
+            self.raw_is_usable,
+            self.settings_dict['CONN_HEALTH_CHECKS'],
+        )
+
+    def raw_is_usable(self, raw):
+        try:
+            cursor = raw.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except self.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        raw = self.connection
+        # Closed inside atomic(): Django keeps the connection until the block
+        # exits, so it cannot go back to the pool
+        reusable = not self.in_atomic_block
+        try:
+            # Never hand an open transaction or a failed connection to the next request
+            if reusable and not self.get_autocommit():
+                raw.rollback()
+            if reusable and self.errors_occurred:
+                reusable = self.raw_is_usable(raw)
+        except self.Database.Error:
+            reusable = False
+        self.pool.checkin(raw, reusable)
@@ -0,0 +1,327 @@
+"""Prometheus-style metrics, served as text at ``/metrics``
+
+``MetricsMiddleware`` counts requests and observes their latency per route
+(the URL name) and status, and their DB query count and DB time per route
+and database alias. Service clients call
+``observe_outbound`` for every downstream call. Apps can add values read at
+scrape time (e.g. cache counters) with ``register_collector``, and values
+derived from the merged totals of all processes (e.g. hit ratios) with
+``register_derived``.
+
+Every process keeps its own registry; updates only take a short in-process
+lock. With several worker processes, set ``METRICS['MULTIPROCESS_DIR']``:
+each process then writes a snapshot file there at most every
+``FLUSH_INTERVAL`` seconds and ``/metrics`` sums the snapshots of all
+live processes of the service. Snapshots of exited workers are deleted, so
+their gauges stop counting (Prometheus sees their counters as a reset).
+
+Every database connection opened is counted, so connection churn shows up
+when persistent connections or the pool (``db_pool``) are not doing their job.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+
+DEFAULT_METRICS_CONFIG = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': None,  # shared directory for per-process snapshot files
+    'FLUSH_INTERVAL': 5,       # seconds between snapshot writes of one process
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Inbound HTTP requests by route, method and status', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Inbound request latency by route and method', LATENCY_BUCKETS),
+    'db_queries_per_request': (
+        'histogram', 'Database queries executed per request by route and alias', QUERY_COUNT_BUCKETS),
+    'db_query_seconds_per_request': (
+        'histogram', 'Time spent in database queries per request by route and alias', LATENCY_BUCKETS),
+    'outbound_request_duration_seconds': (
+        'histogram', 'Outbound HTTP call latency by downstream service, method and status', LATENCY_BUCKETS),
+    'db_connections_opened_total': (
+        'counter', 'Database connections opened by alias (connection churn)', None),
+}
+
+
+def get_metrics_config():
+    config = dict(DEFAULT_METRICS_CONFIG)
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+class Registry:
+    """Counters and histograms of one process"""
+
+    def __init__(self):
+        self.values = {}  # (name, labels) -> float, or [bucket counts..., sum, count]
+        self.collectors = []
+        self.derived = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self.values[(name, labels)] = value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        """Serializable copy of all values, after running the collectors"""
+        for collector in self.collectors:
+            collector(self)
+        with self._lock:
+            return [
+                [name, list(labels), list(value) if isinstance(value, list) else value]
+                for (name, labels), value in self.values.items()
+            ]
+
+
+registry = Registry()
+_last_flush = 0.0
+
+
+def define(name, metric_type, help_text, buckets=None):
+    """Declare a metric added by an app (``counter``, ``gauge`` or ``histogram``)"""
+    METRICS[name] = (metric_type, help_text, buckets)
+
+
+def register_collector(collector):
+    """Call ``collector(registry)`` before every snapshot, to set scrape-time values"""
+    registry.collectors.append(collector)
+
+
+def register_derived(derive):
+    """Call ``derive(merged)`` on the merged totals, to add values such as ratios"""
+    registry.derived.append(derive)
+
+
+def observe_outbound(downstream, method, status, duration):
+    """Record one outbound call; ``status`` is None when no response was received"""
+    registry.observe(
+        'outbound_request_duration_seconds',
+        (('downstream', downstream), ('method', method), ('status', str(status or 'error'))),
+        duration
+    )
+
+
+def _count_connection(sender, connection, **kwargs):
+    # Pooled connections are counted by their pool, which only opens a real one now and then
+    if not getattr(connection, 'pooled', False):
+        registry.inc('db_connections_opened_total', (('alias', connection.alias),))
+
+
+connection_created.connect(_count_connection)
+
+
+def _snapshot_path(directory):
+    return os.path.join(directory, f"{getattr(settings, 'SERVICE_NAME', 'service')}-{os.getpid()}.json")
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return True  # no cheap check; snapshots of exited workers are kept
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def flush(force=False):
+    """Write this process's snapshot to the multiprocess directory (rate limited)"""
+    global _last_flush
+    directory = get_metrics_config()['MULTIPROCESS_DIR']
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < get_metrics_config()['FLUSH_INTERVAL']:
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp_path, _snapshot_path(directory))
+
+
+def collect():
+    """Merged values of every process of this service"""
+    directory = get_metrics_config()['MULTIPROCESS_DIR']
+    if not directory:
+        snapshots = [registry.snapshot()]
+    else:
+        flush(force=True)
+        prefix = f"{getattr(settings, 'SERVICE_NAME', 'service')}-"
+        snapshots = []
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix) and filename.endswith('.json'):
+                pid = filename[len(prefix):-len('.json')]
+                if pid.isdigit() and not _pid_alive(int(pid)):
+                    # Exited worker: its gauges (pool size, cache entries) no longer exist
+                    try:
+                        os.remove(os.path.join(directory, filename))
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced right now; picked up next scrape
+    merged = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            key = (name, tuple(tuple(label) for label in labels))
+            if isinstance(value, list):
+                total = merged.setdefault(key, [0] * len(value))
+                for i, amount in enumerate(value):
+                    total[i] += amount
+            else:
+                merged[key] = merged.get(key, 0) + value
+    for derive in registry.derived:
+        derive(merged)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render(merged):
+    """Prometheus text exposition format"""
+    by_name = {}
+    for (name, labels), value in merged.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name in sorted(by_name):
+        metric_type, help_text, buckets = METRICS.get(name, ('gauge', name, None))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in sorted(by_name[name]):
+            if metric_type == 'histogram':
+                for bound, count in zip(buckets, value):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Serve all metrics in the Prometheus text format"""
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class QueryTimer:
+    """``connection.execute_wrapper`` that counts queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Request count, latency and DB usage per route
+
+    Sync and async capable, so async views under ASGI stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = get_metrics_config()['ENABLED']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled or request.path == '/metrics':
+            return self.get_response(request)
+        timers = self.query_timers()
+        start = time.perf_counter()
+        with self.timing_queries(timers):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timers)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled or request.path == '/metrics':
+            return await self.get_response(request)
+        timers = self.query_timers()
+        start = time.perf_counter()
+        with self.timing_queries(timers):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, timers)
+        return response
+
+    def query_timers(self):
+        # Every alias, so reads routed to a replica are measured too
+        return {alias: QueryTimer() for alias in connections}
+
+    def timing_queries(self, timers):
+        stack = ExitStack()
+        for alias, timer in timers.items():
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+        return stack
+
+    def record(self, request, response, duration, timers):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('http_request_duration_seconds', labels, duration)
+        for alias, timer in timers.items():
+            db_labels = (('route', route), ('alias', alias))
+            registry.observe('db_queries_per_request', db_labels, timer.count)
+            registry.observe('db_query_seconds_per_request', db_labels, timer.seconds)
+        flush()
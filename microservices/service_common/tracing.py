@@ -0,0 +1,200 @@
+"""Request tracing across services
+
+``TracingMiddleware`` takes the request id from the ``X-Request-ID`` header
+(or creates one) and records a server span for every inbound request. Service
+clients record a client span for every outbound call and forward the request
+id and their span id (``X-Parent-Span-ID``), so the spans of all services form
+one tree per request.
+
+Spans go to an in-process ring buffer, queryable at ``/api/v1/traces/``, and
+optionally to a JSONL file shared by all services (``TRACING['FILE']``).
+"""
+import contextvars
+import json
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+PARENT_SPAN_HEADER = 'X-Parent-Span-ID'
+
+DEFAULT_TRACING_CONFIG = {
+    'ENABLED': True,
+    'BUFFER_SIZE': 5000,  # spans kept in memory per process
+    'FILE': None,         # JSONL file to append spans to
+}
+
+_valid_id = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_current = contextvars.ContextVar('trace_context', default=None)  # (trace_id, span_id)
+
+
+def get_tracing_config():
+    config = dict(DEFAULT_TRACING_CONFIG)
+    config.update(getattr(settings, 'TRACING', {}))
+    return config
+
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+
+class SpanCollector:
+    """Ring buffer of finished spans, optionally mirrored to a JSONL file"""
+
+    def __init__(self, size, path=None):
+        self.spans = deque(maxlen=size)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        self.spans.append(span)
+        if self.path:
+            line = json.dumps(span, separators=(',', ':')) + '\n'
+            with self._lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+
+    def trace(self, trace_id):
+        return [span for span in list(self.spans) if span['trace_id'] == trace_id]
+
+    def recent(self, limit):
+        return list(self.spans)[-limit:]
+
+
+_collector = None
+
+
+def get_collector():
+    global _collector
+    if _collector is None:
+        config = get_tracing_config()
+        _collector = SpanCollector(config['BUFFER_SIZE'], config['FILE'])
+    return _collector
+
+
+def current_request_id():
+    context = _current.get()
+    return context[0] if context else None
+
+
+@contextmanager
+def span(kind, name, **attributes):
+    """Time a block as a span of the current trace; yields the span dict to annotate"""
+    if not get_tracing_config()['ENABLED']:
+        yield {}
+        return
+    parent = _current.get()
+    trace_id = attributes.pop('trace_id', None) or (parent[0] if parent else new_id())
+    parent_id = attributes.pop('parent_id', None) or (parent[1] if parent else None)
+    record = {
+        'trace_id': trace_id,
+        'span_id': new_id(),
+        'parent_id': parent_id,
+        'service': getattr(settings, 'SERVICE_NAME', None),
+        'kind': kind,
+        'name': name,
+        'start': time.time(),
+        **attributes,
+    }
+    token = _current.set((trace_id, record['span_id']))
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        record['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        _current.reset(token)
+        get_collector().add(record)
+
+
+def outbound_headers():
+    """Headers that link a downstream call to the current span"""
+    context = _current.get()
+    if context is None:
+        return {}
+    return {REQUEST_ID_HEADER: context[0], PARENT_SPAN_HEADER: context[1]}
+
+
+@contextmanager
+def client_span(downstream, method, url):
+    """Span for an outbound call; yields (span, headers to send)"""
+    with span('client', f'{method} {url.split("?", 1)[0]}', downstream=downstream) as record:
+        yield record, outbound_headers()
+
+
+class TracingMiddleware:
+    """Records a server span per request and echoes the request id
+
+    Sync and async capable, so async views under ASGI stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.server_span(request) as record:
+            response = self.get_response(request)
+            self.finish(record, response)
+        return response
+
+    async def __acall__(self, request):
+        with self.server_span(request) as record:
+            response = await self.get_response(request)
+            self.finish(record, response)
+        return response
+
+    def server_span(self, request):
+        trace_id = request.headers.get(REQUEST_ID_HEADER, '')
+        parent_id = request.headers.get(PARENT_SPAN_HEADER, '')
+        return span(
+            'server',
+            f'{request.method} {request.path}',
+            trace_id=trace_id if _valid_id.match(trace_id) else None,
+            parent_id=parent_id if _valid_id.match(parent_id) else None,
+        )
+
+    def finish(self, record, response):
+        record['status'] = response.status_code
+        if not response.streaming:
+            record['bytes'] = len(response.content)
+        if 'trace_id' in record:
+            response[REQUEST_ID_HEADER] = record['trace_id']
+
+
+def traces_view(request):
+    """Spans of one trace (?trace_id=...) as a list and as a tree, or the latest spans"""
+    collector = get_collector()
+    trace_id = request.GET.get('trace_id')
+    if not trace_id:
+        try:
+            limit = max(1, min(int(request.GET.get('limit', 100)), collector.spans.maxlen))
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Parameter "limit" must be an integer'}, status=400)
+        return JsonResponse({'success': True, 'data': collector.recent(limit)})
+    spans = sorted(collector.trace(trace_id), key=lambda s: s['start'])
+    return JsonResponse({'success': True, 'data': spans, 'tree': build_tree(spans)})
+
+
+def build_tree(spans):
+    """Nest spans under their parents; spans whose parent is elsewhere become roots"""
+    nodes = {s['span_id']: dict(s, children=[]) for s in spans}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    return roots
@@ -0,0 +1,60 @@
+"""MessagePack wire format for service-to-service calls
+
+``msgpack`` is an optional dependency: the renderer and parser are only
+added to ``REST_FRAMEWORK`` when it is installed. JSON stays the first
+renderer, so public clients (no ``Accept`` header, ``*/*`` or
+``application/json``) keep getting JSON. ``ContentNegotiation`` serves
+MessagePack to clients that list ``application/msgpack`` first in
+``Accept``; DRF's default negotiation would pick JSON for
+``application/msgpack, application/json`` because of the renderer order.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+
+# Decimal, datetime, UUID, ... are encoded exactly as the JSON renderer does
+_encode_default = JSONEncoder().default
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except ValueError as e:
+            raise ParseError(f'MessagePack parse error - {e}')
+
+
+class ContentNegotiation(DefaultContentNegotiation):
+    """Default negotiation, except that MessagePack wins when the client lists it first"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        accept = request.META.get('HTTP_ACCEPT', '')
+        if accept.split(',', 1)[0].split(';', 1)[0].strip() == MSGPACK_MEDIA_TYPE:
+            for renderer in renderers:
+                if renderer.media_type == MSGPACK_MEDIA_TYPE:
+                    return renderer, MSGPACK_MEDIA_TYPE
+        return super().select_renderer(request, renderers, format_suffix)
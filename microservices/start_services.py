@@ -2,12 +2,34 @@
 """
 Start All Microservices Script
 Usage: python start_services.py
+       python start_services.py --prod [--workers 4] [--server gunicorn|uvicorn]
+
+Development mode runs each service with ``manage.py runserver``.
+``--prod`` runs each service under a multi-worker WSGI/ASGI server
+(gunicorn and/or uvicorn, installed separately), starts all services at
+once, waits for HTTP readiness probes and restarts a service that crashes,
+backing off between attempts.
+
+Service output is drained by a single selector thread, prefixed with a
+timestamp and the service name, written to size-rotated files under
+``logs/`` and mirrored to the console from ``--console-level`` up.
 """
+import argparse
+import importlib.util
+import logging
+import logging.handlers
+import queue
+import selectors
+import shutil
 import subprocess
+import threading
 import time
 import os
 import sys
 import signal
+import tempfile
+import urllib.error
+import urllib.request
 from pathlib import Path
 
 # Get base directory
@@ -18,47 +40,305 @@ SERVICES = [
     {
         'name': 'Customer Service',
         'path': BASE_DIR / 'customer_service',
+        'module': 'customer_service',
         'port': 8001,
+        'asgi': False,
     },
     {
         'name': 'Book Service',
         'path': BASE_DIR / 'book_service',
+        'module': 'book_service',
         'port': 8002,
+        'asgi': False,
     },
     {
         'name': 'Cart Service',
         'path': BASE_DIR / 'cart_service',
+        'module': 'cart_service',
         'port': 8003,
+        'asgi': True,  # async cart views benefit from an ASGI server
     }
 ]
 
+READY_PATH = '/api/v1/'    # API root: answers without touching the database
+READY_TIMEOUT = 30         # seconds to wait for all services to become ready
+RESTART_BACKOFF = 1        # first restart delay (seconds), doubled per crash ...
+RESTART_BACKOFF_MAX = 30   # ... up to this
+STABLE_SECONDS = 60        # uptime after which the backoff is reset
+
+LOG_DIR = BASE_DIR / 'logs'
+LOG_MAX_BYTES = 10 * 1024 * 1024  # rotate a service's log file at this size ...
+LOG_BACKUPS = 5                   # ... keeping this many old files
+LOG_QUEUE_SIZE = 1000             # chunks buffered for the writer before new ones are dropped
+LOG_READ_SIZE = 65536             # bytes read from a pipe at a time
+
 processes = []
+log_mux = None
+metrics_dir = None  # per-run snapshot directory created for --prod
+stopping = False
+
+class LogMultiplexer:
+    """Drains the stdout/stderr pipes of every service without blocking them
+    
+    A reader thread waits on all pipes with ``selectors`` and only queues
+    the raw chunks it reads, stamped with the read time. A writer thread
+    splits them into lines, prefixes them and writes each chunk to the
+    service's size-rotated file (and the console) in one call. If the
+    writer falls behind, chunks are dropped and counted rather than letting
+    a pipe fill up and stall a service.
+    """
+    
+    def __init__(self, log_dir, console_level, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.console_level = console_level
+        self.console = logging.StreamHandler(sys.stdout)
+        self.console.setFormatter(logging.Formatter('%(message)s'))
+        self.file_handlers = {}
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_loop, name='log-reader', daemon=True)
+        self.writer = threading.Thread(target=self._write_loop, name='log-writer', daemon=True)
+        self.reader.start()
+        self.writer.start()
+    
+    def add(self, service, process):
+        """Start draining a newly started process"""
+        name = service['module']
+        if name not in self.file_handlers:
+            file_handler = logging.handlers.RotatingFileHandler(
+                self.log_dir / f'{name}.log', maxBytes=self.max_bytes,
+                backupCount=self.backups, encoding='utf-8'
+            )
+            file_handler.setFormatter(logging.Formatter('%(message)s'))
+            self.file_handlers[name] = file_handler
+        for stream in (process.stdout, process.stderr):
+            os.set_blocking(stream.fileno(), False)
+            with self.lock:
+                self.buffers[stream.fileno()] = b''
+                self.selector.register(stream, selectors.EVENT_READ, name)
+    
+    def _read_loop(self):
+        while not self.closed:
+            with self.lock:
+                registered = bool(self.selector.get_map())
+            if not registered:
+                time.sleep(0.1)
+                continue
+            for key, _ in self.selector.select(timeout=0.5):
+                self._drain(key)
+    
+    def _drain(self, key):
+        fd = key.fileobj.fileno()
+        try:
+            data = os.read(fd, LOG_READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            # Only complete lines are queued; the tail waits for the next read
+            data = self.buffers[fd] + data
+            end = data.rfind(b'\n') + 1
+            if end == 0 and len(data) < LOG_READ_SIZE:
+                self.buffers[fd] = data
+                return
+            if end == 0:
+                end = len(data)  # never let an unterminated line grow unbounded
+            self.buffers[fd] = data[end:]
+            self._enqueue(key.data, data[:end])
+            return
+        with self.lock:
+            self.selector.unregister(key.fileobj)
+            rest = self.buffers.pop(fd, b'')
+        if rest:
+            self._enqueue(key.data, rest)
+        key.fileobj.close()
+    
+    def _enqueue(self, service, chunk):
+        try:
+            self.queue.put_nowait((time.time(), service, chunk))
+        except queue.Full:
+            self.dropped += 1
+    
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            created, service, chunk = item
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+            prefix = f'{stamp},{int(created % 1 * 1000):03d} [{service}] '
+            lines = [
+                line.rstrip('\r')
+                for line in chunk.decode('utf-8', errors='replace').split('\n')
+                if line.strip()
+            ]
+            if not lines:
+                continue
+            self.file_handlers[service].handle(
+                logging.makeLogRecord({'msg': '\n'.join(prefix + line for line in lines)})
+            )
+            if self.console_level is not None:
+                shown = [line for line in lines if line_level(line) >= self.console_level]
+                if shown:
+                    self.console.handle(
+                        logging.makeLogRecord({'msg': '\n'.join(prefix + line for line in shown)})
+                    )
+    
+    def close(self, timeout=2):
+        """Flush what the stopped services wrote, then stop the threads"""
+        if self.closed:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.selector.get_map():
+                    break
+            time.sleep(0.05)
+        self.closed = True
+        self.reader.join(timeout=1)
+        self.queue.put(None)
+        self.writer.join(timeout=5)
+        for file_handler in self.file_handlers.values():
+            file_handler.close()
+        if self.dropped:
+            print(f"Warning: dropped {self.dropped} chunks of service output (log writer fell behind)")
+
+def line_level(text):
+    """Best-effort log level of a line of service output"""
+    head = text[:200]
+    if 'Traceback' in head or 'ERROR' in head or 'CRITICAL' in head:
+        return logging.ERROR
+    if 'WARNING' in head:
+        return logging.WARNING
+    return logging.INFO
 
-def start_service(service):
+def installed(module):
+    """True if an optional server package is importable"""
+    return importlib.util.find_spec(module) is not None
+
+def build_command(service, options):
+    """Command line for a service in the selected mode"""
+    port = str(service['port'])
+    if not options.prod:
+        return [sys.executable, 'manage.py', 'runserver', port]
+    
+    server = options.server
+    if server is None:
+        if service['asgi'] and installed('uvicorn'):
+            server = 'uvicorn'
+        elif installed('gunicorn'):
+            server = 'gunicorn'
+        elif installed('uvicorn'):
+            server = 'uvicorn'
+        else:
+            sys.exit("--prod needs gunicorn or uvicorn: pip install gunicorn uvicorn")
+    if not installed(server):
+        sys.exit(f"--server {server} is not installed: pip install {server}")
+    
+    workers = str(options.workers)
+    if server == 'uvicorn':
+        return [
+            sys.executable, '-m', 'uvicorn', f"{service['module']}.asgi:application",
+            '--host', options.host, '--port', port, '--workers', workers,
+        ]
+    app = 'asgi' if service['asgi'] and installed('uvicorn') else 'wsgi'
+    command = [
+        sys.executable, '-m', 'gunicorn', f"{service['module']}.{app}:application",
+        '--bind', f'{options.host}:{port}', '--workers', workers,
+    ]
+    if app == 'asgi':
+        command += ['--worker-class', 'uvicorn.workers.UvicornWorker']
+    return command
+
+def start_service(service, options):
     """Start a single service"""
     print(f"Starting {service['name']} on port {service['port']}...")
     
-    os.chdir(service['path'])
-    
     process = subprocess.Popen(
-        [sys.executable, 'manage.py', 'runserver', str(service['port'])],
+        build_command(service, options),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         cwd=service['path']
     )
+    log_mux.add(service, process)
     
     return {
         'name': service['name'],
+        'service': service,
         'process': process,
-        'port': service['port']
+        'port': service['port'],
+        'started_at': time.monotonic(),
+        'restarts': 0,
+        'backoff': RESTART_BACKOFF,
+        'restart_at': None,
     }
 
+def is_ready(port):
+    """HTTP readiness probe: any non-5xx answer means the service is serving"""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}{READY_PATH}', timeout=1) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+def wait_until_ready(items, timeout):
+    """Poll every service until it is ready; returns the names that never became ready"""
+    pending = {item['name']: item for item in items}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for name, item in list(pending.items()):
+            if item['process'].poll() is not None:
+                print(f"✗ {name} exited with code {item['process'].returncode} during startup")
+                del pending[name]
+            elif is_ready(item['port']):
+                print(f"✓ {name} is ready")
+                del pending[name]
+        time.sleep(0.2)
+    for name in pending:
+        print(f"✗ {name} did not become ready within {timeout}s")
+    return list(pending)
+
+def supervise(item, options):
+    """Restart a crashed service with exponential backoff (prod mode)"""
+    now = time.monotonic()
+    if item['restart_at'] is None:
+        code = item['process'].returncode
+        if now - item['started_at'] >= STABLE_SECONDS:
+            item['backoff'] = RESTART_BACKOFF
+        item['restart_at'] = now + item['backoff']
+        print(f"Warning: {item['name']} exited with code {code}; restarting in {item['backoff']}s")
+        item['backoff'] = min(item['backoff'] * 2, RESTART_BACKOFF_MAX)
+    elif now >= item['restart_at']:
+        restarted = start_service(item['service'], options)
+        item.update(
+            process=restarted['process'],
+            started_at=restarted['started_at'],
+            restarts=item['restarts'] + 1,
+            restart_at=None,
+        )
+
 def stop_all_services():
-    """Stop all running services"""
+    """Stop all running services (only the first call does anything)"""
+    global stopping
+    if stopping:
+        return
+    stopping = True
     print("\nStopping all services...")
     for item in processes:
-        try:
+        if item['process'].poll() is None:
             item['process'].terminate()
+    for item in processes:
+        try:
             item['process'].wait(timeout=5)
             print(f"✓ Stopped {item['name']}")
         except subprocess.TimeoutExpired:
@@ -66,16 +346,56 @@ def stop_all_services():
             print(f"✓ Killed {item['name']}")
         except Exception as e:
             print(f"✗ Error stopping {item['name']}: {e}")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    log_mux.close()
 
 def signal_handler(sig, frame):
-    """Handle Ctrl+C"""
+    """Handle Ctrl+C / SIGTERM: stop the services, then exit"""
+    if stopping:
+        return  # already shutting down; let that finish
     stop_all_services()
     sys.exit(0)
 
+def create_metrics_dir():
+    """Fresh METRICS_DIR for this run, so its workers never merge an older run's snapshots
+    
+    Created inside ``$METRICS_DIR`` when set, else in the temp directory;
+    the services inherit it through the environment.
+    """
+    path = tempfile.mkdtemp(prefix='bookstore-metrics-', dir=os.environ.get('METRICS_DIR') or None)
+    os.environ['METRICS_DIR'] = path
+    return path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Start all bookstore microservices')
+    parser.add_argument('--prod', action='store_true',
+                        help='Run under gunicorn/uvicorn with several workers and restart crashed services')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='Worker processes per service in --prod mode (default: CPU count)')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default=None,
+                        help='Server for --prod (default: uvicorn for ASGI services, else gunicorn)')
+    parser.add_argument('--host', default='0.0.0.0', help='Bind address in --prod mode')
+    parser.add_argument('--ready-timeout', type=float, default=READY_TIMEOUT,
+                        help='Seconds to wait for readiness probes')
+    parser.add_argument('--log-dir', default=str(LOG_DIR), help='Directory for per-service log files')
+    parser.add_argument('--log-max-bytes', type=int, default=LOG_MAX_BYTES,
+                        help='Rotate a service log file at this size')
+    parser.add_argument('--log-backups', type=int, default=LOG_BACKUPS,
+                        help='Rotated log files kept per service')
+    parser.add_argument('--console-level', default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'NONE'],
+                        help='Lowest level of service output mirrored to the console')
+    return parser.parse_args()
+
 def main():
     """Main function"""
+    global log_mux, metrics_dir
+    options = parse_args()
+    console_level = None if options.console_level == 'NONE' else getattr(logging, options.console_level)
+    log_mux = LogMultiplexer(options.log_dir, console_level, options.log_max_bytes, options.log_backups)
     print("=" * 50)
-    print("Starting Bookstore Microservices")
+    print("Starting Bookstore Microservices" + (" (production mode)" if options.prod else ""))
     print("=" * 50)
     print()
     
@@ -83,15 +403,22 @@ def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    # Start all services
+    if options.prod:
+        # Several workers per service: /metrics merges their snapshot files
+        metrics_dir = create_metrics_dir()
+        print(f"Metrics snapshots: {metrics_dir}")
+    
+    # Start all services at once, then wait until they answer HTTP requests
     for service in SERVICES:
-        item = start_service(service)
-        processes.append(item)
-        time.sleep(2)  # Wait between starts
+        processes.append(start_service(service, options))
+    not_ready = wait_until_ready(processes, options.ready_timeout)
     
     print()
     print("=" * 50)
-    print("All services started!")
+    if not_ready:
+        print(f"Started with problems: {', '.join(not_ready)}")
+    else:
+        print("All services started!")
     print("=" * 50)
     print()
     print("Service URLs:")
@@ -115,7 +442,11 @@ def main():
             # Check if any process has died
             for item in processes:
                 if item['process'].poll() is not None:
-                    print(f"Warning: {item['name']} has stopped!")
+                    if options.prod:
+                        supervise(item, options)
+                    elif not item.get('reported'):
+                        print(f"Warning: {item['name']} has stopped!")
+                        item['reported'] = True
             time.sleep(1)
     except KeyboardInterrupt:
         pass
@@ -123,4 +454,4 @@ def main():
         stop_all_services()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()